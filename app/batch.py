@@ -0,0 +1,259 @@
+# app/batch.py - Batch explanations for a whole syllabus
+"""
+Run ContextualTutorAgent.explain_concept for every (concept x profile) pair ahead of class.
+
+Usage:
+    python app/batch.py --concepts syllabus.csv --profiles app/core/data/sample_profiles.json \\
+        --out explanations.jsonl --concurrency 4 --rate 30
+
+Inputs:
+    --concepts  JSONL ({"concept": ..., "language": ...}), CSV with a `concept` column
+                (optional `language`), or plain text with one concept per line.
+    --profiles  JSON array (sample_profiles.json format), JSONL or CSV
+                (name, age_group, role, interests). Omit for a single generic profile.
+
+Results are appended to --out as JSONL, one line per job, flushed as they finish.
+The output file doubles as the checkpoint: re-running the same command skips jobs
+already written successfully, so an interrupted run resumes where it stopped.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except:
+    pass
+
+from core.tutor import ContextualTutorAgent
+
+
+# ---------- input parsing ----------
+
+def _read_records(path: Path) -> List[Dict]:
+    """Load a JSON array, JSONL, CSV or one-value-per-line text file into dicts."""
+    text = path.read_text(encoding="utf-8-sig")
+    suffix = path.suffix.lower()
+    if suffix == ".csv":
+        return [dict(row) for row in csv.DictReader(text.splitlines())]
+    if suffix == ".json":
+        data = json.loads(text)
+        return data if isinstance(data, list) else [data]
+    records = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("{"):
+            records.append(json.loads(line))
+        else:
+            records.append({"concept": line})
+    return records
+
+def load_concepts(path: Path, default_lang: str) -> List[Dict]:
+    concepts = []
+    for rec in _read_records(path):
+        concept = (rec.get("concept") or "").strip()
+        if concept:
+            concepts.append({"concept": concept, "language": (rec.get("language") or default_lang).strip()})
+    return concepts
+
+def load_profiles(path: Optional[Path]) -> List[Dict]:
+    if path is None:
+        return [{}]
+    keep = ("name", "age_group", "role", "interests")
+    profiles = [{k: v for k, v in rec.items() if k in keep and v} for rec in _read_records(path)]
+    return profiles or [{}]
+
+def job_id(concept: str, profile: Dict, language: str) -> str:
+    key = json.dumps([concept, profile, language], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+def iter_jobs(concepts: List[Dict], profiles: List[Dict]) -> Iterator[Dict]:
+    for c in concepts:
+        for p in profiles:
+            yield {"id": job_id(c["concept"], p, c["language"]), "concept": c["concept"],
+                   "profile": p, "language": c["language"]}
+
+
+# ---------- checkpoint / output ----------
+
+def completed_job_ids(out_path: Path) -> set:
+    """Job ids already written without error (the output file is the checkpoint)."""
+    done = set()
+    if not out_path.exists():
+        return done
+    with open(out_path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue  # partially written line from an interrupted run
+            if rec.get("job_id") and not rec.get("error"):
+                done.add(rec["job_id"])
+    return done
+
+class ResultWriter:
+    def __init__(self, out_path: Path):
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = open(out_path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self._fh.write(line + "\n")
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+
+    def close(self):
+        self._fh.close()
+
+
+# ---------- rate limiting ----------
+
+class RateLimiter:
+    """Start at most `per_minute` jobs per minute (evenly spaced); 0 disables."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+# ---------- runner ----------
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def run_batch(jobs: List[Dict], writer: ResultWriter, concurrency: int, limiter: RateLimiter,
+              use_web: bool, deadline: Optional[float], use_cache: bool = False) -> Dict:
+    agent = ContextualTutorAgent()
+    latencies: List[float] = []
+    stats = {"ok": 0, "failed": 0}
+
+    def run_one(job: Dict) -> Dict:
+        limiter.acquire()
+        started = time.monotonic()
+        record = {"job_id": job["id"], "concept": job["concept"], "profile": job["profile"],
+                  "language": job["language"]}
+        try:
+            result = agent.explain_concept(job["concept"], profile=job["profile"], use_web=use_web,
+                                           target_lang=job["language"], use_cache=use_cache,
+                                           deadline=deadline)
+            record["result"] = result
+            synthesis = next((s for s in result.get("steps", []) if s["step"] == "synthesis"), {})
+            if result.get("error"):
+                record["error"] = result["error"]
+            elif not result.get("cached") and synthesis.get("status") != "success":
+                record["error"] = f"synthesis {synthesis.get('status', 'not run')}: {synthesis.get('error', '')}"
+        except Exception as e:
+            record["error"] = str(e)[:200]
+        record["latency_ms"] = int((time.monotonic() - started) * 1000)
+        return record
+
+    started = time.monotonic()
+    queue = iter(jobs)
+    running = set()
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+    try:
+        while True:
+            # keep at most `concurrency` jobs in flight so interrupts lose little work
+            while len(running) < concurrency:
+                job = next(queue, None)
+                if job is None:
+                    break
+                running.add(pool.submit(run_one, job))
+            if not running:
+                break
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                record = fut.result()
+                writer.write(record)
+                latencies.append(record["latency_ms"] / 1000)
+                stats["failed" if record.get("error") else "ok"] += 1
+                done = stats["ok"] + stats["failed"]
+                status = "ERR" if record.get("error") else "ok "
+                print(f"[{done}/{len(jobs)}] {status} {record['latency_ms']:>6} ms  {record['concept'][:60]}",
+                      flush=True)
+    except KeyboardInterrupt:
+        print("\nInterrupted - unfinished jobs were not saved; re-run the same command to resume.",
+              file=sys.stderr)
+        stats["interrupted"] = True
+    finally:
+        pool.shutdown(wait=not stats.get("interrupted"), cancel_futures=True)
+
+    elapsed = time.monotonic() - started
+    done = stats["ok"] + stats["failed"]
+    stats.update({
+        "elapsed_s": round(elapsed, 2),
+        "jobs_per_min": round(done / elapsed * 60, 2) if elapsed else 0.0,
+        "p50_s": round(_percentile(latencies, 50), 2),
+        "p95_s": round(_percentile(latencies, 95), 2),
+        "max_s": round(max(latencies), 2) if latencies else 0.0,
+    })
+    return stats
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Batch explanations for concepts x profiles")
+    parser.add_argument("--concepts", required=True, type=Path, help="JSONL/CSV/TXT file of concepts")
+    parser.add_argument("--profiles", type=Path, help="JSON/JSONL/CSV file of profiles")
+    parser.add_argument("--out", required=True, type=Path, help="output JSONL (also the resume checkpoint)")
+    parser.add_argument("--concurrency", type=int, default=4, help="jobs in flight at once (default 4)")
+    parser.add_argument("--rate", type=float, default=0, help="max jobs started per minute (0 = unlimited)")
+    parser.add_argument("--language", default="English", help="default language when a concept has none")
+    parser.add_argument("--no-web", action="store_true", help="skip web search")
+    parser.add_argument("--deadline", type=float, help="per-explanation deadline in seconds")
+    parser.add_argument("--use-cache", action="store_true", help="reuse near-duplicate past answers")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and truncate --out")
+    args = parser.parse_args(argv)
+
+    if args.restart and args.out.exists():
+        args.out.unlink()
+
+    jobs = list(iter_jobs(load_concepts(args.concepts, args.language), load_profiles(args.profiles)))
+    done_ids = completed_job_ids(args.out)
+    todo = [j for j in jobs if j["id"] not in done_ids]
+    print(f"{len(jobs)} jobs, {len(jobs) - len(todo)} already done, {len(todo)} to run "
+          f"(concurrency={args.concurrency}, rate={args.rate or 'unlimited'}/min)")
+    if not todo:
+        return 0
+
+    writer = ResultWriter(args.out)
+    try:
+        stats = run_batch(todo, writer, max(1, args.concurrency), RateLimiter(args.rate),
+                          use_web=not args.no_web, deadline=args.deadline, use_cache=args.use_cache)
+    finally:
+        writer.close()
+
+    print(f"\nDone: {stats['ok']} ok, {stats['failed']} failed in {stats['elapsed_s']}s "
+          f"({stats['jobs_per_min']} jobs/min) | latency p50 {stats['p50_s']}s, "
+          f"p95 {stats['p95_s']}s, max {stats['max_s']}s")
+    return 1 if stats.get("interrupted") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,13 +15,14 @@ to be robust across langchain/openai wrappers.
 """
 from typing import List, Optional
 from core.llm_client import get_llm
+from core.tools.analogy_tool import generate_analogy_set, merge_analogies
 import json
-import textwrap
 
 # Helper to call the LLM in a few possible ways (robust wrapper)
-def _call_llm(llm, prompt: str, max_retries: int = 2) -> str:
+def _call_llm(llm, prompt: str, max_retries: int = 2, **kwargs) -> str:
     """
     Call the llm with different APIs depending on what's available.
+    kwargs (e.g. max_tokens, timeout) are passed to invoke / __call__.
     Returns plain text result.
     """
     last_exc = None
@@ -29,14 +30,14 @@ def _call_llm(llm, prompt: str, max_retries: int = 2) -> str:
         try:
             # preferred: llm.invoke(prompt)
             if hasattr(llm, "invoke"):
-                out = llm.invoke(prompt)
+                out = llm.invoke(prompt, **kwargs)
                 # some wrappers return object with .content
                 return getattr(out, "content", str(out)).strip()
         except Exception as e:
             last_exc = e
         try:
             # next: llm(prompt)
-            out = llm(prompt)
+            out = llm(prompt, **kwargs)
             return getattr(out, "content", str(out)).strip()
         except Exception as e:
             last_exc = e
@@ -60,7 +61,7 @@ def decompose_concept(concept: str, max_atoms: int = 5) -> List[str]:
     Use the LLM to return a short list of atomic sub-concepts (strings).
     Returns a python list of strings.
     """
-    llm = get_llm(temperature=0.0)
+    llm = get_llm(temperature=0.0, step="decomposition")
     prompt = f"""You are a helpful tutor. Break this concept into {max_atoms} short, atomic ideas
 (bulleted, each 4-8 words). Return only a JSON array of strings.
 
@@ -103,42 +104,17 @@ Concept:
 def generate_analogies(concept: str, atoms: List[str], profile: Optional[dict] = None) -> str:
     """
     Generate a set of analogies tailored to the profile.
+    The Story, Visual and Practical analogies are separate concurrent (and separately
+    cached) calls, see core/tools/analogy_tool.py.
     Returns human-readable multi-paragraph string.
     """
-    llm = get_llm(temperature=0.6)
-    profile_text = ""
-    if profile:
-        # keep profile short
-        profile_text = json.dumps(profile, ensure_ascii=False)
-    atom_list_text = "\n".join(f"- {a}" for a in atoms) if atoms else "N/A"
-
-    prompt = textwrap.dedent(
-        f"""
-        You are a creative tutor. Produce 3 analogies for the following concept.
-        Use the user's profile to tailor tone and examples.
-
-        Profile: {profile_text}
-        Concept: {concept.strip()}
-        Key idea atoms:
-        {atom_list_text}
-
-        Produce EXACTLY three labeled analogies: 1) Story analogy (2-4 sentences),
-        2) Visual analogy (2-4 sentences), 3) Hobby analogy (2-4 sentences).
-        After each analogy, include a one-line "mapping" that explains which part of the concept
-        maps to which element of the analogy.
-
-        Output format (plain text):
-        Analogy 1: ...
-        Mapping 1: ...
-        Analogy 2: ...
-        Mapping 2: ...
-        Analogy 3: ...
-        Mapping 3: ...
-        """
-    ).strip()
-
-    out = _call_llm(llm, prompt)
-    return out
+    llm = get_llm(temperature=0.6, step="analogies")
+    parts = generate_analogy_set(concept, atoms, profile, complete=lambda prompt, max_tokens, timeout: _call_llm(
+        llm, prompt, max_tokens=max_tokens, timeout=timeout))
+    errors = [p for p in parts.values() if isinstance(p, Exception)]
+    if len(errors) == len(parts):
+        raise errors[0]
+    return merge_analogies(parts)
 
 
 def run_agent(concept: str, profile: Optional[dict] = None) -> str:
@@ -1,37 +1,115 @@
 # app/core/analogy_agent_langchain.py
 """
 Minimal LangChain agent integration with a web-search tool.
-Requires: langchain, and either serpapi (SERPAPI_API_KEY) OR duckduckgo-search package.
+Requires: langchain (langchain-classic on LangChain >= 1.0), and either serpapi
+(SERPAPI_API_KEY) OR duckduckgo-search package.
 
 This file provides `run_langchain_agent(prompt, profile)` -> str
+
+The agent, its LLM and its Search tool are built once per process and shared by
+every run. The LLM is core/llm_client (model routing, rate limits, usage) and
+Search is core/web_search; search results are memoised per normalised query in
+response_cache ("agent_search"), so a query the ReAct loop repeats - in the same
+run or a later one - is answered without another search.
+
+Each run stops after AGENT_MAX_STEPS tool steps or AGENT_MAX_SECONDS, whichever
+comes first, and then writes its answer from what it has found so far.
+
+Config (env):
+    AGENT_MAX_STEPS     ReAct steps per run (default 5)
+    AGENT_MAX_SECONDS   time per run (default 60)
 """
 
+import contextvars
+import functools
 import os
-def run_langchain_agent(prompt_text: str, profile=None) -> str:
+from typing import List, Optional
+
+from core.llm_client import _chat_complete
+from core.pipeline import Deadline
+from core.response_cache import response_cache
+from core.usage import usage_scope
+from core.web_search import web_search_snippets
+
+MAX_STEPS = int(os.environ.get("AGENT_MAX_STEPS", "5"))
+MAX_SECONDS = float(os.environ.get("AGENT_MAX_SECONDS", "60"))
+MIN_CALL_SECONDS = 5.0    # the final answer gets at least this long, even past the deadline
+SEARCH_TIMEOUT = 10.0
+NUM_RESULTS = 5
+
+# deadline of the run on this thread; the shared LLM and Search tool read it
+_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("agent_deadline", default=None)
+
+
+def _remaining(cap: Optional[float] = None) -> Optional[float]:
+    deadline = _deadline.get()
+    remaining = deadline.remaining() if deadline is not None else None
+    if remaining is None:
+        return cap
+    remaining = max(MIN_CALL_SECONDS, remaining)
+    return min(remaining, cap) if cap else remaining
+
+
+def search(query: str) -> str:
+    """Search tool: snippets for `query`, memoised per normalised query."""
+    def run():
+        results = web_search_snippets(query, num_results=NUM_RESULTS, timeout=_remaining(SEARCH_TIMEOUT))
+        return "\n".join(f"{r.get('title', '')}: {r.get('snippet', '')} ({r.get('link', '')})" for r in results)
+    key = " ".join(query.lower().split())
+    return response_cache.get_or_compute("agent_search", [key, NUM_RESULTS], run, cacheable=bool) or "No results found."
+
+
+def _truncate(text: str, stop: Optional[List[str]]) -> str:
+    """Cut at the first stop sequence (the ReAct prompt stops before "Observation:")."""
+    for s in stop or []:
+        if s in text:
+            text = text[:text.index(s)]
+    return text
+
+
+@functools.lru_cache(maxsize=1)
+def _agent():
+    """The process-wide agent executor (built on first use)."""
     try:
         from langchain.agents import initialize_agent, Tool
-        from langchain.llms import OpenAI
-        use_serp = bool(os.environ.get("SERPAPI_API_KEY"))
-        tools = []
-        if use_serp:
-            from langchain.tools import SerpAPIWrapper
-            serp = SerpAPIWrapper()
-            tools.append(Tool(name="Search", func=serp.run, description="Use for web search"))
-        else:
-            # fallback duckduckgo
-            from langchain.utilities import DuckDuckGoSearchAPIWrapper
-            ddg = DuckDuckGoSearchAPIWrapper()
-            tools.append(Tool(name="Search", func=ddg.run, description="Use for web search (DuckDuckGo)"))
-        # LLM for LangChain: use OpenAI (must have OPENAI_API_KEY)
-        llm = OpenAI(temperature=0.2)
-        agent = initialize_agent(tools, llm, agent="zero-shot-react-description", verbose=False)
+    except ImportError:
+        from langchain_classic.agents import initialize_agent  # LangChain >= 1.0
+        from langchain_core.tools import Tool
+    from langchain_core.language_models.llms import LLM
+
+    class TutorLLM(LLM):
+        """core/llm_client as a LangChain LLM; each call is bounded by the run's deadline."""
+        temperature: float = 0.2
+
+        @property
+        def _llm_type(self) -> str:
+            return "contextual-tutor"
+
+        def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> str:
+            text = _chat_complete(prompt, temperature=self.temperature, max_tokens=600,
+                                  timeout=_remaining(), step="agent")
+            return _truncate(text, stop)
+
+    tools = [Tool(name="Search", func=search, description="Use for web search")]
+    return initialize_agent(tools, TutorLLM(), agent="zero-shot-react-description", verbose=False,
+                            max_iterations=MAX_STEPS, max_execution_time=MAX_SECONDS,
+                            early_stopping_method="generate", handle_parsing_errors=True)
+
+
+def run_langchain_agent(prompt_text: str, profile=None) -> str:
+    token = _deadline.set(Deadline(MAX_SECONDS))
+    try:
+        agent = _agent()
         # build a task prompt including profile
         prof_text = ""
         if profile:
             prof_text = f"Profile: {profile}\n"
         query = f"{prof_text}Please provide an explain-by-analogy write-up for: {prompt_text}\nAlso return sources and a short confidence estimate."
-        result = agent.run(query)
-        return result
+        with usage_scope(step="agent"):
+            result = agent.invoke({"input": query})
+        return result["output"]
     except Exception as e:
         # fallback: return error so UI shows fallback
         return f"(LangChain agent error: {e})"
+    finally:
+        _deadline.reset(token)
@@ -0,0 +1,225 @@
+# app/core/conversation.py
+"""
+Bounded chat memory for one tutoring session.
+
+The last WINDOW_TURNS turns are kept verbatim; they are what the chat renders on
+every rerun. Older messages are appended to an on-disk archive, which is read only
+when the user asks to see them. They are also folded into a rolling summary that
+stays within SUMMARY_TOKEN_BUDGET: one line per turn, compressed by the LLM in the
+background when it overflows, or trimmed from the oldest end without a key.
+Per-session memory and rerun cost stay constant however long the session runs.
+
+context() gives the model the summary plus the recent turns, so follow-up
+questions ("why is it ...?") keep the thread of the conversation.
+
+Usage:
+    memory = ConversationMemory()
+    if is_follow_up(question):
+        result = agent.explain_concept(question, conversation=memory.context())
+    memory.add("user", question)
+    memory.add("assistant", markdown, gist=result.get("explanation"))
+
+Config (env):
+    CHAT_WINDOW_TURNS     turns kept verbatim (default 4)
+    CHAT_SUMMARY_TOKENS   token budget for the rolling summary (default 300)
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from core.storage import STORAGE_DIR
+
+WINDOW_TURNS = int(os.environ.get("CHAT_WINDOW_TURNS", "4"))
+SUMMARY_TOKEN_BUDGET = int(os.environ.get("CHAT_SUMMARY_TOKENS", "300"))
+BRIEF_CHARS = 240
+ARCHIVE_DIR = STORAGE_DIR / "chat_archive"
+ARCHIVE_MAX_AGE_DAYS = 7
+
+# Short questions that point back at the conversation rather than name a topic
+_REFERENCES = {"it", "its", "this", "that", "these", "those", "they", "them", "their",
+               "he", "she", "more", "again", "above", "previous", "example", "examples", "else"}
+FOLLOW_UP_MAX_WORDS = 10
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) - good enough for budgeting."""
+    return (len(text or "") + 3) // 4
+
+def brief(text: str, limit: int = BRIEF_CHARS) -> str:
+    """First sentence(s) of an answer as plain text, for summaries and model context."""
+    plain = " ".join(re.sub(r"[*_#`>\[\]|]", "", text or "").split())
+    if len(plain) <= limit:
+        return plain
+    cut = plain[:limit]
+    end = cut.rfind(". ")
+    return cut[:end + 1] if end > limit // 2 else cut.rstrip() + "…"
+
+def is_follow_up(question: str) -> bool:
+    """Whether a question only makes sense with the earlier turns (e.g. "how is it measured?")."""
+    words = re.findall(r"[a-z']+", (question or "").lower())
+    return 0 < len(words) <= FOLLOW_UP_MAX_WORDS and any(w in _REFERENCES for w in words)
+
+def llm_summarizer(text: str, max_tokens: int) -> Optional[str]:
+    """Compress the rolling summary with the LLM; None without an API key."""
+    from core.llm_client import OPENAI_API_KEY, _chat_complete
+    if not OPENAI_API_KEY:
+        return None
+    prompt = (f"Condense these notes about an ongoing tutoring conversation into at most "
+              f"{int(max_tokens * 0.75)} words. Keep the topics covered and what the learner "
+              f"struggled with or asked about.\n\n{text}")
+    return _chat_complete(prompt, temperature=0.2, max_tokens=max_tokens, timeout=20, step="chat_summary")
+
+def prune_archives(max_age_days: float = ARCHIVE_MAX_AGE_DAYS, archive_dir: Path = ARCHIVE_DIR) -> int:
+    """Delete archives of sessions untouched for max_age_days. Returns how many were removed."""
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for path in archive_dir.glob("*.jsonl"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+class ConversationMemory:
+    def __init__(self, session_id: Optional[str] = None, window_turns: int = WINDOW_TURNS,
+                 summary_tokens: int = SUMMARY_TOKEN_BUDGET,
+                 summarizer: Optional[Callable[[str, int], Optional[str]]] = llm_summarizer,
+                 archive_dir: Path = ARCHIVE_DIR):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.window_turns = window_turns
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer
+        self.archive_path = archive_dir / f"{self.session_id}.jsonl"
+        self.messages: List[Dict] = []
+        self.archived = 0
+        self._summary = ""          # compressed prose for the oldest turns
+        self._lines: List[str] = []  # one line per turn not yet compressed
+        self._compressing = False
+        self._lock = threading.Lock()
+
+    # ----- adding / evicting -----
+
+    def add(self, role: str, content: str, gist: Optional[str] = None):
+        """Append a message; `gist` is the plain text to remember an assistant answer by."""
+        msg = {"role": role, "content": content}
+        if role == "assistant":
+            msg["brief"] = brief(gist or content)
+        self.messages.append(msg)
+        keep = self.window_turns * 2
+        # evict at the end of a turn so a question and its answer leave together
+        if role == "assistant" and len(self.messages) > keep:
+            old, self.messages = self.messages[:-keep], self.messages[-keep:]
+            self._archive(old)
+            self._fold(old)
+
+    def _archive(self, old: List[Dict]):
+        try:
+            self.archive_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.archive_path, "a", encoding="utf-8") as fh:
+                for msg in old:
+                    fh.write(json.dumps(msg, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print("Chat archive error:", e)
+        self.archived += len(old)
+
+    def _fold(self, old: List[Dict]):
+        lines, question = [], None
+        for msg in old:
+            if msg["role"] == "user":
+                if question:
+                    lines.append(f"- Asked: {question}")
+                question = brief(msg["content"], 120)
+            else:
+                lines.append(f"- Asked: {question} -> {msg.get('brief', '')}" if question
+                             else f"- Tutor: {msg.get('brief', '')}")
+                question = None
+        if question:
+            lines.append(f"- Asked: {question}")
+        with self._lock:
+            self._lines.extend(lines)
+            over = estimate_tokens(self._summary_text()) > self.summary_tokens
+            start = over and self.summarizer is not None and not self._compressing
+            if start:
+                self._compressing = True
+            elif over and not self._compressing:
+                self._trim()
+        if start:
+            threading.Thread(target=self._compress, name="chat-summary", daemon=True).start()
+
+    def _compress(self):
+        with self._lock:
+            text, folded = self._summary_text(), len(self._lines)
+        try:
+            condensed = self.summarizer(text, self.summary_tokens)
+        except Exception as e:
+            print("Chat summary error:", e)
+            condensed = None
+        with self._lock:
+            if condensed:
+                self._summary = condensed.strip()
+                del self._lines[:folded]
+            self._trim()
+            self._compressing = False
+
+    def _trim(self):
+        """Hard cap, oldest content first: the compressed summary, then the oldest lines (lock held)."""
+        while self._lines and estimate_tokens(self._summary_text()) > self.summary_tokens:
+            if self._summary:
+                self._summary = ""
+            else:
+                self._lines.pop(0)
+        if estimate_tokens(self._summary) > self.summary_tokens:
+            self._summary = "…" + self._summary[-self.summary_tokens * 4:]
+
+    def _summary_text(self) -> str:
+        return "\n".join(([self._summary] if self._summary else []) + self._lines)
+
+    # ----- reading -----
+
+    @property
+    def summary(self) -> str:
+        with self._lock:
+            return self._summary_text()
+
+    def visible(self) -> List[Dict]:
+        return list(self.messages)
+
+    def load_archive(self) -> List[Dict]:
+        """Messages that left the window, oldest first (read from disk on demand)."""
+        try:
+            with open(self.archive_path, "r", encoding="utf-8") as fh:
+                return [json.loads(line) for line in fh if line.strip()]
+        except (OSError, ValueError):
+            return []
+
+    def context(self, max_tokens: Optional[int] = None) -> str:
+        """Summary + recent turns as prompt text ("" for a fresh conversation)."""
+        parts = []
+        summary = self.summary
+        if summary:
+            parts.append("Earlier in this conversation:\n" + summary)
+        recent = [f"Student: {brief(m['content'], 200)}" if m["role"] == "user" else f"Tutor: {m.get('brief', '')}"
+                  for m in self.messages]
+        if recent:
+            parts.append("Recent turns:\n" + "\n".join(recent))
+        text = "\n\n".join(parts)
+        if max_tokens and estimate_tokens(text) > max_tokens:
+            text = "…" + text[-max_tokens * 4:]
+        return text
+
+    def clear(self):
+        with self._lock:
+            self.messages, self._lines, self._summary, self.archived = [], [], "", 0
+        try:
+            self.archive_path.unlink()
+        except OSError:
+            pass
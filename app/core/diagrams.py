@@ -0,0 +1,201 @@
+# app/core/diagrams.py
+"""
+Diagram generation as background jobs, backed by an on-disk image cache.
+
+Images are stored under storage/images/<sha256 of (concept, size, style)>.png, so a
+repeat request for the same diagram is served from disk without calling the
+Images API, and the file never expires the way DALL-E URLs do.
+
+Usage:
+    from core.diagrams import diagram_jobs
+    job_id = diagram_jobs.submit("MOSFET", size="1024x1024", style="infographic")
+    job = diagram_jobs.status(job_id)   # {"status": "queued"|"running"|"done"|"error", "path", ...}
+
+The job id is the cache key, so submitting the same (concept, size, style) while it
+is being generated joins the running job instead of starting a second one.
+
+Config (env):
+    DIAGRAM_WORKERS        concurrent generations (default 2)
+    IMAGE_CACHE_MAX_MB     cache size before the least recently used images go (default 200)
+"""
+
+import base64
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from core.ratelimit import api_limiter
+from core.routing import ENDPOINTS, model_router
+from core.storage import STORAGE_DIR
+from core.usage import usage_ledger
+
+IMAGE_DIR = STORAGE_DIR / "images"
+MAX_CACHE_BYTES = int(float(os.environ.get("IMAGE_CACHE_MAX_MB", "200")) * 1024 * 1024)
+WORKERS = int(os.environ.get("DIAGRAM_WORKERS", "2"))
+MAX_JOBS = 256
+
+DIAGRAM_STYLES = {
+    "infographic": "Educational infographic explaining '{concept}'. Modern, clean design with diagrams, "
+                   "labels, and icons. Professional style.",
+    "sketch": "Hand-drawn whiteboard sketch explaining '{concept}', simple shapes, arrows and short labels.",
+    "flowchart": "Clear flowchart showing how '{concept}' works step by step, labelled boxes and arrows, "
+                 "flat colours.",
+}
+
+
+def image_key(concept: str, size: str, style: str) -> str:
+    raw = json.dumps([" ".join(concept.lower().split()), size, style])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ImageCache:
+    """PNG files named by key; least recently used files are evicted past max_bytes."""
+
+    def __init__(self, directory: Path = IMAGE_DIR, max_bytes: int = MAX_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.png"
+
+    def get(self, key: str) -> Optional[Path]:
+        path = self.path(key)
+        try:
+            os.utime(path)  # mark as recently used
+            return path
+        except OSError:
+            return None
+
+    def put(self, key: str, data: bytes) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        self._evict()
+        return path
+
+    def _evict(self):
+        with self._lock:
+            files = []
+            for p in self.directory.glob("*.png"):
+                try:
+                    st = p.stat()
+                    files.append((st.st_mtime, st.st_size, p))
+                except OSError:
+                    pass
+            total = sum(size for _, size, _ in files)
+            for _, size, p in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    p.unlink()
+                    total -= size
+                except OSError:
+                    pass
+
+
+def render_diagram(concept: str, size: str = "1024x1024", style: str = "infographic") -> bytes:
+    """PNG bytes from the Images API (raises without a key or on API errors)."""
+    from core.llm_client import OPENAI_API_KEY, get_client
+    if not OPENAI_API_KEY:
+        raise RuntimeError("No API key")
+    template = DIAGRAM_STYLES.get(style, DIAGRAM_STYLES["infographic"])
+
+    def render(model: str, _timeout) -> bytes:
+        usage_ledger.admit(model)  # raises over a hard budget
+        options = {"quality": "standard"} if model == "dall-e-3" else {}
+        generate = get_client(base_url=ENDPOINTS.get(model)).images.generate
+        response = api_limiter.call("openai_images", lambda slot: generate(
+            model=model,
+            prompt=template.format(concept=concept),
+            size=size,
+            response_format="b64_json",
+            n=1,
+            **options
+        ))
+        usage_ledger.record(model, images=1)
+        return base64.b64decode(response.data[0].b64_json)
+
+    # dall-e-3 first, another image model when it is failing (see core/routing.py)
+    return model_router.complete("diagram", render)
+
+
+class DiagramJobs:
+    """Runs diagram generations on a small thread pool; the UI polls status()."""
+
+    def __init__(self, cache: ImageCache, workers: int = WORKERS, renderer=render_diagram):
+        self.cache = cache
+        self.renderer = renderer
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="diagram")
+        self._jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, concept: str, size: str = "1024x1024", style: str = "infographic",
+               refresh: bool = False) -> str:
+        key = image_key(concept, size, style)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job and job["status"] in ("queued", "running"):
+                return key
+            cached = None if refresh else self.cache.get(key)
+            job = {"id": key, "concept": concept, "size": size, "style": style,
+                   "status": "done" if cached else "queued", "path": str(cached) if cached else None,
+                   "cached": bool(cached), "submitted": time.time()}
+            self._jobs[key] = job
+            self._jobs.move_to_end(key)
+            while len(self._jobs) > MAX_JOBS:
+                self._jobs.popitem(last=False)
+        if not cached:
+            # carry the caller's usage labels (session / profile) into the worker
+            self._pool.submit(contextvars.copy_context().run, self._run, job)
+        return key
+
+    def _run(self, job: Dict):
+        job["status"] = "running"
+        started = time.monotonic()
+        try:
+            data = self.renderer(job["concept"], job["size"], job["style"])
+            job["path"] = str(self.cache.put(job["id"], data))
+            job["status"] = "done"
+        except Exception as e:
+            job["error"] = str(e)[:200]
+            job["status"] = "error"
+        job["duration_s"] = round(time.monotonic() - started, 2)
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def generate(self, concept: str, size: str = "1024x1024", style: str = "infographic",
+                 timeout: Optional[float] = None) -> Tuple[Optional[str], str]:
+        """Blocking helper: (image path, "success") or (None, error message)."""
+        job_id = self.submit(concept, size, style)
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:  # already evicted by MAX_JOBS other submissions
+            cached = self.cache.get(job_id)
+            return (str(cached), "success") if cached else (None, "diagram job was dropped, try again")
+        # poll the job itself, not the table: it keeps updating after eviction
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if job["status"] == "done":
+                return job["path"], "success"
+            if job["status"] == "error":
+                return None, job.get("error", "failed")
+            if deadline is not None and time.monotonic() > deadline:
+                return None, "timed out"
+            time.sleep(0.2)
+
+
+# singleton instance
+diagram_jobs = DiagramJobs(ImageCache())
@@ -0,0 +1,134 @@
+# app/core/latency.py
+"""
+Observed per-step latencies and the latency-budget planner for explain_concept.
+
+Every pipeline run records how long each step took (step_latency.record). When a
+caller gives explain_concept a latency budget (e.g. 3 s for chat, 20 s for the
+Explain button), plan_for_budget() estimates the critical path from recent p75
+latencies and applies degradations, cheapest first, until the plan fits:
+
+    shortened_web_search   fewer results + search capped to a slice of the budget
+    skipped_web_search     answer from the model's own knowledge
+    skipped_decomposition  no separate decomposition call (analogies/synthesis run without atoms)
+    reduced_max_tokens     shorter analogies / explanation
+    partial_result         (set after the run) some steps did not finish within the budget
+
+A skipped step records no latency, so EXPLORE_RATE of the plans that would skip a
+step run it anyway; otherwise one slow spell (or a pessimistic prior) would keep
+it skipped for good. A step that timed out is recorded as at least the current
+p95, not the time it was cut at, so timeouts never pull the estimate down.
+"""
+import random
+import threading
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional
+
+# Used until a step has enough samples of its own (seconds)
+PRIOR_LATENCY = {
+    "web_search": 2.5,
+    "decomposition": 0.5,   # usually local keyphrases; LLM only on low confidence
+    "analogies": 3.0,       # three short analogies generated concurrently
+    "synthesis": 6.0,
+    "translation": 4.0,
+    "analogy_translation": 4.0,
+}
+MIN_SAMPLES = 3
+HEADROOM = 0.85              # plan to use at most this share of the budget
+REDUCED_TOKEN_SPEEDUP = 0.6  # generation time scales roughly with max_tokens
+EXPLORE_RATE = 0.1           # plans that still run a step the budget would skip
+
+
+class LatencyTracker:
+    """Thread-safe sliding window of recent durations per key."""
+
+    def __init__(self, window: int = 50):
+        self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, key: str, seconds: float, timed_out: bool = False):
+        if timed_out:  # it would have taken longer than this
+            seconds = max(seconds, self.percentile(key, 95))
+        with self._lock:
+            self._samples[key].append(seconds)
+
+    def count(self, key: str) -> int:
+        with self._lock:
+            return len(self._samples.get(key, ()))
+
+    def percentile(self, key: str, pct: float, default: Optional[float] = None) -> Optional[float]:
+        with self._lock:
+            values = sorted(self._samples.get(key, ()))
+        if len(values) < MIN_SAMPLES:
+            return default if default is not None else PRIOR_LATENCY.get(key, 3.0)
+        idx = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+        return values[idx]
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            keys = list(self._samples)
+        return {k: {"n": self.count(k), "p50": self.percentile(k, 50, 0.0), "p95": self.percentile(k, 95, 0.0)}
+                for k in keys}
+
+
+@dataclass
+class BudgetPlan:
+    budget: Optional[float] = None
+    use_web: bool = True
+    num_results: int = 5
+    web_timeout: Optional[float] = None
+    decompose: bool = True
+    token_scale: float = 1.0
+    estimate: float = 0.0
+    degradations: List[str] = field(default_factory=list)
+
+
+def _estimate(plan: BudgetPlan, p, translate: bool) -> float:
+    web = min(p("web_search"), plan.web_timeout or p("web_search")) if plan.use_web else 0.0
+    decomp = p("decomposition") if plan.decompose else 0.0
+    gen = plan.token_scale if plan.token_scale == 1.0 else REDUCED_TOKEN_SPEEDUP
+    # decomposition reads the search snippets, so it follows web search
+    synth_path = web + decomp + p("synthesis") * gen + (p("translation") if translate else 0.0)
+    analogy_path = (web + decomp if plan.decompose else 0.0) + p("analogies") * gen + (p("analogy_translation") if translate else 0.0)
+    return max(synth_path, analogy_path)
+
+
+def plan_for_budget(budget: Optional[float], use_web: bool, translate: bool,
+                    tracker: Optional["LatencyTracker"] = None,
+                    explore: Callable[[], bool] = lambda: random.random() < EXPLORE_RATE) -> BudgetPlan:
+    """
+    Pick the least degraded pipeline whose estimated p75 latency fits the budget.
+    When explore() says so, a step is run although skipping it would fit the budget better.
+    """
+    tracker = tracker or step_latency
+    plan = BudgetPlan(budget=budget, use_web=use_web)
+    p = lambda step: tracker.percentile(step, 75)
+    plan.estimate = _estimate(plan, p, translate)
+    if not budget:
+        return plan
+
+    target = budget * HEADROOM
+    ladder = []
+    if use_web:
+        ladder.append(("shortened_web_search", lambda: (setattr(plan, "num_results", 3),
+                                                        setattr(plan, "web_timeout", max(1.0, budget * 0.25)))))
+        ladder.append(("skipped_web_search", lambda: setattr(plan, "use_web", False)))
+    ladder.append(("skipped_decomposition", lambda: setattr(plan, "decompose", False)))
+    ladder.append(("reduced_max_tokens", lambda: setattr(plan, "token_scale", 0.5)))
+
+    for name, apply in ladder:
+        if plan.estimate <= target:
+            break
+        if name.startswith("skipped_") and explore():
+            continue  # keep measuring it
+        apply()
+        plan.degradations.append(name)
+        plan.estimate = _estimate(plan, p, translate)
+    if "skipped_web_search" in plan.degradations:
+        plan.degradations.remove("shortened_web_search")
+    plan.estimate = round(plan.estimate, 2)
+    return plan
+
+
+# process-wide tracker fed by every explain_concept run
+step_latency = LatencyTracker()
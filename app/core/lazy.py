@@ -0,0 +1,51 @@
+# app/core/lazy.py
+"""
+Lazy loading of optional heavy dependencies.
+
+Modules such as numpy, PyMuPDF (fitz), pytesseract and bs4 are only imported the
+first time a code path needs them, so starting a new worker (or importing the
+engine from the CLI / API) does not pay for features it never uses. Results are
+cached process-wide - including failures, so a missing package is not searched
+for again on every call.
+
+Usage:
+    from core.lazy import optional_import, is_available
+    fitz = optional_import("fitz")
+    if fitz is None:
+        ...
+"""
+import importlib
+import importlib.util
+import threading
+from typing import Any, Dict, Optional
+
+_modules: Dict[str, Optional[Any]] = {}
+_available: Dict[str, bool] = {}
+_lock = threading.Lock()
+
+
+def optional_import(name: str):
+    """Import `name` on first use; returns the module, or None if it is not installed."""
+    try:
+        return _modules[name]
+    except KeyError:
+        pass
+    with _lock:
+        if name not in _modules:
+            try:
+                _modules[name] = importlib.import_module(name)
+            except Exception:
+                _modules[name] = None
+        return _modules[name]
+
+
+def is_available(name: str) -> bool:
+    """Whether `name` can be imported, without importing it."""
+    if name in _modules:
+        return _modules[name] is not None
+    if name not in _available:
+        try:
+            _available[name] = importlib.util.find_spec(name) is not None
+        except (ImportError, ValueError):
+            _available[name] = False
+    return _available[name]
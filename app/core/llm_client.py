@@ -1,51 +1,370 @@
 # app/core/llm_client.py
 """
 Simple LLM client wrapper - FIXED for OpenAI SDK compatibility
+
+Optional request hedging (cuts tail latency): when a completion has not returned
+after the LLM_HEDGE_PERCENTILE of recent latencies for its model, a duplicate is
+sent (to LLM_HEDGE_MODEL if set), the first answer wins and the other is cancelled.
+At most LLM_HEDGE_BUDGET of recent requests may be hedged, so spend stays bounded.
+
+Calls without an explicit model are routed per pipeline step (core/routing.py):
+small models for cheap steps, a stronger one for synthesis, with fallback to the
+next candidate on errors.
+
+Every request waits for a slot from the cross-process limiter (core/ratelimit.py),
+which keeps all workers together within the provider's request / token limits.
+
+Token usage of every completion is recorded in core/usage.py (per step, session,
+profile and model), which also enforces the daily spend budgets.
+
+Config (env):
+    LLM_HEDGE              "1" to enable (default off)
+    LLM_HEDGE_PERCENTILE   hedge after this latency percentile (default 90)
+    LLM_HEDGE_BUDGET       max share of requests that get a duplicate (default 0.1)
+    LLM_HEDGE_MODEL        model for the duplicate request (default: same model)
 """
+import contextvars
+import functools
 import os
-from typing import List
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from core.latency import MIN_SAMPLES, LatencyTracker
+from core.profiling import attached
+from core.ratelimit import RateLimited, Slot, api_limiter, is_throttle
+from core.routing import ENDPOINTS, model_router
+from core.metrics import LLM_SECONDS
+from core.usage import current_labels, usage_ledger
 
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-DEFAULT_MODEL = os.environ.get("OPENAI_CHAT_MODEL", "gpt-3.5-turbo")
 
-def _chat_complete(prompt: str, temperature: float = 0.2, max_tokens: int = 700) -> str:
-    """Call OpenAI with compatibility for both old and new SDK"""
-    if not OPENAI_API_KEY:
-        raise RuntimeError("OPENAI_API_KEY not set in environment.")
-    
+HEDGE_ENABLED = os.environ.get("LLM_HEDGE", "0").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", "90"))
+HEDGE_BUDGET = float(os.environ.get("LLM_HEDGE_BUDGET", "0.1"))
+HEDGE_MODEL = os.environ.get("LLM_HEDGE_MODEL") or None
+HEDGE_MIN_DELAY = 0.5  # seconds; never hedge sooner than this
+
+
+@functools.lru_cache(maxsize=8)
+def get_client(max_retries: int = 2, base_url: Optional[str] = None):
+    """Process-wide OpenAI (>=1.0) client; reuses its HTTP connection pool across calls and sessions."""
+    from openai import OpenAI
+    return OpenAI(api_key=OPENAI_API_KEY, max_retries=max_retries, base_url=base_url)
+
+
+def warm_up():
+    """Import the OpenAI SDK and build the shared client in the background (it takes ~1 s)."""
+    if OPENAI_API_KEY:
+        threading.Thread(target=lambda: get_client(), name="openai-warmup", daemon=True).start()
+
+
+def _record_usage(model: str, usage, slot: Optional[Slot] = None):
+    """Pass a response's usage (new SDK object or old SDK dict) to the usage ledger and the limiter slot."""
+    if not usage:
+        return
+    get = usage.get if isinstance(usage, dict) else (lambda k, d=0: getattr(usage, k, d))
+    prompt_tokens = int(get("prompt_tokens", 0) or 0)
+    completion_tokens = int(get("completion_tokens", 0) or 0)
+    usage_ledger.record(model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    if slot is not None:
+        slot.tokens = prompt_tokens + completion_tokens
+
+
+def _provider(model: str) -> str:
+    """Rate-limit bucket for a model: its endpoint's host, or "openai"."""
+    endpoint = ENDPOINTS.get(model)
+    return urlsplit(endpoint).hostname or endpoint if endpoint else "openai"
+
+
+def _estimated_tokens(prompt: str, max_tokens: int) -> int:
+    return len(prompt) // 4 + max_tokens
+
+
+class _Attempt:
+    """
+    One in-flight completion. A hedge gets its own HTTP client (own_client) so cancel()
+    can close it and drop the request; the primary uses the shared pooled client, and
+    cancelling it only abandons its result.
+    """
+
+    def __init__(self, own_client: bool = False):
+        self.own_client = own_client
+        self.client = None
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        self.close()
+
+    def close(self):
+        client, self.client = self.client, None
+        try:
+            if client is not None:
+                client.close()
+        except Exception:
+            pass
+
+
+def _complete_once(prompt: str, temperature: float, max_tokens: int, model: str,
+                   timeout: Optional[float], attempt: Optional[_Attempt] = None) -> str:
+    """One completion, sent once the provider's shared limits allow it."""
+    started, outcome = time.perf_counter(), "error"
+    try:
+        text = api_limiter.call(
+            _provider(model),
+            lambda slot: _request_once(prompt, temperature, max_tokens, model, slot.timeout or timeout, attempt, slot),
+            tokens=_estimated_tokens(prompt, max_tokens), timeout=timeout)
+        outcome = "success"
+        return text
+    finally:
+        LLM_SECONDS.labels(model=model, outcome=outcome).observe(time.perf_counter() - started)
+
+
+def _request_once(prompt: str, temperature: float, max_tokens: int, model: str,
+                  timeout: Optional[float], attempt: Optional[_Attempt], slot: Slot) -> str:
+    try:
+        return _request(prompt, temperature, max_tokens, model, timeout, attempt, slot)
+    finally:
+        if attempt is not None:
+            attempt.close()  # a hedge's own client (and its connection pool) is done
+
+
+def _request(prompt: str, temperature: float, max_tokens: int, model: str,
+             timeout: Optional[float], attempt: Optional[_Attempt], slot: Slot) -> str:
     try:
         # Try new OpenAI SDK (>=1.0)
-        from openai import OpenAI
-        client = OpenAI(api_key=OPENAI_API_KEY)
+        if attempt is not None and attempt.own_client:
+            # the hedge gets its own client so cancelling it can close the connection
+            from openai import OpenAI
+            client = attempt.client = OpenAI(api_key=OPENAI_API_KEY, max_retries=0 if timeout else 2,
+                                             base_url=ENDPOINTS.get(model))
+        else:
+            client = get_client(max_retries=0 if timeout else 2, base_url=ENDPOINTS.get(model))
         response = client.chat.completions.create(
-            model=DEFAULT_MODEL,
+            model=model,
             messages=[{"role": "user", "content": prompt}],
             temperature=temperature,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            timeout=timeout
         )
-        return response.choices[0].message.content.strip()
+        usage, text = getattr(response, "usage", None), response.choices[0].message.content.strip()
     except Exception as e1:
+        if attempt is not None and attempt.cancelled:
+            raise RuntimeError("OpenAI call cancelled (hedged request won)")
         try:
             # Fallback to old OpenAI SDK (<1.0)
             import openai
             openai.api_key = OPENAI_API_KEY
             response = openai.ChatCompletion.create(
-                model=DEFAULT_MODEL,
+                model=model,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=temperature,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
+                request_timeout=timeout
             )
-            return response.choices[0].message.content.strip()
+            usage, text = response.get("usage"), response.choices[0].message.content.strip()
         except Exception as e2:
             raise RuntimeError(f"OpenAI call failed: {str(e1)[:100]} | {str(e2)[:100]}")
+    # outside the try: accounting trouble must not turn a finished completion into a failed one
+    _record_usage(model, usage, slot)
+    return text
+
+
+def _stream_once(prompt: str, temperature: float, max_tokens: int, model: str,
+                 timeout: Optional[float], on_token: Callable[[str], None]) -> str:
+    """Stream the completion, passing each text delta to on_token; returns the full text."""
+    parts: List[str] = []
+    usage = []
+
+    def stream_request(slot: Slot) -> str:
+        client = get_client(max_retries=0 if timeout else 2, base_url=ENDPOINTS.get(model))
+        stream = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=slot.timeout or timeout,
+            stream=True,
+            stream_options={"include_usage": True}  # usage arrives on a final chunk without choices
+        )
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage.append(chunk.usage)
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                on_token(delta)
+        # after the stream: accounting trouble must not read as an interrupted stream
+        _record_usage(model, usage[-1] if usage else None, slot)
+        return "".join(parts).strip()
+
+    try:
+        return api_limiter.call(_provider(model), stream_request,
+                                tokens=_estimated_tokens(prompt, max_tokens), timeout=timeout)
+    except Exception as e:
+        if parts:
+            raise RuntimeError(f"OpenAI stream interrupted: {str(e)[:100]}")
+        if isinstance(e, RateLimited) or is_throttle(e):
+            raise  # the non-streaming request would only wait / be throttled again
+    # old SDK / streaming unavailable: deliver the whole answer as one delta
+    text = _complete_once(prompt, temperature, max_tokens, model, timeout)
+    on_token(text)
+    return text
+
+
+class RequestHedger:
+    """
+    Adaptive hedging for chat completions. The hedge delay is the configured
+    percentile of recent latencies per model; hedges are capped at `budget`
+    of the last `window` requests.
+    """
+
+    def __init__(self, percentile: float = HEDGE_PERCENTILE, budget: float = HEDGE_BUDGET,
+                 secondary_model: Optional[str] = HEDGE_MODEL, window: int = 200):
+        self.percentile = percentile
+        self.budget = budget
+        self.secondary_model = secondary_model
+        self.latency = LatencyTracker(window=window)
+        self._recent = deque(maxlen=window)  # one [hedged] cell per request
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "hedged": 0, "hedge_wins": 0}
+        self._pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+
+    def delay(self, model: str) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there are too few samples."""
+        if self.latency.count(model) < MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_DELAY, self.latency.percentile(model, self.percentile))
+
+    def _take_budget(self, request: List[bool]) -> bool:
+        """Allow a hedge for `request` (its cell in the window) if the budget has room."""
+        with self._lock:
+            # one hedge is always allowed so a cold start isn't left without any
+            if sum(r[0] for r in self._recent) >= max(1.0, self.budget * len(self._recent)):
+                return False
+            request[0] = True  # this request's own cell, wherever it is in the window by now
+            self._stats["hedged"] += 1
+            return True
+
+    def _submit(self, attempt: _Attempt, prompt, temperature, max_tokens, model, timeout):
+        ctx = contextvars.copy_context()
+        started = time.monotonic()
+
+        def run():
+            text = _complete_once(prompt, temperature, max_tokens, model, timeout, attempt)
+            return text, time.monotonic() - started
+        return self._pool.submit(ctx.run, attached(run))
+
+    def complete(self, prompt: str, temperature: float, max_tokens: int, model: str,
+                 timeout: Optional[float]) -> str:
+        request = [False]
+        with self._lock:
+            self._recent.append(request)
+            self._stats["requests"] += 1
+        delay = self.delay(model)
+        if delay is None or (timeout is not None and timeout <= delay):
+            started = time.monotonic()
+            text = _complete_once(prompt, temperature, max_tokens, model, timeout)
+            self.latency.record(model, time.monotonic() - started)
+            return text
+
+        started = time.monotonic()
+        primary = _Attempt()
+        fut = self._submit(primary, prompt, temperature, max_tokens, model, timeout)
+        done, _ = wait([fut], timeout=delay)
+        if done or not self._take_budget(request):
+            text, elapsed = fut.result()
+            self.latency.record(model, elapsed)
+            return text
+
+        hedge_model = self.secondary_model or model
+        remaining = None if timeout is None else max(1.0, timeout - (time.monotonic() - started))
+        secondary = _Attempt(own_client=True)
+        hedge = self._submit(secondary, prompt, temperature, max_tokens, hedge_model, remaining)
+        attempts = {fut: (primary, model), hedge: (secondary, hedge_model)}
+        pending, error = set(attempts), None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                try:
+                    text, elapsed = f.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                for other in pending:
+                    attempts[other][0].cancel()
+                    other.cancel()
+                # the slower primary is cut short, so its true latency is at least this long
+                self.latency.record(model, time.monotonic() - started)
+                if f is hedge:
+                    with self._lock:
+                        self._stats["hedge_wins"] += 1
+                return text
+        raise error
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hedge_rate"] = round(stats["hedged"] / stats["requests"], 3) if stats["requests"] else 0.0
+        return stats
+
+
+# process-wide hedger used by _chat_complete when LLM_HEDGE is on
+hedger = RequestHedger()
+
+
+def _complete_with(prompt: str, temperature: float, max_tokens: int, model: str,
+                   timeout: Optional[float], on_token: Optional[Callable[[str], None]] = None) -> str:
+    # raises BudgetExceeded over a hard budget; a cheaper model over a soft one
+    model = usage_ledger.admit(model)
+    if on_token is not None:
+        return _stream_once(prompt, temperature, max_tokens, model, timeout, on_token)
+    if HEDGE_ENABLED:
+        return hedger.complete(prompt, temperature, max_tokens, model, timeout)
+    return _complete_once(prompt, temperature, max_tokens, model, timeout)
+
+def _chat_complete(prompt: str, temperature: float = 0.2, max_tokens: int = 700,
+                   model: Optional[str] = None, timeout: Optional[float] = None,
+                   on_token: Optional[Callable[[str], None]] = None, step: Optional[str] = None) -> str:
+    """
+    Call OpenAI with compatibility for both old and new SDK.
+    `timeout` (seconds) bounds the HTTP request; callers pass the remaining request deadline.
+    With `on_token` the answer is streamed and each text delta is passed to it (not hedged).
+    Without `model`, the model is routed for `step` (default: the current pipeline step).
+    Usage is recorded under the caller's usage_scope (see core/usage.py).
+    """
+    if not OPENAI_API_KEY:
+        raise RuntimeError("OPENAI_API_KEY not set in environment.")
+    if model:
+        return _complete_with(prompt, temperature, max_tokens, model, timeout, on_token)
+    
+    streamed = []
+    def relay(text):
+        streamed.append(True)
+        on_token(text)
+    return model_router.complete(
+        step or current_labels().get("step") or "default",
+        lambda routed, remaining: _complete_with(prompt, temperature, max_tokens, routed, remaining,
+                                                 relay if on_token is not None else None),
+        timeout=timeout,
+        retry=lambda: not streamed)  # a half-streamed answer can't be restarted on another model
 
-def get_llm(temperature: float = 0.2):
+def get_llm(temperature: float = 0.2, step: Optional[str] = None):
     """Return a callable LLM function"""
-    def call(prompt_text: str):
-        return _chat_complete(prompt_text, temperature=temperature)
+    def call(prompt_text: str, timeout: Optional[float] = None, max_tokens: int = 700,
+             on_token: Optional[Callable[[str], None]] = None):
+        return _chat_complete(prompt_text, temperature=temperature, max_tokens=max_tokens,
+                              timeout=timeout, on_token=on_token, step=step)
     return call
 
-def summarize_with_context(prompt: str, context_texts: List[str], temperature: float = 0.2) -> str:
+def summarize_with_context(prompt: str, context_texts: List[str], temperature: float = 0.2,
+                           timeout: Optional[float] = None, max_tokens: int = 800,
+                           on_token: Optional[Callable[[str], None]] = None,
+                           step: Optional[str] = None) -> str:
     """
     Given a user prompt and context snippets from web search,
     call the LLM to produce an explain-by-analogy output.
@@ -73,4 +392,5 @@ Web evidence:
 
 Return the result as plain text. If evidence conflicts, note it briefly.
 """
-    return _chat_complete(instruction, temperature=temperature, max_tokens=800)
\ No newline at end of file
+    return _chat_complete(instruction, temperature=temperature, max_tokens=max_tokens, timeout=timeout,
+                          on_token=on_token, step=step)
\ No newline at end of file
@@ -0,0 +1,347 @@
+# app/core/metrics.py
+"""
+In-process metrics registry with Prometheus text exposition.
+
+Counters, gauges and histograms with labels, safe to update from any thread (one
+small lock per labelled series; an update is a dict lookup plus a locked add).
+Gauges can also be read from a function at scrape time (queue depths).
+
+What the tutor records:
+    tutor_step_seconds{step,status}               pipeline step durations
+    tutor_explain_seconds{outcome}                whole explain_concept runs
+    tutor_llm_request_seconds{model,outcome}      each LLM / image call (per attempt)
+    tutor_search_seconds{provider,outcome}        web search calls
+    tutor_cache_requests_total{cache,kind,outcome}  response / answer cache hits and misses
+    tutor_document_extract_seconds{type}          PDF / OCR text extraction
+    tutor_storage_write_seconds{store}            session / cache / usage file writes
+    tutor_queue_depth{queue}, tutor_in_flight{queue}  API work queue, prefetcher
+
+Exposed on GET /metrics of a local HTTP listener (METRICS_PORT), of the API server
+(server.py), and/or written to a file every METRICS_INTERVAL seconds (METRICS_FILE,
+e.g. for node_exporter's textfile collector).
+
+Usage:
+    from core.metrics import metrics
+    STEP = metrics.histogram("tutor_step_seconds", "Pipeline step duration", ("step", "status"))
+    STEP.labels(step="synthesis", status="success").observe(4.2)
+    with STEP.labels(step="web_search", status="success").time():
+        ...
+    metrics.render()                    # Prometheus text format
+    summary()                           # explain p50 / p95 and cache hit rate (sidebar)
+
+Config (env):
+    METRICS_PORT       serve /metrics on 127.0.0.1:<port> (default off; METRICS_HOST to bind elsewhere)
+    METRICS_FILE       write the metrics to this file (default off)
+    METRICS_INTERVAL   seconds between file writes (default 15)
+"""
+
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Series:
+    def __init__(self):
+        self._lock = threading.Lock()
+
+
+class CounterSeries(_Series):
+    def __init__(self):
+        super().__init__()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class GaugeSeries(_Series):
+    def __init__(self):
+        super().__init__()
+        self.value = 0.0
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+
+class HistogramSeries(_Series):
+    def __init__(self, buckets: Tuple[float, ...]):
+        super().__init__()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # per bucket, not cumulative
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        with self._lock:
+            if i < len(self.buckets):
+                self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def snapshot(self) -> Tuple[List[int], int, float]:
+        with self._lock:
+            return list(self.counts), self.count, self.sum
+
+    def quantile(self, q: float) -> Optional[float]:
+        counts, count, _ = self.snapshot()
+        return _quantile(self.buckets, counts, count, q)
+
+
+def _quantile(buckets: Tuple[float, ...], counts: List[int], count: int, q: float) -> Optional[float]:
+    """Estimate from bucket counts (linear within a bucket), like PromQL histogram_quantile."""
+    if not count:
+        return None
+    rank, seen, lower = q * count, 0, 0.0
+    for upper, n in zip(buckets, counts):
+        if n and seen + n >= rank:
+            return lower + (upper - lower) * (rank - seen) / n
+        seen += n
+        lower = upper
+    return buckets[-1]  # in the +Inf bucket
+
+
+class Metric:
+    """A named family of series, one per combination of label values."""
+
+    def __init__(self, kind: str, name: str, help_text: str, labelnames: Sequence[str],
+                 factory: Callable[[], _Series]):
+        self.kind, self.name, self.help, self.labelnames = kind, name, help_text, tuple(labelnames)
+        self._factory = factory
+        self._series: Dict[Tuple[str, ...], _Series] = {}
+        self._lock = threading.Lock()
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def _key(self, values: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(values.get(n, "")) for n in self.labelnames)
+
+    def labels(self, **values) -> _Series:
+        key = self._key(values)
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(key, self._factory())
+        return series
+
+    def series(self) -> List[Tuple[Tuple[str, ...], _Series]]:
+        with self._lock:
+            return list(self._series.items())
+
+    def _matching(self, match: Dict[str, str]) -> List[_Series]:
+        return [series for key, series in self.series()
+                if all(key[self.labelnames.index(n)] == str(v) for n, v in match.items())]
+
+    def total(self, **match) -> float:
+        """Counter / gauge value summed over the series whose labels match."""
+        return sum(series.value for series in self._matching(match))
+
+    def quantile(self, q: float, **match) -> Optional[float]:
+        """Histogram quantile over the series whose labels match (their buckets added up)."""
+        series = self._matching(match)
+        if not series:
+            return None
+        counts, count = [0] * len(series[0].buckets), 0
+        for s in series:
+            c, n, _ = s.snapshot()
+            counts = [a + b for a, b in zip(counts, c)]
+            count += n
+        return _quantile(series[0].buckets, counts, count, q)
+
+    def set_function(self, fn: Callable[[], float], **values):
+        """Gauge series whose value is fn(), read at scrape time (replaces any earlier one)."""
+        with self._lock:
+            self._functions[self._key(values)] = fn
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            functions = list(self._functions.items())
+        for key, fn in functions:
+            try:
+                value = fn()
+            except Exception:
+                continue
+            lines.append(f"{self.name}{_labels_text(self.labelnames, key)} {_number(value)}")
+        for key, series in self.series():
+            if isinstance(series, HistogramSeries):
+                counts, count, total = series.snapshot()
+                cumulative = 0
+                for upper, n in zip(series.buckets, counts):
+                    cumulative += n
+                    le = _labels_text(self.labelnames, key, f'le="{_number(upper)}"')
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                inf = _labels_text(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{inf} {count}")
+                lines.append(f"{self.name}_sum{_labels_text(self.labelnames, key)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels_text(self.labelnames, key)} {count}")
+            else:
+                lines.append(f"{self.name}{_labels_text(self.labelnames, key)} {_number(series.value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._dumper: Optional[threading.Thread] = None
+
+    def _register(self, kind: str, name: str, help_text: str, labelnames: Sequence[str],
+                  factory: Callable[[], _Series]) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Metric(kind, name, help_text, labelnames, factory)
+            elif metric.kind != kind:
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Metric:
+        return self._register("counter", name, help_text, labelnames, CounterSeries)
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Metric:
+        return self._register("gauge", name, help_text, labelnames, GaugeSeries)
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Metric:
+        return self._register("histogram", name, help_text, labelnames, lambda: HistogramSeries(buckets))
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        return "\n".join(line for m in metrics for line in m.render()) + "\n"
+
+    # ----- exporters -----
+
+    def write_file(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(self.render(), encoding="utf-8")
+        os.replace(tmp, path)  # readers never see a half-written file
+
+    def start_file_dumper(self, path: Path, interval: float = 15.0):
+        if self._dumper is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.write_file(path)
+                except OSError as e:
+                    print("Metrics file error:", e)
+        self._dumper = threading.Thread(target=loop, name="metrics-file", daemon=True)
+        self._dumper.start()
+
+    def start_http_server(self, port: int, host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+        """Serve GET /metrics on a daemon thread; None if the port is taken (e.g. another worker has it)."""
+        if self._server is not None:
+            return self._server
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            print(f"Metrics port {port} unavailable: {e}")
+            return None
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        return self._server
+
+    def start_exporters(self):
+        """Start whatever METRICS_PORT / METRICS_FILE ask for (idempotent)."""
+        port = os.environ.get("METRICS_PORT")
+        if port:
+            self.start_http_server(int(port), os.environ.get("METRICS_HOST", "127.0.0.1"))
+        path = os.environ.get("METRICS_FILE")
+        if path:
+            self.start_file_dumper(Path(path), float(os.environ.get("METRICS_INTERVAL", "15")))
+
+
+# process-wide registry
+metrics = MetricsRegistry()
+
+# the tutor's own metrics (see the module docstring)
+STEP_SECONDS = metrics.histogram("tutor_step_seconds", "Pipeline step duration", ("step", "status"))
+EXPLAIN_SECONDS = metrics.histogram("tutor_explain_seconds", "explain_concept duration", ("outcome",))
+LLM_SECONDS = metrics.histogram("tutor_llm_request_seconds", "LLM / image request duration per attempt",
+                                ("model", "outcome"))
+SEARCH_SECONDS = metrics.histogram("tutor_search_seconds", "Web search call duration", ("provider", "outcome"))
+CACHE_REQUESTS = metrics.counter("tutor_cache_requests_total", "Cache lookups", ("cache", "kind", "outcome"))
+EXTRACT_SECONDS = metrics.histogram("tutor_document_extract_seconds", "Document text extraction duration",
+                                    ("type",))
+STORAGE_WRITE_SECONDS = metrics.histogram("tutor_storage_write_seconds", "Storage file write duration",
+                                          ("store",))
+QUEUE_DEPTH = metrics.gauge("tutor_queue_depth", "Jobs waiting", ("queue",))
+IN_FLIGHT = metrics.gauge("tutor_in_flight", "Jobs running", ("queue",))
+
+
+def summary() -> Dict[str, Optional[float]]:
+    """Headline numbers for the UI: explain count and p50 / p95 (s), cache hit rate (0-1)."""
+    hits = CACHE_REQUESTS.total(outcome="hit")
+    lookups = hits + CACHE_REQUESTS.total(outcome="miss")
+    return {"explains": sum(s.count for _, s in EXPLAIN_SECONDS.series()),
+            "explain_p50": EXPLAIN_SECONDS.quantile(0.5), "explain_p95": EXPLAIN_SECONDS.quantile(0.95),
+            "cache_hit_rate": hits / lookups if lookups else None}
@@ -0,0 +1,235 @@
+# app/core/pipeline.py
+"""
+Small dependency-graph step scheduler for the explain pipeline.
+
+Each Step names the steps it depends on, has its own timeout and is either
+required or optional. StepScheduler runs every step whose dependencies have
+finished concurrently, and each step function receives a StepContext that
+knows the remaining request deadline so it can pass it down to LLM / HTTP calls.
+A step runs after a failed dependency (and makes do without its output) unless
+it lists it in `needs`; then it is skipped with reason "dependency '<name>' failed".
+
+Usage:
+    steps = [
+        Step("search", lambda ctx: web_search_snippets(q, timeout=ctx.timeout()), timeout=8),
+        Step("atoms", lambda ctx: decompose(q, timeout=ctx.timeout()), timeout=15),
+        Step("answer", synthesize, deps=("search", "atoms"), timeout=30, required=True),
+    ]
+    run = StepScheduler(steps).run(Deadline(45))
+    run.results["answer"], run.records
+
+A step whose timeout expires is abandoned (its thread is not joined), so a stalled
+call never holds the request past its deadline.
+
+Progress events: run(deadline, on_event=fn) calls fn, on the caller's thread, with
+    {"type": "step", **record, "output": result}   as each step finishes / is skipped
+    {"type": <kind>, "step": name, **data}         for ctx.emit(kind, **data) inside a step
+(e.g. "delta" chunks of a streamed explanation), so a UI can render results as they arrive.
+An on_event callback may raise Cancelled to abort the run; it propagates to the caller.
+"""
+
+import contextvars
+import queue
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.profiling import attached
+
+
+class Cancelled(Exception):
+    """Raised by an on_event callback to stop the run (e.g. a prefetch the user moved past)."""
+
+
+class Deadline:
+    """End-to-end request deadline; seconds=None means no deadline."""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.expires = time.monotonic() + seconds if seconds is not None else None
+
+    def remaining(self) -> Optional[float]:
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.expires is not None and time.monotonic() >= self.expires
+
+
+@dataclass
+class Step:
+    name: str
+    fn: Callable[["StepContext"], Any]
+    deps: Tuple[str, ...] = ()
+    timeout: Optional[float] = None
+    required: bool = False
+    needs: Tuple[str, ...] = ()  # deps whose output it cannot run without (implies deps)
+
+
+@dataclass
+class StepContext:
+    name: str
+    results: Dict[str, Any]
+    expires: Optional[float]
+    notes: Dict[str, Any] = field(default_factory=dict)
+    events: Optional["queue.Queue"] = None
+
+    def timeout(self, floor: float = 1.0) -> Optional[float]:
+        """Seconds left for this step (step timeout capped by the request deadline)."""
+        if self.expires is None:
+            return None
+        return max(floor, self.expires - time.monotonic())
+
+    def note(self, **fields):
+        """Attach extra fields (count, status override, ...) to this step's record."""
+        self.notes.update(fields)
+
+    def emit(self, kind: str, **data):
+        """Send a progress event to run()'s on_event callback (no-op without one)."""
+        if self.events is not None:
+            self.events.put({"type": kind, "step": self.name, **data})
+
+
+@dataclass
+class PipelineRun:
+    results: Dict[str, Any] = field(default_factory=dict)
+    records: List[dict] = field(default_factory=list)
+    failed: Optional[str] = None  # first required step that did not succeed
+
+    def status(self, name: str) -> Optional[str]:
+        for r in self.records:
+            if r["step"] == name:
+                return r["status"]
+        return None
+
+
+# how often run() wakes up to deliver ctx.emit() events while steps are running
+EVENT_POLL_INTERVAL = 0.05
+
+
+class StepScheduler:
+    def __init__(self, steps: List[Step], max_workers: int = 4):
+        names = [s.name for s in steps]
+        if len(set(names)) != len(names):
+            raise ValueError("Duplicate step names")
+        for s in steps:
+            missing = [d for d in s.deps + s.needs if d not in names]
+            if missing:
+                raise ValueError(f"Step '{s.name}' depends on unknown steps: {missing}")
+        self.steps = steps
+        self.max_workers = max_workers
+
+    def _record(self, run: PipelineRun, step: Step, status: str, started: float,
+                ctx: Optional[StepContext] = None, error: Optional[BaseException] = None):
+        rec = {"step": step.name, "status": status,
+               "duration_ms": int((time.monotonic() - started) * 1000)}
+        if error is not None:
+            rec["error"] = str(error)[:100]
+        if ctx is not None:
+            rec.update(ctx.notes)
+        run.records.append(rec)
+        if rec["status"] not in ("success", "no_results") and step.required and run.failed is None:
+            run.failed = step.name
+
+    def _deliver(self, run: PipelineRun, events: "queue.Queue", emitted: int,
+                 on_event: Callable[[dict], None]) -> int:
+        """Hand queued step events, then newly added records, to on_event. Returns records delivered."""
+        while True:
+            try:
+                on_event(events.get_nowait())
+            except queue.Empty:
+                break
+        for rec in run.records[emitted:]:
+            on_event({"type": "step", **rec, "output": run.results.get(rec["step"])})
+        return len(run.records)
+
+    def run(self, deadline: Optional[Deadline] = None,
+            on_event: Optional[Callable[[dict], None]] = None) -> PipelineRun:
+        deadline = deadline or Deadline()
+        run = PipelineRun()
+        events = queue.Queue() if on_event else None
+        emitted = 0
+        pending = list(self.steps)
+        done: set = set()
+        succeeded: set = set()
+        running: Dict[Future, Tuple[Step, StepContext, float]] = {}
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pipeline")
+        try:
+            while pending or running:
+                # Abort: a required step failed or the request deadline passed
+                if run.failed or deadline.expired:
+                    reason = "deadline" if deadline.expired and not run.failed else f"required step '{run.failed}' failed"
+                    for step in pending:
+                        run.records.append({"step": step.name, "status": "skipped", "reason": reason})
+                    pending = []
+                    for fut, (step, ctx, started) in list(running.items()):
+                        fut.cancel()
+                        self._record(run, step, "timeout", started, ctx, TimeoutError(reason))
+                    running.clear()
+                    break
+
+                # Launch every step whose dependencies have finished
+                for step in [s for s in pending if all(d in done for d in s.deps + s.needs)]:
+                    pending.remove(step)
+                    failed_dep = next((d for d in step.needs if d not in succeeded), None)
+                    if failed_dep is not None:
+                        # its input is missing: don't run it on nothing
+                        done.add(step.name)
+                        run.records.append({"step": step.name, "status": "skipped",
+                                            "reason": f"dependency '{failed_dep}' failed"})
+                        if step.required and run.failed is None:
+                            run.failed = step.name
+                        continue
+                    started = time.monotonic()
+                    expires = deadline.expires
+                    if step.timeout is not None:
+                        step_expiry = started + step.timeout
+                        expires = step_expiry if expires is None else min(expires, step_expiry)
+                    ctx = StepContext(step.name, run.results, expires, events=events)
+                    fut = executor.submit(contextvars.copy_context().run, attached(step.fn), ctx)
+                    running[fut] = (step, ctx, started)
+
+                if not running:
+                    if any(all(d in done for d in s.deps + s.needs) for s in pending):
+                        continue  # skipped steps unblocked others; launch them
+                    # dependency cycle: nothing runnable and nothing in flight
+                    for step in pending:
+                        run.records.append({"step": step.name, "status": "skipped", "reason": "unresolved dependencies"})
+                    break
+
+                expiries = [ctx.expires for _, ctx, _ in running.values() if ctx.expires is not None]
+                wait_for = max(0.0, min(expiries) - time.monotonic()) if expiries else None
+                if on_event:
+                    wait_for = EVENT_POLL_INTERVAL if wait_for is None else min(wait_for, EVENT_POLL_INTERVAL)
+                finished, _ = wait(list(running), timeout=wait_for, return_when=FIRST_COMPLETED)
+
+                for fut in finished:
+                    step, ctx, started = running.pop(fut)
+                    done.add(step.name)
+                    try:
+                        run.results[step.name] = fut.result()
+                        status = ctx.notes.pop("status", "success")
+                        self._record(run, step, status, started, ctx)
+                        if status in ("success", "no_results"):
+                            succeeded.add(step.name)
+                    except Exception as e:
+                        self._record(run, step, "error", started, ctx, e)
+
+                now = time.monotonic()
+                for fut, (step, ctx, started) in list(running.items()):
+                    if ctx.expires is not None and now >= ctx.expires:
+                        running.pop(fut)
+                        fut.cancel()
+                        done.add(step.name)
+                        self._record(run, step, "timeout", started, ctx,
+                                     TimeoutError(f"timed out after {now - started:.1f}s"))
+                if on_event:
+                    emitted = self._deliver(run, events, emitted, on_event)
+            if on_event:
+                self._deliver(run, events, emitted, on_event)
+        finally:
+            # never join abandoned (timed-out) threads
+            executor.shutdown(wait=False, cancel_futures=True)
+        return run
@@ -0,0 +1,143 @@
+# app/core/prefetch.py
+"""
+Speculative prefetch of drill-down answers.
+
+After an explanation, learners usually ask about one of its atoms next. The
+prefetcher runs explain_concept for those atoms on a small background pool with
+the chat's settings, but with short answers (PREFETCH_TOKEN_SCALE of the normal
+tokens) and nothing streamed, so a speculative answer costs a fraction of a real
+one. Its step outputs and the short answer land in the response / answer caches
+and the drill-down returns at cache speed. If the user asks about an atom while its prefetch is still running,
+response_cache joins the in-flight computation instead of repeating it.
+
+Spend is capped by an estimated token budget per rolling hour. When the user
+moves on, prefetches that have not started are dropped and running ones are
+aborted at the next pipeline poll (counted as tutor_explain_seconds{outcome="cancelled"},
+not as errors).
+
+Usage:
+    prefetcher.schedule(session_id, agent, result["atoms"], profile=profile, target_lang="Hindi")
+    prefetcher.cancel(session_id, keep="Gate voltage")   # new question: stop the rest
+
+Config (env):
+    PREFETCH_WORKERS        background explanations at once (default 2)
+    PREFETCH_MAX_ATOMS      atoms prefetched per answer (default 3)
+    PREFETCH_TOKEN_BUDGET   estimated tokens per hour (default 20000)
+    PREFETCH_TOKEN_SCALE    answer length relative to a chat answer (default 0.5)
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Dict, List, Optional, Tuple
+
+from core.metrics import IN_FLIGHT, QUEUE_DEPTH
+from core.pipeline import Cancelled
+
+WORKERS = int(os.environ.get("PREFETCH_WORKERS", "2"))
+MAX_ATOMS = int(os.environ.get("PREFETCH_MAX_ATOMS", "3"))
+TOKEN_BUDGET = int(os.environ.get("PREFETCH_TOKEN_BUDGET", "20000"))
+TOKEN_SCALE = float(os.environ.get("PREFETCH_TOKEN_SCALE", "0.5"))
+EST_TOKENS_PER_ATOM = 1000 + int(1500 * TOKEN_SCALE)   # prompts, plus analogies + explanation at TOKEN_SCALE
+BUDGET_WINDOW = 3600.0
+PREFETCH_DEADLINE = 45.0
+
+
+class PrefetchCancelled(Cancelled):
+    pass
+
+
+class Prefetcher:
+    def __init__(self, workers: int = WORKERS, token_budget: int = TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._spent: Deque[Tuple[float, int]] = deque()
+        self._tasks: Dict[str, List[Tuple[str, Future, threading.Event]]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"scheduled": 0, "completed": 0, "cancelled": 0, "over_budget": 0}
+
+    def _reserve(self, tokens: int) -> bool:
+        """Charge `tokens` against the rolling hourly budget if it fits (lock held)."""
+        now = time.monotonic()
+        while self._spent and now - self._spent[0][0] > BUDGET_WINDOW:
+            self._spent.popleft()
+        if sum(t for _, t in self._spent) + tokens > self.token_budget:
+            return False
+        self._spent.append((now, tokens))
+        return True
+
+    def schedule(self, owner: str, agent, atoms: List[str], max_atoms: int = MAX_ATOMS,
+                 **explain_kwargs) -> int:
+        """
+        Prefetch explanations for up to max_atoms atoms on behalf of `owner` (a chat session).
+        explain_kwargs are passed to explain_concept (profile, target_lang, use_web, latency_budget...).
+        Replaces the owner's earlier prefetches. Returns how many were scheduled.
+        """
+        self.cancel(owner)
+        scheduled = []
+        with self._lock:
+            for atom in [a for a in atoms if a and a.strip()][:max_atoms]:
+                if not self._reserve(EST_TOKENS_PER_ATOM):
+                    self._stats["over_budget"] += 1
+                    break
+                stop = threading.Event()
+                fut = self._pool.submit(self._run, agent, atom, stop, explain_kwargs)
+                scheduled.append((atom, fut, stop))
+            self._tasks[owner] = scheduled
+            self._stats["scheduled"] += len(scheduled)
+        return len(scheduled)
+
+    def _run(self, agent, atom: str, stop: threading.Event, explain_kwargs: dict):
+        if stop.is_set():
+            return None
+
+        def check(_event):
+            # called on this thread while the pipeline runs; raising aborts it
+            if stop.is_set():
+                raise PrefetchCancelled(atom)
+
+        result = agent.explain_concept(atom, deadline=PREFETCH_DEADLINE, on_event=check, stream=False,
+                                       token_scale=TOKEN_SCALE, **explain_kwargs)
+        with self._lock:
+            self._stats["cancelled" if stop.is_set() else "completed"] += 1
+        return result
+
+    def cancel(self, owner: str, keep: Optional[str] = None):
+        """Stop the owner's prefetches, except one for `keep` (the atom the user just asked about)."""
+        keep = (keep or "").strip().lower()
+        with self._lock:
+            tasks = self._tasks.pop(owner, [])
+            kept = []
+            for atom, fut, stop in tasks:
+                if keep and atom.strip().lower() == keep:
+                    kept.append((atom, fut, stop))
+                    continue
+                if fut.cancel():
+                    self._stats["cancelled"] += 1
+                else:
+                    stop.set()
+            if kept:
+                self._tasks[owner] = kept
+
+    def pending(self, owner: str) -> List[str]:
+        with self._lock:
+            return [atom for atom, fut, _ in self._tasks.get(owner, []) if not fut.done()]
+
+    def count(self, running: bool) -> int:
+        """Prefetches running now (running=True) or still waiting for a worker."""
+        with self._lock:
+            return sum(1 for tasks in self._tasks.values() for _, fut, _ in tasks
+                       if not fut.done() and fut.running() == running)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            spent = sum(t for _, t in self._spent)
+            return dict(self._stats, budget_used=spent, budget=self.token_budget)
+
+
+# process-wide prefetcher shared by all sessions
+prefetcher = Prefetcher()
+QUEUE_DEPTH.set_function(lambda: prefetcher.count(running=False), queue="prefetch")
+IN_FLIGHT.set_function(lambda: prefetcher.count(running=True), queue="prefetch")
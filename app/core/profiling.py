@@ -0,0 +1,263 @@
+# app/core/profiling.py
+"""
+On-demand sampling profiler for single requests (explain, upload, Streamlit rerun, API call).
+
+When profiling is on for a request, a background thread samples the stacks of the
+request's threads every PROFILE_INTERVAL_MS - the calling thread plus the pipeline
+step and hedged-request threads working for it (they attach through attached()).
+When the request ends the samples are written as a speedscope file
+(https://www.speedscope.app, one sampled profile per thread) to storage/profiles/,
+named after the duration, kind and request id:
+
+    0012345ms_explain_3f9c2a1b7d4e.speedscope.json
+
+Only the PROFILE_KEEP slowest files are kept. breakdown() splits the sampled time
+into PDF/OCR, storage/JSON, HTML parsing, network, waiting and other Python code,
+by the innermost frame that is either library code of one of those kinds or the
+app's own code.
+
+Switching it on:
+    TUTOR_PROFILE=explain,upload    profile every request of these kinds ("all" / "1": every kind)
+    ?profile=1                      Streamlit: profile this session's reruns (?profile=explain: explains only)
+    POST /explain?profile=1         API: profile this request (X-Request-Id tags the file)
+
+Off, a profiled() block costs one set lookup and a contextvar read - no thread,
+no sampling.
+
+Usage:
+    with profiled("explain", request_id) as prof:
+        ...
+    prof.path, prof.breakdown()     # None when profiling was off for this request
+
+Config (env):
+    TUTOR_PROFILE          kinds profiled for every request: rerun, upload, explain, api (default none)
+    PROFILE_INTERVAL_MS    sampling interval (default 5)
+    PROFILE_KEEP           slowest profiles kept on disk (default 20)
+"""
+
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from core.storage import STORAGE_DIR
+
+KINDS = ("rerun", "upload", "explain", "api")
+APP_DIR = str(Path(__file__).resolve().parent.parent).replace("\\", "/")
+PROFILE_DIR = STORAGE_DIR / "profiles"
+INTERVAL = float(os.environ.get("PROFILE_INTERVAL_MS", "5")) / 1000
+KEEP = int(os.environ.get("PROFILE_KEEP", "20"))
+MAX_DEPTH = 200
+
+# where the sampled time went: first matching frame from the leaf up
+CATEGORIES = (
+    ("pdf_ocr", ("fitz", "pymupdf", "pytesseract", "PIL", "pypdf")),
+    ("html", ("bs4", "html/parser", "lxml", "html5lib")),
+    ("storage", ("json/", "sqlite3", "core/storage.py", "core/response_cache.py", "core/usage.py",
+                 "core/semantic_cache.py", "pickle")),
+    ("network", ("socket.py", "ssl.py", "http/client.py", "httpx", "httpcore", "urllib3", "requests/",
+                 "openai/", "serpapi", "duckduckgo")),
+    ("waiting", ("threading.py", "concurrent/futures", "queue.py", "selectors.py")),
+)
+
+
+def parse_kinds(value: Optional[str]) -> Set[str]:
+    """"explain,upload" -> {"explain", "upload"}; "1" / "all" / "true" -> every kind."""
+    names = {v.strip().lower() for v in (value or "").split(",") if v.strip()}
+    if names & {"1", "all", "true", "yes"}:
+        return set(KINDS)
+    return names & set(KINDS)
+
+ENV_KINDS = parse_kinds(os.environ.get("TUTOR_PROFILE"))
+
+_active: contextvars.ContextVar[Optional["Profile"]] = contextvars.ContextVar("profile", default=None)
+_requested: contextvars.ContextVar[frozenset] = contextvars.ContextVar("profile_kinds", default=frozenset())
+
+
+class Profile:
+    """Stack samples of one request's threads."""
+
+    def __init__(self, kind: str, request_id: str):
+        self.kind, self.request_id = kind, request_id
+        self.path: Optional[Path] = None
+        self.duration = 0.0
+        self._started = time.perf_counter()
+        self._frames: Dict[Tuple[str, str, int], int] = {}
+        self._threads: Dict[int, str] = {}                            # attached now
+        self._samples: Dict[int, List[Tuple[Tuple[int, ...], float]]] = {}
+        self._names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def attach(self, ident: int, name: str):
+        with self._lock:
+            self._threads[ident] = name
+            self._names.setdefault(ident, name)
+            self._samples.setdefault(ident, [])
+
+    def detach(self, ident: int):
+        with self._lock:
+            self._threads.pop(ident, None)
+
+    def sample(self, frames: Dict[int, object], weight: float):
+        with self._lock:
+            for ident in self._threads:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_DEPTH:
+                    code = frame.f_code
+                    key = (getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno)
+                    stack.append(self._frames.setdefault(key, len(self._frames)))
+                    frame = frame.f_back
+                stack.reverse()  # speedscope wants root first
+                self._samples[ident].append((tuple(stack), weight))
+
+    def breakdown(self) -> Dict[str, float]:
+        """Sampled seconds per category (summed over threads)."""
+        files = {index: key[1].replace("\\", "/") for key, index in self._frames.items()}
+        totals: Dict[str, float] = {}
+        with self._lock:
+            samples = [s for per_thread in self._samples.values() for s in per_thread]
+        for stack, weight in samples:
+            category = "python"
+            for index in reversed(stack):
+                found = next((name for name, needles in CATEGORIES
+                              if any(n in files[index] for n in needles)), None)
+                if found or files[index].startswith(APP_DIR):
+                    category = found or "python"  # our own code doing the work
+                    break
+            totals[category] = totals.get(category, 0.0) + weight
+        return {k: round(v, 3) for k, v in sorted(totals.items(), key=lambda kv: -kv[1])}
+
+    def to_speedscope(self) -> Dict:
+        frames = [None] * len(self._frames)
+        for (name, filename, line), index in self._frames.items():
+            frames[index] = {"name": name, "file": filename, "line": line}
+        profiles = []
+        with self._lock:
+            for ident, samples in self._samples.items():
+                if not samples:
+                    continue
+                total = sum(w for _, w in samples) * 1000
+                profiles.append({"type": "sampled", "name": self._names[ident], "unit": "milliseconds",
+                                 "startValue": 0, "endValue": round(total, 3),
+                                 "samples": [list(s) for s, _ in samples],
+                                 "weights": [round(w * 1000, 3) for _, w in samples]})
+        return {"$schema": "https://www.speedscope.app/file-format-schema.json",
+                "name": f"{self.kind} {self.request_id} ({self.duration:.2f}s)",
+                "exporter": "contextual-tutor-x", "activeProfileIndex": 0,
+                "shared": {"frames": frames}, "profiles": profiles}
+
+    def save(self, directory: Path = PROFILE_DIR, keep: int = KEEP) -> Optional[Path]:
+        """Write the speedscope file, then drop all but the `keep` slowest profiles."""
+        directory.mkdir(parents=True, exist_ok=True)
+        safe_id = "".join(c for c in self.request_id if c.isalnum() or c in "-_")[:40] or "request"
+        path = directory / f"{int(self.duration * 1000):07d}ms_{self.kind}_{safe_id}.speedscope.json"
+        path.write_text(json.dumps(self.to_speedscope(), separators=(",", ":")), encoding="utf-8")
+        # zero-padded durations sort by name; anything past the slowest `keep` goes
+        for old in sorted(directory.glob("*.speedscope.json"), reverse=True)[keep:]:
+            old.unlink(missing_ok=True)
+        self.path = path if path.exists() else None
+        return self.path
+
+
+class _Sampler:
+    """One daemon thread sampling every active profile; it exits when none are left."""
+
+    def __init__(self, interval: float = INTERVAL):
+        self.interval = interval
+        self._profiles: Set[Profile] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, profile: Profile):
+        with self._lock:
+            self._profiles.add(profile)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="profiler", daemon=True)
+                self._thread.start()
+
+    def remove(self, profile: Profile):
+        with self._lock:
+            self._profiles.discard(profile)
+
+    def _loop(self):
+        last = time.perf_counter()
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            with self._lock:
+                profiles = list(self._profiles)
+                if not profiles:
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            for profile in profiles:
+                profile.sample(frames, now - last)
+            last = now
+
+_sampler = _Sampler()
+
+
+def enabled_for(kind: str) -> bool:
+    return kind in ENV_KINDS or kind in _requested.get()
+
+@contextmanager
+def requested(kinds: Set[str]) -> Iterator[None]:
+    """Profile these kinds for work started inside the block (e.g. from a ?profile= parameter)."""
+    token = _requested.set(frozenset(_requested.get() | set(kinds)))
+    try:
+        yield
+    finally:
+        _requested.reset(token)
+
+@contextmanager
+def profiled(kind: str, request_id: Optional[str] = None, enabled: bool = False) -> Iterator[Optional[Profile]]:
+    """
+    Sample the block (and threads attached to it) if profiling is on for `kind` or
+    `enabled`; yields the Profile, or None. Inside an active profile it yields that one.
+    """
+    outer = _active.get()
+    if outer is not None or not (enabled or enabled_for(kind)):
+        yield outer
+        return
+    profile = Profile(kind, request_id or uuid.uuid4().hex[:12])
+    token = _active.set(profile)
+    ident = threading.get_ident()
+    profile.attach(ident, threading.current_thread().name)
+    _sampler.add(profile)
+    try:
+        yield profile
+    finally:
+        _sampler.remove(profile)
+        profile.detach(ident)
+        _active.reset(token)
+        profile.duration = time.perf_counter() - profile._started
+        try:
+            profile.save()
+        except OSError as e:
+            print(f"Profile {profile.request_id} not written: {e}")
+
+def attached(fn: Callable) -> Callable:
+    """fn, sampled as part of the current profile when called on another thread (call via ctx.run)."""
+    if _active.get() is None:
+        return fn
+
+    def run(*args, **kwargs):
+        profile = _active.get()
+        if profile is None:
+            return fn(*args, **kwargs)
+        ident = threading.get_ident()
+        profile.attach(ident, threading.current_thread().name)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.detach(ident)
+    return run
@@ -0,0 +1,239 @@
+# app/core/ratelimit.py
+"""
+Cross-process limiter for upstream APIs (OpenAI, SerpAPI, DuckDuckGo).
+
+Every Streamlit worker, the API server and the batch jobs share one SQLite file
+(storage/ratelimit.db), so together they stay within each provider's limits:
+
+    requests per minute   token bucket refilled continuously
+    tokens per minute     token bucket charged with the estimate, settled with real usage
+    concurrency           calls in flight across all processes, adjusted AIMD-style:
+                          +1/limit per call that returns within the latency target,
+                          x0.5 on a 429, x0.9 on a slow call
+
+A 429 also pauses the provider for every process (Retry-After when the error says
+so) and drains its request bucket, so workers back off together instead of all
+retrying at once. Throttled calls are retried here while the caller's time allows.
+
+Usage:
+    text = api_limiter.call("openai", lambda slot: request(slot), tokens=900, timeout=20)
+    # inside request(): use slot.timeout, then set slot.tokens = response.usage.total_tokens
+
+Config (env):
+    API_LIMITER    "0" disables the limiter (default on)
+    RATE_LIMITS    JSON {"provider": {"rpm", "tpm", "max_concurrency", "latency_target"}}
+                   merged over the defaults below (tpm 0 = no token budget)
+"""
+
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from core.storage import STORAGE_DIR
+
+LIMITER_ENABLED = os.environ.get("API_LIMITER", "1").lower() not in ("0", "false", "no")
+DB_FILE = STORAGE_DIR / "ratelimit.db"
+
+LIMITS: Dict[str, Dict[str, float]] = {
+    "openai": {"rpm": 500, "tpm": 200000, "max_concurrency": 32, "latency_target": 30.0},
+    "openai_images": {"rpm": 7, "tpm": 0, "max_concurrency": 2, "latency_target": 60.0},
+    "serpapi": {"rpm": 100, "tpm": 0, "max_concurrency": 8, "latency_target": 8.0},
+    "duckduckgo": {"rpm": 20, "tpm": 0, "max_concurrency": 2, "latency_target": 8.0},
+    "default": {"rpm": 600, "tpm": 0, "max_concurrency": 16, "latency_target": 30.0},
+}
+for _name, _limits in json.loads(os.environ.get("RATE_LIMITS", "{}")).items():
+    LIMITS[_name] = {**LIMITS.get(_name, LIMITS["default"]), **_limits}
+
+MIN_CONCURRENCY = 1.0
+START_CONCURRENCY = 4.0
+LEASE_SECONDS = 120.0    # a slot held longer than this (crashed process) is reclaimed
+MAX_POLL = 0.25
+THROTTLE_PAUSE = 2.0     # pause after a 429 without Retry-After
+MAX_THROTTLE_RETRIES = 2
+
+_THROTTLED = re.compile(r"\b429\b|rate.?limit|too many requests", re.IGNORECASE)
+_RETRY_AFTER = re.compile(r"(?:retry|try again) (?:after|in) (\d+(?:\.\d+)?)\s*(ms|s)", re.IGNORECASE)
+
+
+class RateLimited(RuntimeError):
+    """No slot became free before the caller's deadline."""
+
+
+def is_throttle(error: BaseException) -> bool:
+    return getattr(error, "status_code", None) == 429 or bool(_THROTTLED.search(str(error)))
+
+def retry_after(error: BaseException) -> float:
+    m = _RETRY_AFTER.search(str(error))
+    if not m:
+        return THROTTLE_PAUSE
+    return float(m.group(1)) / (1000 if m.group(2).lower() == "ms" else 1)
+
+
+class Slot:
+    """One admitted call; set .tokens to the real usage once known."""
+
+    def __init__(self, lease: Optional[str], provider: str, tokens: int):
+        self.lease, self.provider, self.estimate, self.tokens = lease, provider, tokens, tokens
+        self.timeout: Optional[float] = None  # what is left of the caller's timeout once admitted
+
+
+class ApiLimiter:
+    def __init__(self, path=DB_FILE, limits: Dict[str, Dict[str, float]] = LIMITS, enabled: bool = LIMITER_ENABLED):
+        self.path = path
+        self.limits = limits
+        self.enabled = enabled
+        self._local = threading.local()
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS providers (
+                name TEXT PRIMARY KEY, requests REAL, tokens REAL, refilled REAL, concurrency REAL,
+                paused_until REAL, calls INTEGER, throttles INTEGER)""")
+            conn.execute("CREATE TABLE IF NOT EXISTS leases (id TEXT PRIMARY KEY, provider TEXT, expires REAL)")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._db()
+        conn.execute("BEGIN IMMEDIATE")  # one process at a time updates the buckets
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _limits(self, provider: str) -> Dict[str, float]:
+        return self.limits.get(provider, self.limits["default"])
+
+    def _state(self, conn: sqlite3.Connection, provider: str, now: float) -> Dict[str, float]:
+        """Provider row with its buckets refilled up to `now` (transaction held)."""
+        lim = self._limits(provider)
+        row = conn.execute("SELECT requests, tokens, refilled, concurrency, paused_until, calls, throttles "
+                           "FROM providers WHERE name = ?", (provider,)).fetchone()
+        if row is None:
+            state = {"requests": lim["rpm"], "tokens": lim["tpm"], "refilled": now,
+                     "concurrency": min(START_CONCURRENCY, lim["max_concurrency"]),
+                     "paused_until": 0.0, "calls": 0, "throttles": 0}
+        else:
+            state = dict(zip(("requests", "tokens", "refilled", "concurrency", "paused_until", "calls", "throttles"), row))
+        elapsed = max(0.0, now - state["refilled"])
+        state["requests"] = min(lim["rpm"], state["requests"] + elapsed * lim["rpm"] / 60)
+        state["tokens"] = min(lim["tpm"], state["tokens"] + elapsed * lim["tpm"] / 60)
+        state["refilled"] = now
+        return state
+
+    def _save(self, conn: sqlite3.Connection, provider: str, state: Dict[str, float]):
+        conn.execute("INSERT OR REPLACE INTO providers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                     (provider, state["requests"], state["tokens"], state["refilled"], state["concurrency"],
+                      state["paused_until"], state["calls"], state["throttles"]))
+
+    def acquire(self, provider: str, tokens: int = 0, timeout: Optional[float] = None) -> Slot:
+        """Wait for a request slot, raising RateLimited if none is free within `timeout` seconds."""
+        if not self.enabled:
+            return Slot(None, provider, tokens)
+        lim = self._limits(provider)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        need_tokens = min(tokens, lim["tpm"]) if lim["tpm"] else 0  # huge prompts wait for a full bucket
+        while True:
+            now = time.time()
+            with self._transaction() as conn:
+                state = self._state(conn, provider, now)
+                conn.execute("DELETE FROM leases WHERE expires < ?", (now,))
+                inflight = conn.execute("SELECT COUNT(*) FROM leases WHERE provider = ?", (provider,)).fetchone()[0]
+                waits = [state["paused_until"] - now]
+                if inflight >= int(state["concurrency"]):
+                    waits.append(MAX_POLL)
+                if state["requests"] < 1:
+                    waits.append((1 - state["requests"]) * 60 / lim["rpm"])
+                if need_tokens and state["tokens"] < need_tokens:
+                    waits.append((need_tokens - state["tokens"]) * 60 / lim["tpm"])
+                wait = max(waits)
+                if wait <= 0:
+                    lease = uuid.uuid4().hex
+                    state["requests"] -= 1
+                    state["tokens"] -= need_tokens
+                    state["calls"] += 1
+                    conn.execute("INSERT INTO leases VALUES (?, ?, ?)", (lease, provider, now + LEASE_SECONDS))
+                self._save(conn, provider, state)
+            if wait <= 0:
+                return Slot(lease, provider, need_tokens)
+            if deadline is not None and time.monotonic() + min(wait, MAX_POLL) > deadline:
+                raise RateLimited(f"{provider}: no request slot within {timeout:.1f}s")
+            time.sleep(min(wait, MAX_POLL) * random.uniform(0.8, 1.2))  # jitter: don't wake in lockstep
+
+    def release(self, slot: Slot, latency: float, error: Optional[BaseException] = None):
+        """Free the slot and adapt the provider's concurrency to how the call went."""
+        if slot.lease is None:
+            return
+        lim = self._limits(slot.provider)
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM leases WHERE id = ?", (slot.lease,))
+            state = self._state(conn, slot.provider, now)
+            if lim["tpm"]:
+                # settle the estimate against what the call really used
+                state["tokens"] = min(lim["tpm"], state["tokens"] + slot.estimate - slot.tokens)
+            if error is not None and is_throttle(error):
+                state["throttles"] += 1
+                state["concurrency"] = max(MIN_CONCURRENCY, state["concurrency"] / 2)
+                state["paused_until"] = max(state["paused_until"], now + retry_after(error))
+                state["requests"] = 0.0
+            elif latency > lim["latency_target"]:
+                state["concurrency"] = max(MIN_CONCURRENCY, state["concurrency"] * 0.9)
+            elif error is None:
+                state["concurrency"] = min(lim["max_concurrency"], state["concurrency"] + 1 / state["concurrency"])
+            self._save(conn, slot.provider, state)
+
+    def call(self, provider: str, fn: Callable[[Slot], Any], tokens: int = 0,
+             timeout: Optional[float] = None) -> Any:
+        """fn(slot) within a slot; throttled calls are retried once the provider's pause is over."""
+        started = time.monotonic()
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            remaining = None if timeout is None else timeout - (time.monotonic() - started)
+            slot = self.acquire(provider, tokens, remaining)
+            if timeout is not None:
+                slot.timeout = max(1.0, timeout - (time.monotonic() - started))
+            t0 = time.monotonic()
+            try:
+                result = fn(slot)
+            except Exception as e:
+                self.release(slot, time.monotonic() - t0, e)
+                if not self.enabled or not is_throttle(e) or attempt == MAX_THROTTLE_RETRIES:
+                    raise
+                continue
+            self.release(slot, time.monotonic() - t0)
+            return result
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        if not self.enabled:
+            return {}
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT name FROM providers").fetchall()
+            out = {}
+            for (name,) in rows:
+                state = self._state(conn, name, now)
+                inflight = conn.execute("SELECT COUNT(*) FROM leases WHERE provider = ? AND expires >= ?",
+                                        (name, now)).fetchone()[0]
+                out[name] = {"concurrency": round(state["concurrency"], 2), "inflight": inflight,
+                             "requests_left": round(state["requests"], 1), "tokens_left": round(state["tokens"]),
+                             "paused_s": round(max(0.0, state["paused_until"] - now), 1),
+                             "calls": state["calls"], "throttles": state["throttles"]}
+        return out
+
+
+# shared by every process using this storage directory
+api_limiter = ApiLimiter()
@@ -0,0 +1,199 @@
+# app/core/records.py
+"""
+Typed records for explain results, and a compact binary codec for storing them.
+
+explain_concept() still returns a plain dict (the API and UI consume it as JSON);
+what is kept - sessions, the semantic answer cache, precomputed answers - is an
+ExplainRecord built from it: dataclasses for the result, its steps and sources,
+with the learner reduced to role / age group. Rendered markdown is never stored;
+markdown() rebuilds it from the fields.
+
+Stored form: pack() turns a record into positional lists (no repeated key names),
+dumps() encodes any such value as msgpack (msgpack or ormsgpack, whichever is
+installed) behind a one-byte tag, or as compact JSON when neither is. loads()
+reads both, so files stay readable when the codec changes.
+
+Usage:
+    record = ExplainRecord.from_result(result)
+    blob = pack_record(record)                  # bytes
+    unpack_record(blob).markdown()
+    record.to_dict()                            # JSON export (result-shaped)
+"""
+
+import base64
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from core.lazy import optional_import
+
+RECORD_VERSION = 1
+_MSGPACK, _JSON = b"M", b"J"
+
+
+@dataclass
+class Source:
+    title: str
+    url: str
+
+
+@dataclass
+class StepRecord:
+    step: str
+    status: str
+    duration_ms: Optional[int] = None
+    reason: Optional[str] = None
+    error: Optional[str] = None
+    notes: Dict[str, Any] = field(default_factory=dict)  # step-specific fields (method, count, ...)
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "StepRecord":
+        notes = {k: v for k, v in d.items() if k not in ("step", "status", "duration_ms", "reason", "error")}
+        return cls(d.get("step", ""), d.get("status", ""), d.get("duration_ms"), d.get("reason"),
+                   d.get("error"), notes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        d: Dict[str, Any] = {"step": self.step, "status": self.status}
+        for key in ("duration_ms", "reason", "error"):
+            if getattr(self, key) is not None:
+                d[key] = getattr(self, key)
+        d.update(self.notes)
+        return d
+
+
+@dataclass
+class ExplainRecord:
+    concept: str
+    language: str = "English"
+    timestamp: str = ""
+    role: str = ""
+    age_group: str = ""
+    explanation: str = ""
+    atoms: List[str] = field(default_factory=list)
+    analogies: str = ""
+    sources: List[Source] = field(default_factory=list)
+    steps: List[StepRecord] = field(default_factory=list)
+    confidence: int = 0
+    degradations: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @classmethod
+    def from_result(cls, result: Dict[str, Any]) -> "ExplainRecord":
+        profile = result.get("profile") or {}
+        return cls(
+            concept=result.get("concept", ""),
+            language=result.get("language", "English"),
+            timestamp=result.get("timestamp", ""),
+            role=profile.get("role", ""),
+            age_group=profile.get("age_group", ""),
+            explanation=result.get("explanation", ""),
+            atoms=list(result.get("atoms") or []),
+            analogies=result.get("analogies", ""),
+            sources=[Source(s.get("title", ""), s.get("url", "")) for s in result.get("sources") or []],
+            steps=[StepRecord.from_dict(s) for s in result.get("steps") or []],
+            confidence=int(result.get("confidence") or 0),
+            degradations=list(result.get("degradations") or []),
+            error=result.get("error"),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Result-shaped dict, as explain_concept returns it (JSON export)."""
+        d: Dict[str, Any] = {
+            "concept": self.concept, "language": self.language, "timestamp": self.timestamp,
+            "profile": {"role": self.role, "age_group": self.age_group},
+            "explanation": self.explanation, "atoms": list(self.atoms), "analogies": self.analogies,
+            "sources": [{"title": s.title, "url": s.url} for s in self.sources],
+            "steps": [s.to_dict() for s in self.steps], "confidence": self.confidence,
+        }
+        if self.degradations:
+            d["degradations"] = list(self.degradations)
+        if self.error:
+            d["error"] = self.error
+        return d
+
+    def markdown(self) -> str:
+        """The chat markdown for this result."""
+        return f"""
+**Concept:** {self.concept or 'N/A'}
+**Language:** {self.language}
+
+**Summary:**
+{self.explanation or 'No explanation'}
+
+**Atomic Concepts:**
+{chr(10).join(['• ' + atom for atom in self.atoms])}
+
+**Analogies:**
+{self.analogies or 'No analogies'}
+
+**Sources:**
+{chr(10).join([f"• [{s.title}]({s.url})" for s in self.sources])}
+
+**Confidence:** {self.confidence}%
+"""
+
+    def pack(self) -> list:
+        """Positional form for dumps(); unpack() is the inverse."""
+        return [RECORD_VERSION, self.concept, self.language, self.timestamp, self.role, self.age_group,
+                self.explanation, self.atoms, self.analogies,
+                [[s.title, s.url] for s in self.sources],
+                [[s.step, s.status, s.duration_ms, s.reason, s.error, s.notes] for s in self.steps],
+                self.confidence, self.degradations, self.error]
+
+    @classmethod
+    def unpack(cls, packed: list) -> "ExplainRecord":
+        if not packed or packed[0] != RECORD_VERSION:
+            raise ValueError(f"Unsupported record version: {packed[0] if packed else None}")
+        (_, concept, language, timestamp, role, age_group, explanation, atoms, analogies,
+         sources, steps, confidence, degradations, error) = packed
+        return cls(concept, language, timestamp, role, age_group, explanation, list(atoms), analogies,
+                   [Source(*s) for s in sources], [StepRecord(*s) for s in steps],
+                   confidence, list(degradations), error)
+
+
+# ---------- codec ----------
+
+def _msgpack():
+    """(packb, unpackb) of an installed msgpack implementation, or None."""
+    msgpack = optional_import("msgpack")
+    if msgpack is not None:
+        return (lambda obj: msgpack.packb(obj, use_bin_type=True),
+                lambda raw: msgpack.unpackb(raw, raw=False, strict_map_key=False))
+    ormsgpack = optional_import("ormsgpack")
+    if ormsgpack is not None:
+        return ormsgpack.packb, ormsgpack.unpackb
+    return None
+
+def _json_default(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    raise TypeError(f"Not serializable: {type(value).__name__}")
+
+def _json_hook(d: Dict):
+    return base64.b64decode(d["__bytes__"]) if len(d) == 1 and "__bytes__" in d else d
+
+def dumps(value: Any) -> bytes:
+    """msgpack when available, else compact JSON; bytes values survive either way."""
+    codec = _msgpack()
+    if codec is not None:
+        return _MSGPACK + codec[0](value)
+    return _JSON + json.dumps(value, ensure_ascii=False, separators=(",", ":"),
+                              default=_json_default).encode("utf-8")
+
+def loads(data: bytes) -> Any:
+    tag, body = data[:1], data[1:]
+    if tag == _MSGPACK:
+        codec = _msgpack()
+        if codec is None:
+            raise RuntimeError("Data was stored with msgpack; install `msgpack` to read it.")
+        return codec[1](body)
+    if tag == _JSON:
+        return json.loads(body.decode("utf-8"), object_hook=_json_hook)
+    raise ValueError("Unknown encoding")
+
+def pack_record(record: ExplainRecord) -> bytes:
+    return dumps(record.pack())
+
+def unpack_record(value) -> ExplainRecord:
+    """From pack_record() bytes or a pack() list (as kept in JSON caches)."""
+    return ExplainRecord.unpack(loads(value) if isinstance(value, (bytes, bytearray)) else value)
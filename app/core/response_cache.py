@@ -0,0 +1,208 @@
+# app/core/response_cache.py
+"""
+File-backed cache of pipeline step outputs (search results, decompositions,
+analogies, explanations, translations), shared by the UI, the batch/precompute
+jobs and the API.
+
+Usage:
+    from core.response_cache import response_cache
+    atoms = response_cache.get_or_compute("decomposition", [concept, 5], lambda: decompose(concept))
+    response_cache.get("analogies", key_parts, max_age=7 * 86400)
+    response_cache.set("translation", [text_hash, "Hindi"], translated)
+
+Keys are hashed from (kind, key_parts). Entries older than the kind's TTL are
+treated as missing, and dropped from the file whenever it is written, along with
+the oldest entries beyond MAX_ENTRIES. Writes are batched: the file is rewritten
+at most every FLUSH_INTERVAL seconds, and a write inside the interval schedules a
+flush at its end, so the last writes of a burst reach other processes promptly
+(and on exit / flush()).
+
+Config (env):
+    RESPONSE_CACHE_TTL_DAYS   default TTL for generated content (default 30)
+    SEARCH_CACHE_TTL_DAYS     TTL for web search results, the agent's too (default 3)
+    RESPONSE_CACHE_MAX_ENTRIES  entries kept, newest first (default 5000)
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from core.metrics import CACHE_REQUESTS, STORAGE_WRITE_SECONDS
+from core.storage import STORAGE_DIR
+
+DAY = 86400.0
+DEFAULT_TTL = float(os.environ.get("RESPONSE_CACHE_TTL_DAYS", "30")) * DAY
+SEARCH_TTL = float(os.environ.get("SEARCH_CACHE_TTL_DAYS", "3")) * DAY
+TTL_BY_KIND = {"web_search": SEARCH_TTL, "agent_search": SEARCH_TTL}
+MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+FLUSH_INTERVAL = 2.0
+CACHE_FILE = STORAGE_DIR / "response_cache.json"
+
+
+def cache_key(kind: str, key_parts: Any) -> str:
+    raw = json.dumps([kind, key_parts], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path: Path):
+        self.path = path
+        self._entries: Optional[Dict[str, Dict]] = None
+        self._stamp = None
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._last_flush = 0.0
+        self._timer: Optional[threading.Timer] = None
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._inflight: Dict[str, list] = {}  # key -> [lock, callers using it]
+
+    def _disk_stamp(self):
+        try:
+            st = self.path.stat()
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _load(self) -> Dict[str, Dict]:
+        """Entries in memory, re-read when another process (e.g. precompute) rewrote the file."""
+        stamp = self._disk_stamp()
+        if self._entries is None or stamp != self._stamp:
+            try:
+                disk = json.loads(self.path.read_text(encoding="utf-8"))
+            except Exception:
+                disk = {}
+            if self._dirty and self._entries:
+                # keep our unflushed writes; newest entry wins
+                for k, e in self._entries.items():
+                    if k not in disk or disk[k]["created"] < e["created"]:
+                        disk[k] = e
+            self._entries, self._stamp = disk, stamp
+        return self._entries
+
+    def _count(self, kind: str, outcome: str):
+        self._stats.setdefault(kind, {"hits": 0, "misses": 0})[outcome] += 1
+        CACHE_REQUESTS.labels(cache="response", kind=kind, outcome="hit" if outcome == "hits" else "miss").inc()
+
+    def age(self, kind: str, key_parts: Any) -> Optional[float]:
+        """Seconds since the entry was written, or None when absent."""
+        with self._lock:
+            entry = self._load().get(cache_key(kind, key_parts))
+            return time.time() - entry["created"] if entry else None
+
+    def get(self, kind: str, key_parts: Any, max_age: Optional[float] = None,
+            not_before: Optional[float] = None) -> Optional[Any]:
+        """Cached value, or None if absent, older than max_age or written before `not_before` (epoch)."""
+        max_age = TTL_BY_KIND.get(kind, DEFAULT_TTL) if max_age is None else max_age
+        with self._lock:
+            entry = self._load().get(cache_key(kind, key_parts))
+            if (entry is None or time.time() - entry["created"] > max_age
+                    or (not_before is not None and entry["created"] < not_before)):
+                self._count(kind, "misses")
+                return None
+            self._count(kind, "hits")
+            return entry["value"]
+
+    def set(self, kind: str, key_parts: Any, value: Any):
+        with self._lock:
+            self._load()[cache_key(kind, key_parts)] = {"kind": kind, "created": time.time(), "value": value}
+            self._dirty = True
+            wait = FLUSH_INTERVAL - (time.monotonic() - self._last_flush)
+            if wait <= 0:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(wait, self._deferred_flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _deferred_flush(self):
+        with self._lock:
+            self._timer = None
+            try:
+                self.flush()
+            except Exception as e:
+                print("Response cache flush error:", e)
+
+    def get_or_compute(self, kind: str, key_parts: Any, compute: Callable[[], Any],
+                       not_before: Optional[float] = None,
+                       cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Cached value, or compute() and store it (unless `cacheable` rejects it, e.g. error text).
+        Entries written before `not_before` are recomputed. Concurrent callers for the same key
+        wait for a single computation instead of all calling compute().
+        """
+        value = self.get(kind, key_parts, not_before=not_before)
+        if value is not None:
+            return value
+        key = cache_key(kind, key_parts)
+        with self._lock:
+            inflight = self._inflight.setdefault(key, [threading.Lock(), 0])
+            inflight[1] += 1
+        try:
+            with inflight[0]:
+                value = self.get(kind, key_parts, not_before=not_before)
+                if value is not None:
+                    return value
+                value = compute()
+                if value is not None and (cacheable is None or cacheable(value)):
+                    self.set(kind, key_parts, value)
+                return value
+        finally:
+            with self._lock:
+                inflight[1] -= 1
+                if not inflight[1]:  # last one out; anyone still waiting keeps the same lock
+                    self._inflight.pop(key, None)
+
+    def values(self, kind: str) -> List[Any]:
+        with self._lock:
+            return [e["value"] for e in self._load().values() if e.get("kind") == kind]
+
+    def _evict(self, entries: Dict[str, Dict]) -> int:
+        """Drop expired entries, then the oldest beyond MAX_ENTRIES (lock held). Returns how many."""
+        now = time.time()
+        dropped = [k for k, e in entries.items()
+                   if now - e["created"] > TTL_BY_KIND.get(e.get("kind"), DEFAULT_TTL)]
+        for k in dropped:
+            del entries[k]
+        overflow = len(entries) - MAX_ENTRIES
+        if overflow > 0:
+            oldest = sorted(entries, key=lambda k: entries[k]["created"])[:overflow]
+            for k in oldest:
+                del entries[k]
+            dropped += oldest
+        return len(dropped)
+
+    def prune(self) -> int:
+        """Drop expired and excess entries now. Returns how many were removed."""
+        with self._lock:
+            removed = self._evict(self._load())
+            if removed:
+                self._dirty = True
+                self.flush()
+            return removed
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty or self._entries is None:
+                return
+            entries = self._load()  # merge anything written by other processes first
+            self._evict(entries)
+            with STORAGE_WRITE_SECONDS.labels(store="response_cache").time():
+                tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+                tmp.write_text(json.dumps(entries, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+                os.replace(tmp, self.path)
+            self._stamp = self._disk_stamp()
+            self._dirty = False
+            self._last_flush = time.monotonic()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {k: dict(v) for k, v in self._stats.items()}
+
+# singleton instance
+response_cache = ResponseCache(CACHE_FILE)
+atexit.register(response_cache.flush)
@@ -0,0 +1,144 @@
+# app/core/routing.py
+"""
+Per-step model routing with latency- and error-aware fallback.
+
+Each pipeline step has an ordered list of candidate models: cheap steps
+(decomposition, translation, analogies) go to small fast models, synthesis to a
+stronger one. For every call the router orders the candidates by health:
+
+    - a model whose recent calls mostly failed is benched for COOLDOWN seconds
+    - a model whose p75 latency for this step is SLOW_FACTOR x that of a later
+      candidate is moved behind it (both need MIN_SAMPLES calls of the step first)
+
+and on an error falls through to the next candidate while the request's time
+allows it. Latencies and errors come from the calls themselves, so routes
+re-balance automatically as a provider slows down or recovers. Latency is kept
+per step and model: a long synthesis on gpt-4o is not compared with a short
+decomposition on gpt-4o-mini. Errors are kept per model.
+
+Usage:
+    text = model_router.complete("synthesis", lambda model, timeout: call(model, timeout), timeout=20)
+    model_router.stats()      # per model: calls, error rate, benched, p50 / p95 per step
+
+Config (env):
+    MODEL_ROUTES      JSON {"step": ["model", ...]} merged over the defaults below
+    MODEL_ENDPOINTS   JSON {"model": "https://host/v1"} for models served elsewhere
+                      (e.g. an OpenAI-compatible local server)
+    OPENAI_CHAT_MODEL model for calls without a step (default gpt-3.5-turbo). Set
+                      without MODEL_ROUTES, it pins every text step to that one model
+                      (no per-step routing, no fallback model); diagrams keep theirs.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Callable, Deque, Dict, List, Optional
+
+from core.latency import MIN_SAMPLES, LatencyTracker
+from core.usage import BudgetExceeded
+
+PINNED_MODEL = os.environ.get("OPENAI_CHAT_MODEL") or None
+DEFAULT_MODEL = PINNED_MODEL or "gpt-3.5-turbo"
+
+ROUTES: Dict[str, List[str]] = {
+    "decomposition": ["gpt-4o-mini", "gpt-3.5-turbo"],
+    "analogies": ["gpt-4o-mini", "gpt-3.5-turbo"],
+    "translation": ["gpt-4o-mini", "gpt-3.5-turbo"],
+    "chat_summary": ["gpt-4o-mini", "gpt-3.5-turbo"],
+    "chunk_summary": ["gpt-4o-mini", "gpt-3.5-turbo"],
+    "document_summary": ["gpt-4o", "gpt-4o-mini"],
+    "synthesis": ["gpt-4o", "gpt-4o-mini"],
+    "diagram": ["dall-e-3", "dall-e-2"],
+    "default": [DEFAULT_MODEL],
+}
+if PINNED_MODEL and not os.environ.get("MODEL_ROUTES"):
+    # a deployment that pins its chat model (cost, or an endpoint serving only that model) keeps it
+    ROUTES = {step: models if step == "diagram" else [PINNED_MODEL] for step, models in ROUTES.items()}
+ROUTES.update(json.loads(os.environ.get("MODEL_ROUTES", "{}")))
+ENDPOINTS: Dict[str, str] = json.loads(os.environ.get("MODEL_ENDPOINTS", "{}"))
+
+ERROR_WINDOW = 10         # recent calls per model used for the error rate
+MAX_ERROR_RATE = 0.5
+COOLDOWN = 30.0           # seconds a failing model is benched
+SLOW_FACTOR = 2.0
+MIN_FALLBACK_TIME = 1.0   # don't start another candidate with less time than this left
+
+
+class ModelRouter:
+    def __init__(self, routes: Dict[str, List[str]]):
+        self.routes = routes
+        self.latency = LatencyTracker()
+        self._outcomes: Dict[str, Deque[bool]] = defaultdict(lambda: deque(maxlen=ERROR_WINDOW))
+        self._benched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float, ok: bool, step: str = "default"):
+        with self._lock:
+            outcomes = self._outcomes[model]
+            outcomes.append(ok)
+            failed = outcomes.count(False)
+            if not ok and len(outcomes) >= MIN_SAMPLES and failed / len(outcomes) >= MAX_ERROR_RATE:
+                self._benched[model] = time.monotonic() + COOLDOWN
+            elif ok:
+                self._benched.pop(model, None)
+        if ok:
+            self.latency.record(f"{step}:{model}", seconds)
+
+    def _is_benched(self, model: str) -> bool:
+        with self._lock:
+            return self._benched.get(model, 0.0) > time.monotonic()
+
+    def candidates(self, step: str) -> List[str]:
+        """The step's models, healthiest / fastest first."""
+        models = list(dict.fromkeys(self.routes.get(step) or self.routes["default"]))
+        healthy = [m for m in models if not self._is_benched(m)]
+        # a model much slower than one listed after it gives way (table order otherwise)
+        keys = {m: f"{step}:{m}" for m in healthy}
+        p75 = {m: self.latency.percentile(k, 75) for m, k in keys.items() if self.latency.count(k) >= MIN_SAMPLES}
+        slow = {m for i, m in enumerate(healthy)
+                if m in p75 and any(o in p75 and p75[m] > SLOW_FACTOR * p75[o] for o in healthy[i + 1:])}
+        ordered = [m for m in healthy if m not in slow] + [m for m in healthy if m in slow]
+        return ordered + [m for m in models if m not in healthy]  # benched models as a last resort
+
+    def complete(self, step: str, call: Callable[[str, Optional[float]], str],
+                 timeout: Optional[float] = None, retry: Optional[Callable[[], bool]] = None) -> str:
+        """
+        call(model, remaining_timeout) on the step's best candidate, falling through to
+        the next one on errors. retry() may veto the fallback (e.g. once output was streamed).
+        """
+        started = time.monotonic()
+        error: Optional[Exception] = None
+        for model in self.candidates(step):
+            remaining = None if timeout is None else timeout - (time.monotonic() - started)
+            if error is not None and ((remaining is not None and remaining < MIN_FALLBACK_TIME)
+                                      or (retry is not None and not retry())):
+                break
+            t0 = time.monotonic()
+            try:
+                result = call(model, remaining)
+            except BudgetExceeded:
+                raise  # not the model's fault; no other model is cheaper to refuse
+            except Exception as e:
+                self.record(model, time.monotonic() - t0, ok=False, step=step)
+                error = error or e
+                continue
+            self.record(model, time.monotonic() - t0, ok=True, step=step)
+            return result
+        raise error if error else RuntimeError(f"No model available for {step}")
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            outcomes = {m: list(o) for m, o in self._outcomes.items()}
+        latency: Dict[str, Dict] = defaultdict(dict)
+        for key, window in self.latency.snapshot().items():
+            step, _, model = key.partition(":")
+            latency[model][step] = {"p50": window["p50"], "p95": window["p95"]}
+        return {m: {"calls": len(o), "error_rate": round(o.count(False) / len(o), 2),
+                    "benched": self._is_benched(m), "latency": latency.get(m, {})}
+                for m, o in outcomes.items() if o}
+
+
+# process-wide router used by llm_client and the diagram renderer
+model_router = ModelRouter(ROUTES)
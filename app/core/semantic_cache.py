@@ -0,0 +1,213 @@
+# app/core/semantic_cache.py
+"""
+Near-duplicate answer cache over past sessions.
+
+"explain MOSFET working" and "how does a MOSFET work" should reuse the same answer
+instead of re-running the whole explain pipeline. Concepts are embedded locally
+(no network) with a hashed bag of words / character trigrams and searched with a
+NumPy cosine similarity. Entries are scoped by profile role, age group and language
+so a teacher's answer is never served to a 10-15 student.
+
+Usage:
+    from core.semantic_cache import answer_cache
+    hit = answer_cache.lookup(concept, profile, language)   # -> dict or None
+    answer_cache.add(concept, pack_record(record), profile, language, confidence)
+    answer_cache.stats()
+
+Config (env):
+    ANSWER_CACHE_THRESHOLD   cosine similarity needed for a hit (default 0.85)
+    ANSWER_CACHE_MAX_ENTRIES entries kept per scope (default 2000)
+"""
+
+import os
+import re
+import threading
+import zlib
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from core.lazy import is_available, optional_import
+
+# numpy is imported on first use (numpy missing -> cache silently disabled)
+_np = lambda: optional_import("numpy")
+
+DEFAULT_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.85"))
+MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+DIM = 1024
+
+# Words that carry the phrasing of a question rather than its topic
+_STOPWORDS = {
+    "a", "an", "the", "of", "to", "in", "on", "for", "and", "or", "is", "are", "was", "be",
+    "it", "its", "this", "that", "what", "why", "how", "when", "which", "who", "does", "do",
+    "did", "can", "could", "would", "should", "please", "me", "us", "my", "i", "you", "your",
+    "explain", "describe", "tell", "about", "concept", "give", "show", "teach", "understand",
+    "simple", "simply", "terms", "work", "works", "working", "meaning", "mean", "means",
+}
+
+
+def _stem(word: str) -> str:
+    for suffix in ("ing", "ed", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: -len(suffix)]
+    return word
+
+def _tokens(text: str) -> List[str]:
+    words = re.findall(r"[a-z0-9]+", (text or "").lower())
+    return [_stem(w) for w in words if w not in _STOPWORDS]
+
+def _features(text: str) -> Iterable[Tuple[str, float]]:
+    toks = _tokens(text)
+    for t in toks:
+        yield "w:" + t, 1.0
+        padded = f"#{t}#"
+        for i in range(len(padded) - 2):
+            yield "c:" + padded[i:i + 3], 0.3
+    for a, b in zip(toks, toks[1:]):
+        yield f"b:{a}_{b}", 0.5
+
+def embed(text: str):
+    """Hashed feature vector (L2-normalised float32). Stable across processes."""
+    np = _np()
+    vec = np.zeros(DIM, dtype=np.float32)
+    for feat, weight in _features(text):
+        h = zlib.crc32(feat.encode("utf-8"))
+        vec[h % DIM] += weight if (h >> 31) & 1 else -weight
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm else vec
+
+def scope_key(profile: Optional[dict], language: str = "English") -> Tuple[str, str, str]:
+    profile = profile or {}
+    return (
+        str(profile.get("role", "")).strip().lower(),
+        str(profile.get("age_group", "")).strip().lower(),
+        (language or "English").strip().lower(),
+    )
+
+
+class _Scope:
+    """Vectors + payloads for one (role, age_group, language) bucket."""
+
+    def __init__(self):
+        np = _np()
+        self.vectors = np.zeros((16, DIM), dtype=np.float32)
+        self.entries: List[dict] = []
+
+    def add(self, vec, entry: dict):
+        n = len(self.entries)
+        if n == len(self.vectors):
+            np = _np()
+            self.vectors = np.vstack([self.vectors, np.zeros_like(self.vectors)])
+        self.vectors[n] = vec
+        self.entries.append(entry)
+        if len(self.entries) > MAX_ENTRIES:
+            drop = len(self.entries) - MAX_ENTRIES
+            self.entries = self.entries[drop:]
+            self.vectors = self.vectors[drop:].copy()
+
+    def best(self, vec) -> Tuple[int, float]:
+        n = len(self.entries)
+        if n == 0:
+            return -1, 0.0
+        sims = self.vectors[:n] @ vec
+        i = int(sims.argmax())
+        return i, float(sims[i])
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD,
+                 loader: Optional[Callable[[], List[dict]]] = None):
+        self.threshold = threshold
+        self._loader = loader
+        self._loaded = loader is None
+        self._scopes: Dict[Tuple[str, str, str], _Scope] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return is_available("numpy")
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            sessions = self._loader() or []
+        except Exception as e:
+            print("Answer cache warm-up error:", e)
+            return
+        # sessions are newest-first; add oldest first so newer answers win ties
+        for s in reversed(sessions):
+            if not s.get("cacheable"):
+                continue  # errors, partial answers, document / follow-up answers (see tutor.py)
+            concept = s.get("concept") or s.get("concept_preview")
+            answer = s.get("record") or s.get("result")
+            if not concept or answer is None:
+                continue
+            profile = {"role": s.get("role", ""), "age_group": s.get("age_group", "")}
+            self._add_locked(concept, answer, profile, s.get("language", "English"),
+                             s.get("confidence", 0))
+
+    def _add_locked(self, concept, answer, profile, language, confidence):
+        key = scope_key(profile, language)
+        scope = self._scopes.get(key)
+        if scope is None:
+            scope = self._scopes[key] = _Scope()
+        scope.add(embed(concept), {"concept": concept, "answer": answer, "confidence": confidence})
+
+    def add(self, concept: str, answer, profile: Optional[dict] = None,
+            language: str = "English", confidence: int = 0):
+        """Index an answer: markdown, a packed ExplainRecord or a stored (compressed) session field."""
+        if not self.enabled or not concept:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            self._add_locked(concept, answer, profile, language, confidence)
+
+    def lookup(self, concept: str, profile: Optional[dict] = None,
+               language: str = "English", threshold: Optional[float] = None) -> Optional[dict]:
+        """Return {"concept", "answer", "confidence", "similarity"} for the closest past answer, or None."""
+        if not self.enabled or not concept:
+            return None
+        threshold = self.threshold if threshold is None else threshold
+        with self._lock:
+            self._ensure_loaded()
+            scope = self._scopes.get(scope_key(profile, language))
+            idx, score = scope.best(embed(concept)) if scope else (-1, 0.0)
+            if idx < 0 or score < threshold:
+                self._misses += 1
+                return None
+            self._hits += 1
+            entry = dict(scope.entries[idx], similarity=round(score, 3))
+        from core.storage import stored_answer
+        entry["answer"] = stored_answer(entry["answer"])
+        return entry
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "entries": sum(len(s.entries) for s in self._scopes.values()),
+                "hits": self._hits,
+                "misses": self._misses,
+                "lookups": lookups,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._scopes.clear()
+            self._hits = self._misses = 0
+
+
+def _load_sessions() -> List[dict]:
+    from core.storage import memory_store
+    from core.response_cache import response_cache
+    # precompute.py stores session-shaped "answer" entries for curriculum topics, only for
+    # successful runs (entries written before the "cacheable" flag are such runs too)
+    answers = [dict(a, cacheable=a.get("cacheable", True)) for a in response_cache.values("answer")]
+    return memory_store.list_sessions() + answers
+
+# singleton instance, warmed lazily from memory.json and precomputed answers
+answer_cache = SemanticAnswerCache(loader=_load_sessions)
@@ -4,55 +4,266 @@ Simple file-backed memory_store for sessions.
 
 Usage:
     from core.storage import memory_store
-    memory_store.add_session({...})
+    memory_store.add_session({..., "record": pack_record(ExplainRecord.from_result(result))})
     memory_store.list_sessions()
+    memory_store.version()        # changes whenever the session file is written
     memory_store.clear_sessions()
     memory_store.remove_session(index)
+    memory_store.get_session(index)
+    memory_store.export_json(path)
+
+Sessions live in storage/sessions.bin, encoded with core/records.py (msgpack when
+installed, else compact JSON). A session keeps its result as a packed ExplainRecord
+rather than rendered markdown; get_session() rebuilds the result dict and the
+markdown ("result") from it. Older memory.json files are read until the first write.
+
+Retention is configured through the environment (0 disables a limit):
+    SESSION_MAX_ENTRIES        newest sessions kept (default 200)
+    SESSION_MAX_AGE_DAYS       drop sessions older than this (default 0, off)
+    SESSION_MAX_BYTES          cap on the total stored size (default 5 MB)
+    SESSION_COMPRESS_MIN_BYTES text fields at least this long are compressed (default 1024)
+    TUTOR_STORAGE_DIR          directory for sessions and the caches (default app/storage)
+
+Large text and record fields are stored compressed (zstd when installed, else zlib)
+and are only decompressed by get_session(). list_sessions() returns them as stored, which
+is all the sidebar needs (ts / concept_preview).
 """
 
+import base64
 import json
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Dict
+from typing import Any, Dict, List, Optional
+
+from core.metrics import STORAGE_WRITE_SECONDS
+from core.records import dumps, loads, unpack_record
+
+try:
+    import zstandard as _zstd
+except Exception:
+    _zstd = None
 
 BASE = Path(__file__).resolve().parent.parent
-STORAGE_DIR = BASE / "storage"
+STORAGE_DIR = Path(os.environ.get("TUTOR_STORAGE_DIR") or BASE / "storage")
 STORAGE_DIR.mkdir(parents=True, exist_ok=True)
-MEM_FILE = STORAGE_DIR / "memory.json"
+SESSIONS_FILE = STORAGE_DIR / "sessions.bin"
+MEM_FILE = STORAGE_DIR / "memory.json"  # legacy JSON sessions, read until sessions.bin exists
 
-def _read() -> List[Dict]:
-    if not MEM_FILE.exists():
-        return []
+MAX_ENTRIES = int(os.environ.get("SESSION_MAX_ENTRIES", "200"))
+MAX_AGE_DAYS = float(os.environ.get("SESSION_MAX_AGE_DAYS", "0"))
+MAX_BYTES = int(os.environ.get("SESSION_MAX_BYTES", str(5 * 1024 * 1024)))
+COMPRESS_MIN_BYTES = int(os.environ.get("SESSION_COMPRESS_MIN_BYTES", "1024"))
+COMPACT_INTERVAL = 30.0  # seconds between background compactions
+
+_COMPRESSED_KEY = "__compressed__"
+
+_lock = threading.RLock()
+_cache: Dict[str, Any] = {"stamp": None, "data": []}
+
+
+# ---------- compression helpers ----------
+
+def _compress_text(text) -> Dict[str, Any]:
+    """Compressed str (kept base64 for JSON) or bytes (kept raw, for the binary file)."""
+    raw = text if isinstance(text, bytes) else text.encode("utf-8")
+    if _zstd is not None:
+        codec, packed = "zstd", _zstd.ZstdCompressor(level=6).compress(raw)
+    else:
+        codec, packed = "zlib", zlib.compress(raw, 6)
+    if isinstance(text, bytes):
+        return {_COMPRESSED_KEY: codec, "bytes": packed}
+    return {_COMPRESSED_KEY: codec, "data": base64.b64encode(packed).decode("ascii")}
+
+def decompress_value(value: Any) -> Any:
+    """Inverse of the on-disk compression; plain values pass through."""
+    if not (isinstance(value, dict) and _COMPRESSED_KEY in value):
+        return value
+    packed = value["bytes"] if "bytes" in value else base64.b64decode(value.get("data", ""))
+    if value[_COMPRESSED_KEY] == "zstd":
+        if _zstd is None:
+            raise RuntimeError("Session was stored with zstd; install `zstandard` to read it.")
+        raw = _zstd.ZstdDecompressor().decompress(packed)
+    else:
+        raw = zlib.decompress(packed)
+    return raw if "bytes" in value else raw.decode("utf-8")
+
+def stored_answer(value: Any) -> str:
+    """Markdown of a stored answer: markdown text, or a (compressed) packed ExplainRecord."""
+    value = decompress_value(value)
+    if isinstance(value, str):
+        return value
+    return unpack_record(value).markdown()
+
+def _compress_entry(entry: Dict) -> Dict:
+    """Compress long string fields; short fields stay readable in the file."""
+    if COMPRESS_MIN_BYTES <= 0:
+        return entry
+    out = {}
+    for k, v in entry.items():
+        if isinstance(v, (str, bytes)) and len(v) >= COMPRESS_MIN_BYTES:
+            out[k] = _compress_text(v)
+        else:
+            out[k] = v
+    return out
+
+def _decompress_entry(entry: Dict) -> Dict:
+    entry = {k: decompress_value(v) for k, v in entry.items()}
+    if entry.get("record") is not None:
+        # the result as explain_concept returned it, plus its markdown
+        record = unpack_record(entry.pop("record"))
+        entry.update(record.to_dict())
+        entry["result"] = record.markdown()
+    return entry
+
+
+# ---------- file access ----------
+
+def _source() -> Path:
+    return SESSIONS_FILE if SESSIONS_FILE.exists() or not MEM_FILE.exists() else MEM_FILE
+
+def _stamp():
     try:
-        return json.loads(MEM_FILE.read_text(encoding="utf-8"))
-    except Exception:
-        return []
+        path = _source()
+        st = path.stat()
+        return (path.name, st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        return None
+
+def _read() -> List[Dict]:
+    """Read sessions, re-parsing the file only when it changed on disk."""
+    with _lock:
+        stamp = _stamp()
+        if stamp is None:
+            return []
+        if _cache["stamp"] == stamp:
+            return list(_cache["data"])
+        try:
+            path = _source()
+            if path == SESSIONS_FILE:
+                data = loads(path.read_bytes())
+            else:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            if not isinstance(data, list):
+                data = []
+        except Exception:
+            data = []
+        _cache["stamp"], _cache["data"] = stamp, data
+        return list(data)
 
 def _write(arr):
-    MEM_FILE.write_text(json.dumps(arr, ensure_ascii=False, indent=2), encoding="utf-8")
+    with _lock, STORAGE_WRITE_SECONDS.labels(store="sessions").time():
+        tmp = SESSIONS_FILE.with_suffix(".bin.tmp")
+        tmp.write_bytes(dumps(arr))
+        os.replace(tmp, SESSIONS_FILE)
+        _cache["stamp"], _cache["data"] = _stamp(), list(arr)
+
+
+# ---------- retention ----------
+
+def _entry_time(entry: Dict) -> Optional[datetime]:
+    for key in ("ts", "timestamp"):
+        value = entry.get(key)
+        if isinstance(value, str):
+            try:
+                return datetime.fromisoformat(value)
+            except ValueError:
+                continue
+    return None
+
+def _apply_retention(arr: List[Dict]) -> List[Dict]:
+    """Trim by count, age and total size. Entries are newest-first."""
+    if MAX_ENTRIES > 0:
+        arr = arr[:MAX_ENTRIES]
+    if MAX_AGE_DAYS > 0:
+        cutoff = datetime.now() - timedelta(days=MAX_AGE_DAYS)
+        arr = [e for e in arr if (_entry_time(e) or cutoff) >= cutoff]
+    if MAX_BYTES > 0:
+        kept, total = [], 0
+        for e in arr:
+            total += len(dumps(e))
+            if total > MAX_BYTES and kept:
+                break
+            kept.append(e)
+        arr = kept
+    return arr
+
+def compact() -> int:
+    """Compress legacy entries and apply retention. Returns the number of sessions dropped."""
+    with _lock:
+        arr = _read()
+        compacted = _apply_retention([_compress_entry(e) for e in arr])
+        if compacted != arr:
+            _write(compacted)
+        return len(arr) - len(compacted)
+
 
 class _MemoryStore:
+    def __init__(self):
+        self._compactor: Optional[threading.Thread] = None
+        self._last_compaction = 0.0
+
+    def _schedule_compaction(self):
+        """Run compact() on a background thread, at most once per COMPACT_INTERVAL."""
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        if time.monotonic() - self._last_compaction < COMPACT_INTERVAL:
+            return
+        self._last_compaction = time.monotonic()
+        self._compactor = threading.Thread(target=self._compact_quietly, name="session-compactor", daemon=True)
+        self._compactor.start()
+
+    @staticmethod
+    def _compact_quietly():
+        try:
+            compact()
+        except Exception as e:
+            print("Session compaction error:", e)
+
     def add_session(self, entry: Dict):
-        arr = _read()
-        arr.insert(0, entry)
-        _write(arr)
+        with _lock:
+            arr = _read()
+            arr.insert(0, _compress_entry(entry))
+            if MAX_ENTRIES > 0:
+                arr = arr[:MAX_ENTRIES]
+            _write(arr)
+        self._schedule_compaction()
+
+    def version(self):
+        """Stamp of the session file (one stat, no read): a cache key that changes on every write."""
+        return _stamp()
 
     def list_sessions(self) -> List[Dict]:
+        """Sessions newest-first; large fields stay compressed until get_session()."""
         return _read()
 
     def clear_sessions(self):
         _write([])
 
     def remove_session(self, index: int):
-        arr = _read()
-        if 0 <= index < len(arr):
-            arr.pop(index)
-            _write(arr)
+        with _lock:
+            arr = _read()
+            if 0 <= index < len(arr):
+                arr.pop(index)
+                _write(arr)
 
     def get_session(self, index: int):
         arr = _read()
         if 0 <= index < len(arr):
-            return arr[index]
+            return _decompress_entry(arr[index])
         return None
 
+    def compact(self) -> int:
+        return compact()
+
+    def export_json(self, path: Path) -> int:
+        """Write every session, decompressed and with its result dict, as readable JSON."""
+        sessions = [_decompress_entry(e) for e in _read()]
+        Path(path).write_text(json.dumps(sessions, ensure_ascii=False, indent=2), encoding="utf-8")
+        return len(sessions)
+
 # singleton instance
 memory_store = _MemoryStore()
@@ -0,0 +1,237 @@
+# app/core/summarize.py
+"""
+Map-reduce summaries of whole uploaded documents.
+
+explain_concept() only shows the model the first few thousand characters of a
+document. summarize_document() reads all of it:
+
+    split    the text into chunks of at most CHUNK_TOKENS, cut at paragraph ends
+    map      summarize every chunk concurrently (SUMMARY_WORKERS at a time, within
+             the shared API rate limits)
+    reduce   join the summaries in groups that fit REDUCE_TOKENS, summarize each
+             group concurrently, and repeat until one group is left; its summary
+             is the final explanation, written for the learner's profile
+
+Wall time grows with the number of reduce levels (log of the document length),
+not with the number of chunks.
+
+Chunk and group summaries are cached by content hash (response_cache kinds
+"chunk_summary" / "summary_reduce"), so asking again, or about an edited version
+of the same document, only summarizes what changed. Chunk boundaries are
+content-defined (a chunk may end at any paragraph whose hash says so once it is
+half full), so an edit moves only the boundaries near it instead of every one
+after it.
+
+Usage:
+    if is_summary_request(question):
+        summary = summarize_document(text, focus=summary_focus(question), profile=profile, deadline=Deadline(90))
+    summary.text, summary.chunks, summary.cached, summary.levels
+
+Config (env):
+    SUMMARY_CHUNK_TOKENS    tokens per chunk (default 1500)
+    SUMMARY_REDUCE_TOKENS   tokens of summaries per reduce call (default 3000)
+    SUMMARY_WORKERS         summaries written at once (default 8)
+"""
+
+import contextvars
+import hashlib
+import os
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from core.conversation import estimate_tokens
+from core.pipeline import Deadline
+from core.profiling import attached
+from core.response_cache import response_cache
+
+CHUNK_TOKENS = int(os.environ.get("SUMMARY_CHUNK_TOKENS", "1500"))
+REDUCE_TOKENS = int(os.environ.get("SUMMARY_REDUCE_TOKENS", "3000"))
+WORKERS = int(os.environ.get("SUMMARY_WORKERS", "8"))
+CHUNK_SUMMARY_TOKENS = 250
+FINAL_TOKENS = 900
+CUT_EVERY = 4            # content-defined cut: about one paragraph in CUT_EVERY may end a chunk
+MIN_CALL_SECONDS = 5.0
+
+_pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="summarize")
+
+_SUMMARY_REQUEST = re.compile(
+    r"^\s*(please\s+)?(summari[sz]e|summary|sum up|tl;?dr|give me (a|the) (summary|gist)|what('s| is) (this|the) "
+    r"(document|doc|file|pdf|paper) about)\b", re.IGNORECASE)
+
+
+def is_summary_request(question: str) -> bool:
+    """Whether a chat message asks for a summary of the uploaded document."""
+    return bool(_SUMMARY_REQUEST.match(question or ""))
+
+
+_FILLER = re.compile(r"^(?:\s|[,.:;!?-]|\b(?:of|the|this|that|whole|entire|full|document|doc|file|pdf|paper|"
+                     r"about|please|for me|it)\b)*", re.IGNORECASE)
+
+def summary_focus(question: str) -> str:
+    """What a summary request is about beyond the document itself ("" for "summarize this pdf")."""
+    m = _SUMMARY_REQUEST.match(question or "")
+    rest = question[m.end():] if m else (question or "")
+    return _FILLER.sub("", rest).strip(" .?!")
+
+
+@dataclass
+class DocumentSummary:
+    text: str
+    chunks: int = 0
+    cached: int = 0       # chunk summaries served from the cache
+    levels: int = 0       # reduce passes
+    errors: List[str] = field(default_factory=list)
+
+
+# ---------- split ----------
+
+def _paragraphs(text: str, max_chars: int) -> List[str]:
+    """Paragraphs of at most max_chars (long ones are split at sentence ends, else hard)."""
+    out = []
+    for para in re.split(r"\n\s*\n", text):
+        para = para.strip()
+        while len(para) > max_chars:
+            cut = para.rfind(". ", 0, max_chars)
+            cut = cut + 1 if cut > max_chars // 2 else max_chars
+            out.append(para[:cut].strip())
+            para = para[cut:].strip()
+        if para:
+            out.append(para)
+    return out
+
+def chunk_text(text: str, max_tokens: int = CHUNK_TOKENS) -> List[str]:
+    """Split text into chunks of at most ~max_tokens, at paragraph ends."""
+    max_chars = max_tokens * 4
+    chunks, current, size = [], [], 0
+
+    def flush():
+        nonlocal current, size
+        if current:
+            chunks.append("\n\n".join(current))
+        current, size = [], 0
+
+    for para in _paragraphs(text or "", max_chars):
+        if current and size + len(para) > max_chars:
+            flush()
+        current.append(para)
+        size += len(para) + 2
+        if size >= max_chars // 2 and zlib.crc32(para.encode("utf-8")) % CUT_EVERY == 0:
+            flush()
+    flush()
+    return chunks
+
+
+# ---------- map / reduce ----------
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def _is_summary(text) -> bool:
+    return bool(text) and not str(text).startswith(("❌", "⚠️"))
+
+def _timeout(deadline: Deadline) -> Optional[float]:
+    remaining = deadline.remaining()
+    return None if remaining is None else max(MIN_CALL_SECONDS, remaining)
+
+def _complete(prompt: str, max_tokens: int, step: str, deadline: Deadline) -> str:
+    from core.llm_client import _chat_complete
+    return _chat_complete(prompt, temperature=0.2, max_tokens=max_tokens, timeout=_timeout(deadline), step=step)
+
+def summarize_chunk(chunk: str, focus: str, deadline: Deadline) -> str:
+    prompt = (f"Summarize this part of a longer document in at most {int(CHUNK_SUMMARY_TOKENS * 0.75)} words. "
+              f"Keep definitions, key claims, numbers and names."
+              + (f" Pay special attention to: {focus}." if focus else "") + f"\n\n{chunk}")
+    return response_cache.get_or_compute(
+        "chunk_summary", [_digest(chunk), focus, CHUNK_SUMMARY_TOKENS],
+        lambda: _complete(prompt, CHUNK_SUMMARY_TOKENS, "chunk_summary", deadline), cacheable=_is_summary)
+
+def _reduce(summaries: List[str], focus: str, deadline: Deadline) -> str:
+    joined = "\n\n".join(f"Part {i}: {s}" for i, s in enumerate(summaries, 1))
+    prompt = (f"These are summaries of consecutive parts of a document. Merge them into one summary of at most "
+              f"{int(CHUNK_SUMMARY_TOKENS * 0.75)} words, in document order, without repeating points."
+              + (f" Pay special attention to: {focus}." if focus else "") + f"\n\n{joined}")
+    return response_cache.get_or_compute(
+        "summary_reduce", [_digest(joined), focus, CHUNK_SUMMARY_TOKENS],
+        lambda: _complete(prompt, CHUNK_SUMMARY_TOKENS, "chunk_summary", deadline), cacheable=_is_summary)
+
+def _groups(summaries: List[str], max_tokens: int) -> List[List[str]]:
+    """Consecutive summaries packed into groups of at most ~max_tokens (at least two per group)."""
+    groups, current, size = [], [], 0
+    for s in summaries:
+        tokens = estimate_tokens(s)
+        if len(current) >= 2 and size + tokens > max_tokens:
+            groups.append(current)
+            current, size = [], 0
+        current.append(s)
+        size += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+def _parallel(fn: Callable, items: list, *args) -> list:
+    """fn(item, *args) for every item on the pool (usage scope and profile carried over); exceptions returned."""
+    futures = [_pool.submit(contextvars.copy_context().run, attached(fn), item, *args) for item in items]
+    out = []
+    for fut in futures:
+        try:
+            out.append(fut.result())
+        except Exception as e:
+            out.append(e)
+    return out
+
+def summarize_document(text: str, focus: str = "", profile: Optional[dict] = None,
+                       deadline: Optional[Deadline] = None,
+                       on_progress: Optional[Callable[[str, dict], None]] = None) -> DocumentSummary:
+    """
+    Whole-document summary: chunk summaries in parallel, merged level by level, then a
+    final explanation for the learner. on_progress(stage, info) is called after the
+    map, each reduce level and the final pass.
+    """
+    deadline = deadline or Deadline(None)
+    chunks = chunk_text(text)
+    if not chunks:
+        return DocumentSummary("The document has no text to summarize.")
+    result = DocumentSummary("", chunks=len(chunks))
+    result.cached = sum(1 for c in chunks
+                        if response_cache.get("chunk_summary", [_digest(c), focus, CHUNK_SUMMARY_TOKENS]))
+
+    def keep(outputs: list, stage: str) -> List[str]:
+        good = []
+        for out in outputs:
+            if isinstance(out, Exception) or not _is_summary(out):
+                result.errors.append(f"{stage}: {str(out)[:100]}")
+            else:
+                good.append(out)
+        return good
+
+    summaries = keep(_parallel(summarize_chunk, chunks, focus, deadline), "chunk")
+    if on_progress:
+        on_progress("map", {"chunks": len(chunks), "summarized": len(summaries), "cached": result.cached})
+    while len(summaries) > 1 and estimate_tokens("\n\n".join(summaries)) > REDUCE_TOKENS:
+        groups = _groups(summaries, REDUCE_TOKENS)
+        merged = keep(_parallel(_reduce, groups, focus, deadline), "reduce")
+        if not merged:  # nothing merged - go on with what we have rather than loop
+            break
+        summaries = merged
+        result.levels += 1
+        if on_progress:
+            on_progress("reduce", {"level": result.levels, "summaries": len(summaries)})
+    if not summaries:
+        result.text = "❌ Could not summarize the document: " + "; ".join(result.errors[:3])
+        return result
+
+    profile = profile or {}
+    prompt = (f"Using these notes on a document, write a clear explanation of what it says for a "
+              f"{profile.get('role', 'learner')} (age group {profile.get('age_group', 'any')}). Start with a "
+              f"2-3 sentence overview, then the main points as bullets in document order."
+              + (f" The learner asked: {focus}" if focus else "")
+              + "\n\n" + "\n\n".join(summaries))
+    result.text = response_cache.get_or_compute(
+        "document_summary", [_digest(prompt), FINAL_TOKENS],
+        lambda: _complete(prompt, FINAL_TOKENS, "document_summary", deadline), cacheable=_is_summary)
+    if on_progress:
+        on_progress("final", {"levels": result.levels})
+    return result
@@ -1,28 +1,45 @@
 # app/core/tools/analogy_tool.py
 """
-Analogy generator tool - FIXED VERSION
+Analogy generator tool - three analogies (Story, Visual, Practical) for a concept.
+
+Each analogy is its own short completion: the three run concurrently, are cached
+separately (response_cache kind "analogy") and merged into the usual text block:
+
+    Analogy 1 (Story): ...
+    Mapping 1: ...
+
+so the wall-clock time is that of the slowest single analogy, and a weak one can be
+regenerated on its own (regenerate_analogy) without paying for the other two.
 """
-from typing import Optional, List
+import contextvars
+import os
 import textwrap
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
 
-def analogy_generator_tool(concept: str, atoms: Optional[List[str]] = None, profile: Optional[dict] = None) -> str:
-    """Generate analogies using simple OpenAI call"""
-    if not concept:
-        return "No concept provided."
-    
-    import os
-    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-    
-    if not OPENAI_API_KEY:
-        return "⚠️ OPENAI_API_KEY not set"
-    
-    atoms_text = "\n".join(f"- {a}" for a in (atoms or [])) if atoms else "(no atoms)"
-    profile_text = ""
-    if profile:
-        pf = {k: v for k, v in profile.items() if k in ("name", "age_group", "role", "interests")}
-        profile_text = f"User profile: {pf}"
-    
-    prompt = textwrap.dedent(f"""
+from core.llm_client import _chat_complete
+from core.profiling import attached
+from core.response_cache import response_cache
+
+# kind -> what the analogy should draw on
+ANALOGY_KINDS = {
+    "Story": "a short story with characters and a situation",
+    "Visual": "a picture the learner can see in their mind",
+    "Practical": "an everyday situation or hobby (use the learner's interests if known)",
+}
+MIN_TOKENS = 120
+
+_pool = ThreadPoolExecutor(max_workers=12, thread_name_prefix="analogy")
+
+
+def _profile_fields(profile: Optional[dict]) -> dict:
+    return {k: v for k, v in (profile or {}).items() if k in ("name", "age_group", "role", "interests")}
+
+def _prompt(kind: str, concept: str, atoms: Optional[List[str]], profile: Optional[dict]) -> str:
+    atoms_text = "\n".join(f"- {a}" for a in atoms) if atoms else "(no atoms)"
+    pf = _profile_fields(profile)
+    profile_text = f"User profile: {pf}" if pf else ""
+    return textwrap.dedent(f"""
     You are a friendly tutor that explains difficult topics using relatable analogies.
     {profile_text}
     
@@ -31,42 +48,103 @@ def analogy_generator_tool(concept: str, atoms: Optional[List[str]] = None, prof
     Key atoms:
     {atoms_text}
     
-    Produce EXACTLY three analogies with short mappings:
-    
-    Analogy 1 (Story): <2-4 sentences>
-    Mapping 1: <one line mapping>
+    Produce ONE {kind.lower()} analogy: {ANALOGY_KINDS[kind]}.
     
-    Analogy 2 (Visual): <2-4 sentences>
-    Mapping 2: <one line mapping>
-    
-    Analogy 3 (Practical): <2-4 sentences>
-    Mapping 3: <one line mapping>
-    
-    Keep overall length concise and easy to read.
+    Analogy: <2-4 sentences>
+    Mapping: <one line: which part of the concept maps to which element of the analogy>
     """)
-    
-    try:
-        # Try new OpenAI SDK (>=1.0)
+
+def _parse(text: str) -> Optional[Dict[str, str]]:
+    """{"analogy", "mapping"} from one completion; None for empty output."""
+    analogy, mapping = [], []
+    target = analogy
+    for line in (text or "").strip().splitlines():
+        stripped = line.strip()
+        label, _, rest = stripped.partition(":")
+        if label.lower().startswith("mapping"):
+            target = mapping
+            stripped = rest.strip()
+        elif target is analogy and label.lower().startswith("analogy"):
+            stripped = rest.strip()
+        if stripped:
+            target.append(stripped)
+    if not analogy:
+        return None
+    return {"analogy": " ".join(analogy), "mapping": " ".join(mapping)}
+
+def generate_analogy(kind: str, concept: str, atoms: Optional[List[str]] = None, profile: Optional[dict] = None,
+                     timeout: Optional[float] = None, max_tokens: int = 200, refresh: bool = False,
+                     not_before: Optional[float] = None,
+                     complete: Optional[Callable[[str, int, Optional[float]], str]] = None) -> Optional[Dict[str, str]]:
+    """
+    One analogy as {"analogy", "mapping"}, cached per (concept, kind, atoms, profile, max_tokens).
+    refresh=True generates a new one and replaces the cached entry. complete(prompt, max_tokens,
+    timeout) overrides the LLM call. Raises on LLM errors.
+    """
+    if kind not in ANALOGY_KINDS:
+        raise ValueError(f"Unknown analogy kind '{kind}' (one of {', '.join(ANALOGY_KINDS)})")
+    complete = complete or (lambda prompt, tokens, t: _chat_complete(
+        prompt, temperature=0.7, max_tokens=tokens, timeout=t, step="analogies"))
+    key = [" ".join(concept.lower().split()), kind, list(atoms or []), _profile_fields(profile), max_tokens]
+    if refresh:
+        value = _parse(complete(_prompt(kind, concept, atoms, profile), max_tokens, timeout))
+        if value:
+            response_cache.set("analogy", key, value)
+        return value
+    return response_cache.get_or_compute(
+        "analogy", key, lambda: _parse(complete(_prompt(kind, concept, atoms, profile), max_tokens, timeout)),
+        not_before=not_before)
+
+def generate_analogy_set(concept: str, atoms: Optional[List[str]] = None, profile: Optional[dict] = None,
+                         timeout: Optional[float] = None, max_tokens: int = 600,
+                         not_before: Optional[float] = None, complete=None) -> Dict[str, object]:
+    """All analogies, generated concurrently: {kind: {"analogy", "mapping"} or the exception}."""
+    per_analogy = max(MIN_TOKENS, max_tokens // len(ANALOGY_KINDS))
+    futures = {
+        kind: _pool.submit(contextvars.copy_context().run, attached(generate_analogy), kind, concept, atoms,
+                           profile, timeout, per_analogy, False, not_before, complete)
+        for kind in ANALOGY_KINDS
+    }
+    parts: Dict[str, object] = {}
+    for kind, fut in futures.items():
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=OPENAI_API_KEY)
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=600
-            )
-            return response.choices[0].message.content
-        except:
-            # Try old OpenAI SDK (<1.0)
-            import openai
-            openai.api_key = OPENAI_API_KEY
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=600
-            )
-            return response.choices[0].message.content
-    except Exception as e:
-        return f"❌ Analogy generation failed: {str(e)[:200]}"
\ No newline at end of file
+            parts[kind] = fut.result() or RuntimeError("empty response")
+        except Exception as e:
+            parts[kind] = e
+    return parts
+
+def format_analogy(number: int, kind: str, part) -> str:
+    if isinstance(part, dict):
+        mapping = f"\nMapping {number}: {part['mapping']}" if part.get("mapping") else ""
+        return f"Analogy {number} ({kind}): {part['analogy']}{mapping}"
+    return f"Analogy {number} ({kind}): ⚠️ not available ({str(part)[:100]})"
+
+def merge_analogies(parts: Dict[str, object]) -> str:
+    """The analogies as one text block, in ANALOGY_KINDS order."""
+    return "\n\n".join(format_analogy(i, kind, parts[kind])
+                       for i, kind in enumerate(ANALOGY_KINDS, 1) if kind in parts)
+
+def analogy_generator_tool(concept: str, atoms: Optional[List[str]] = None, profile: Optional[dict] = None,
+                           timeout: Optional[float] = None, max_tokens: int = 600,
+                           not_before: Optional[float] = None, complete=None) -> str:
+    """Generate the three analogies concurrently and merge them into one text block"""
+    if not concept:
+        return "No concept provided."
+    
+    if not os.getenv("OPENAI_API_KEY") and complete is None:
+        return "⚠️ OPENAI_API_KEY not set"
+    
+    parts = generate_analogy_set(concept, atoms, profile, timeout, max_tokens, not_before, complete)
+    errors = [p for p in parts.values() if isinstance(p, Exception)]
+    if len(errors) == len(parts):
+        return f"❌ Analogy generation failed: {str(errors[0])[:200]}"
+    return merge_analogies(parts)
+
+def regenerate_analogy(kind: str, concept: str, atoms: Optional[List[str]] = None, profile: Optional[dict] = None,
+                       timeout: Optional[float] = None, max_tokens: int = 600) -> Dict[str, str]:
+    """A fresh analogy of one kind (replacing its cache entry), as analogy_generator_tool would size it"""
+    per_analogy = max(MIN_TOKENS, max_tokens // len(ANALOGY_KINDS))
+    part = generate_analogy(kind, concept, atoms, profile, timeout, per_analogy, refresh=True)
+    if not part:
+        raise RuntimeError("empty response")
+    return part
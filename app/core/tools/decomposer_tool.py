@@ -1,21 +1,49 @@
 # app/core/tools/decomposer_tool.py
 """
 Decomposer tool - FIXED VERSION
+
+Local keyphrase extraction (keyphrase_tool) runs first; the LLM is only asked when
+the local confidence is below LOCAL_DECOMPOSE_MIN_CONFIDENCE (default 0.5).
 """
-from typing import List
+from typing import List, Optional, Tuple
 import json
 import os
+from core.llm_client import _chat_complete
+from core.tools.keyphrase_tool import local_decompose
+
+LOCAL_MIN_CONFIDENCE = float(os.environ.get("LOCAL_DECOMPOSE_MIN_CONFIDENCE", "0.5"))
+
+def _split_atoms(concept: str, max_atoms: int) -> List[str]:
+    return [s.strip() for s in concept.split(',')[:max_atoms] if s.strip()]
+
+def decompose_concept_tool(concept: str, max_atoms: int = 5, timeout: Optional[float] = None,
+                           context_texts: Optional[List[str]] = None) -> List[str]:
+    """Break concept into atomic sub-concepts (context_texts: search snippets / document text)"""
+    atoms, _method = decompose_with_method(concept, max_atoms, timeout, context_texts)
+    return atoms
 
-def decompose_concept_tool(concept: str, max_atoms: int = 5) -> List[str]:
-    """Break concept into atomic sub-concepts"""
+def decompose_with_method(concept: str, max_atoms: int = 5, timeout: Optional[float] = None,
+                          context_texts: Optional[List[str]] = None) -> Tuple[List[str], str]:
+    """(atoms, "local" | "llm" | "split") - the method tells callers whether to cache the atoms"""
     if not concept or not concept.strip():
-        return []
+        return [], "split"
     
-    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-    if not OPENAI_API_KEY:
-        # Fallback: simple split
-        return [s.strip() for s in concept.split(',')[:max_atoms] if s.strip()]
+    local_atoms, confidence = local_decompose(concept, context_texts, max_atoms)
+    if local_atoms and confidence >= LOCAL_MIN_CONFIDENCE:
+        return local_atoms, "local"
     
+    if os.getenv("OPENAI_API_KEY"):
+        atoms = llm_decompose(concept, max_atoms, timeout)
+        if atoms:
+            return atoms, "llm"
+    
+    # Offline / LLM failure: low-confidence local atoms beat a bare comma split
+    if local_atoms:
+        return local_atoms, "local"
+    return _split_atoms(concept, max_atoms) or [concept], "split"
+
+def llm_decompose(concept: str, max_atoms: int = 5, timeout: Optional[float] = None) -> List[str]:
+    """Ask the LLM for atoms; [] on failure"""
     prompt = f"""
 You are a concise educational assistant.
 Break the following concept into {max_atoms} short atomic sub-concepts (4-8 words each).
@@ -26,28 +54,9 @@ Concept:
 """
     
     try:
-        # Try new OpenAI SDK
-        try:
-            from openai import OpenAI
-            client = OpenAI(api_key=OPENAI_API_KEY)
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.0,
-                max_tokens=300
-            )
-            out = response.choices[0].message.content
-        except:
-            # Try old SDK
-            import openai
-            openai.api_key = OPENAI_API_KEY
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.0,
-                max_tokens=300
-            )
-            out = response.choices[0].message.content
+        # Shared client handles new/old SDK, the request timeout and the step's model route
+        out = _chat_complete(prompt, temperature=0.0, max_tokens=300,
+                             timeout=timeout, step="decomposition")
         
         # Try parse JSON
         try:
@@ -71,7 +80,7 @@ Concept:
                     atoms.append(line.lstrip("- ").strip())
                     continue
                 atoms.append(line)
-            return atoms[:max_atoms] if atoms else [concept]
+            return atoms[:max_atoms]
     except Exception as e:
-        # Final fallback
-        return [s.strip() for s in concept.split(',')[:max_atoms] if s.strip()] or [concept]
\ No newline at end of file
+        print("LLM decomposition error:", e)
+    return []
\ No newline at end of file
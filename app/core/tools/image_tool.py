@@ -5,8 +5,8 @@ If key missing or blocked, can return a small PIL placeholder image (so UI can s
 """
 
 import os
+import functools
 from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont
 import base64
 
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
@@ -31,8 +31,17 @@ def generate_image_bytes(prompt: str, size: str = "1024x1024"):
         except Exception as e:
             print("OpenAI image error:", e)
             # fall through to placeholder
-    # Placeholder: draw a simple PNG with prompt text (safe demo)
-    img = Image.new("RGB", (1024, 1024), color=(18, 18, 20))
+    return placeholder_png(prompt, size)
+
+@functools.lru_cache(maxsize=32)
+def placeholder_png(prompt: str, size: str = "1024x1024") -> bytes:
+    """Placeholder PNG with the prompt text (safe demo); cached since it is deterministic."""
+    from PIL import Image, ImageDraw, ImageFont  # only needed for the placeholder
+    try:
+        width, height = (int(v) for v in size.lower().split("x"))
+    except ValueError:
+        width = height = 1024
+    img = Image.new("RGB", (width, height), color=(18, 18, 20))
     d = ImageDraw.Draw(img)
     try:
         # try a truetype font from system
@@ -0,0 +1,177 @@
+# app/core/tools/keyphrase_tool.py
+"""
+Local keyphrase decomposer - TextRank over the concept, search snippets and document text.
+
+Candidate phrases are runs of content words between stopwords / punctuation. Words
+are ranked with PageRank on their co-occurrence graph (NumPy power iteration over
+the edge list, so memory grows with the edges, not vocabulary squared), with the
+teleport biased towards the concept's own words so the phrases stay on topic. It
+runs in milliseconds with no API call: the explain pipeline uses it as the first
+pass and asks the LLM only when the local confidence is low, and it is the
+fallback when there is no API key.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from core.lazy import optional_import
+
+MAX_PHRASE_WORDS = 4
+WINDOW = 3
+DAMPING = 0.85
+MAX_TEXT_CHARS = 20000
+
+_STOPWORDS = set("""
+a an the of to in on at for from by with without and or but nor so yet is are was were be been being
+am do does did done doing have has had having can could may might must shall should will would
+it its it's this that these those there here their they them he she his her we our you your i me my
+what which who whom whose why how when where whether if then than as also such very more most less
+least much many some any each every all both either neither other another same own only just not no
+into onto over under about above below between through during before after again further once up down
+out off upon via per etc eg ie vs using use used uses one two three first second new like get gets
+explain explained explains describe tell show give simple simply basic basics introduction overview
+definition define defined meaning means example examples called known way ways thing things lot lots
+""".split())
+
+_WORD = re.compile(r"[A-Za-z][A-Za-z0-9'\-]*|\d+[A-Za-z][A-Za-z0-9\-]*")
+_BREAK = re.compile(r"[.!?;:\n\r\(\)\[\]\"|,]+")
+_PARAGRAPH = re.compile(r"\r?\n\s*\n")
+
+
+def _stem(word: str) -> str:
+    for suffix in ("ies", "ing", "es", "ed", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: -len(suffix)] + ("y" if suffix == "ies" else "")
+    return word
+
+def _phrases(text: str) -> Iterable[List[Tuple[str, str]]]:
+    """Runs of (stem, surface) content words, split at stopwords and punctuation."""
+    for chunk in _BREAK.split(text):
+        run: List[Tuple[str, str]] = []
+        for surface in _WORD.findall(chunk):
+            low = surface.lower().strip("'-")
+            if low in _STOPWORDS or len(low) < 2 or low.isdigit():
+                if run:
+                    yield run
+                run = []
+            else:
+                run.append((_stem(low), surface.strip("'-")))
+        if run:
+            yield run
+
+def _rank_words(runs: List[List[Tuple[str, str]]], focus: set) -> Dict[str, float]:
+    """PageRank score per word stem over the co-occurrence graph."""
+    vocab = sorted({stem for run in runs for stem, _ in run})
+    if not vocab:
+        return {}
+    index = {w: i for i, w in enumerate(vocab)}
+    pairs: Counter = Counter()
+    for run in runs:
+        ids = [index[stem] for stem, _ in run]
+        for i, a in enumerate(ids):
+            for b in ids[i + 1:i + WINDOW]:
+                if a != b:
+                    pairs[(a, b)] += 1
+                    pairs[(b, a)] += 1
+
+    np = optional_import("numpy")
+    if np is None:
+        # no numpy: degree centrality is a reasonable stand-in for PageRank
+        degree = Counter()
+        for (a, _b), weight in pairs.items():
+            degree[vocab[a]] += weight
+        total = sum(degree.values()) or 1
+        return {w: (degree[w] + 1) / total for w in vocab}
+
+    n = len(vocab)
+    # symmetric weighted edge list: rank flows src -> dst in proportion to the edge weight
+    src = np.fromiter((a for a, _ in pairs), dtype=np.int64, count=len(pairs))
+    dst = np.fromiter((b for _, b in pairs), dtype=np.int64, count=len(pairs))
+    weight = np.fromiter(pairs.values(), dtype=np.float64, count=len(pairs))
+    out = np.bincount(src, weights=weight, minlength=n)
+    share = weight / out[src] if len(pairs) else weight
+    teleport = np.ones(n)
+    for w in focus:
+        if w in index:
+            teleport[index[w]] += n / max(1, len(focus))  # topic-sensitive bias
+    teleport /= teleport.sum()
+    rank = np.full(n, 1.0 / n)
+    for _ in range(50):
+        flow = np.bincount(dst, weights=share * rank[src], minlength=n)
+        updated = (1 - DAMPING) * teleport + DAMPING * flow
+        # dangling words (no neighbours) hand their mass back via the teleport
+        updated += DAMPING * rank[out == 0].sum() * teleport
+        if np.abs(updated - rank).sum() < 1e-6:
+            rank = updated
+            break
+        rank = updated
+    return dict(zip(vocab, rank.tolist()))
+
+def extract_keyphrases(texts: List[str], focus: str = "", max_phrases: int = 10) -> List[Dict]:
+    """Top keyphrases as {"phrase", "score", "count"}, best first."""
+    text = "\n".join(t for t in texts if t)[:MAX_TEXT_CHARS]
+    runs = list(_phrases(text))
+    focus_stems = {stem for run in _phrases(focus) for stem, _ in run}
+    scores = _rank_words(runs, focus_stems)
+
+    counts: Counter = Counter()
+    surfaces: Dict[Tuple[str, ...], Counter] = defaultdict(Counter)
+    for run in runs:
+        for size in range(1, MAX_PHRASE_WORDS + 1):
+            for i in range(len(run) - size + 1):
+                gram = run[i:i + size]
+                key = tuple(stem for stem, _ in gram)
+                counts[key] += 1
+                surfaces[key][" ".join(s for _, s in gram)] += 1
+
+    candidates = []
+    for key, count in counts.items():
+        if set(key) <= focus_stems:
+            continue  # the concept itself is not one of its parts
+        if len(key) > 1 and count < 2:
+            continue  # one-off word sequences are rarely real phrases
+        score = sum(scores.get(w, 0.0) for w in key) / math.sqrt(len(key)) * (1 + math.log(count))
+        candidates.append((score, key, count))
+    candidates.sort(reverse=True)
+
+    chosen: List[Tuple[float, Tuple[str, ...], int]] = []
+    for score, key, count in candidates:
+        words = set(key) - focus_stems
+        if any(words <= set(k) - focus_stems for _, k, _ in chosen):
+            continue  # part of (or the same words as) a phrase already picked
+        # a longer phrase replaces the shorter ones it contains ("gate voltage" over "voltage")
+        contained = [i for i, (_, k, _) in enumerate(chosen) if set(k) - focus_stems <= words]
+        if contained:
+            chosen[contained[0]] = (score, key, count)
+            chosen = [c for i, c in enumerate(chosen) if i not in contained[1:]]
+        else:
+            chosen.append((score, key, count))
+        if len(chosen) >= max_phrases:
+            break
+    return [{"phrase": surfaces[key].most_common(1)[0][0], "score": round(score, 4), "count": count}
+            for score, key, count in sorted(chosen, reverse=True)]
+
+def local_decompose(concept: str, context_texts: Optional[List[str]] = None,
+                    max_atoms: int = 5) -> Tuple[List[str], float]:
+    """
+    Atoms for a concept from its own text plus retrieved snippets / document text.
+    Returns (atoms, confidence 0-1). Confidence rates the atoms themselves: an atom
+    counts only if it is on topic (shares a snippet or paragraph with the concept's
+    words, or contains one), and more if it recurs and is a multi-word phrase.
+    Text that never mentions the concept scores 0 however long it is.
+    """
+    texts = [concept] + list(context_texts or [])
+    phrases = extract_keyphrases(texts, focus=concept, max_phrases=max_atoms)
+    if not phrases:
+        return [], 0.0
+    focus_stems = {stem for run in _phrases(concept) for stem, _ in run}
+    passages = [stems for t in texts[1:] for passage in _PARAGRAPH.split(t or "")
+                for stems in [{stem for run in _phrases(passage) for stem, _ in run}] if stems & focus_stems]
+    quality = 0.0
+    for p in phrases:
+        stems = {stem for run in _phrases(p["phrase"]) for stem, _ in run}
+        if stems & focus_stems or any(stems <= s for s in passages):
+            quality += 0.5 + 0.25 * (p["count"] >= 2) + 0.25 * (len(stems) > 1)
+    confidence = quality / max_atoms
+    return [p["phrase"] for p in phrases], round(confidence, 3)
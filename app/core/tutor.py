@@ -0,0 +1,545 @@
+# app/core/tutor.py
+"""
+Tutor engine: the explain pipeline (ContextualTutorAgent) and the document,
+translation, scraping and diagram helpers it uses.
+
+Kept free of Streamlit so the same engine can be driven from the UI (main.py),
+the batch CLI (batch.py) or any other front end.
+"""
+import os
+import io
+import json
+import hashlib
+import threading
+import time
+import traceback
+from datetime import datetime
+from typing import List
+
+from core.lazy import is_available, optional_import
+from core.llm_client import get_llm, summarize_with_context, _chat_complete
+from core.pipeline import Cancelled, Deadline, Step, StepScheduler
+from core.profiling import profiled
+from core.records import ExplainRecord, pack_record
+from core.latency import BudgetPlan, plan_for_budget, step_latency
+from core.metrics import CACHE_REQUESTS, EXPLAIN_SECONDS, EXTRACT_SECONDS, STEP_SECONDS
+from core.web_search import web_search_snippets
+from core.semantic_cache import answer_cache
+from core.summarize import summarize_document, summary_focus
+from core.response_cache import response_cache
+from core.usage import profile_label, usage_ledger, usage_scope
+from core.diagrams import diagram_jobs
+from core.tools.decomposer_tool import LOCAL_MIN_CONFIDENCE, llm_decompose
+from core.tools.keyphrase_tool import local_decompose
+from core.tools.analogy_tool import analogy_generator_tool
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Profile archetypes offered in the sidebar (also what precompute.py warms by default)
+PROFILE_AGE_GROUPS = ["10-15", "16-22", "23-30", "30+"]
+PROFILE_ROLES = ["Student", "Engineer", "Teacher", "Researcher", "Professional"]
+
+# Pipeline time limits (seconds): whole request, and each step within it
+EXPLAIN_DEADLINE = float(os.getenv("EXPLAIN_DEADLINE_SECONDS", "60"))
+SUMMARY_DEADLINE = float(os.getenv("SUMMARY_DEADLINE_SECONDS", "120"))
+# Uploads: pages read from a PDF (the whole text is summarized), characters used as explain context
+MAX_PDF_PAGES = int(os.getenv("DOC_MAX_PAGES", "200"))
+DOC_CONTEXT_CHARS = 3000
+STEP_TIMEOUTS = {
+    "web_search": 10,
+    "decomposition": 15,
+    "analogies": 25,
+    "synthesis": 40,
+    "translation": 25,
+}
+
+# NEW: PDF/Image extraction
+def extract_text_from_pdf(pdf_bytes):
+    """Extract text from PDF bytes"""
+    with EXTRACT_SECONDS.labels(type="pdf").time():
+        return _extract_pdf(pdf_bytes)
+
+def _extract_pdf(pdf_bytes):
+    try:
+        fitz = optional_import("fitz")  # PyMuPDF
+        if fitz is None:
+            raise ImportError("PyMuPDF is not installed")
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        text_chunks = []
+        for page_num in range(min(MAX_PDF_PAGES, doc.page_count)):
+            page = doc.load_page(page_num)
+            text_chunks.append(page.get_text())
+        return "\n\n".join(text_chunks)
+    except Exception as e:
+        return f"PDF extraction failed: {str(e)[:100]}"
+
+def extract_text_from_image(img_bytes):
+    """Extract text from image using OCR"""
+    with EXTRACT_SECONDS.labels(type="image").time():
+        return _extract_image(img_bytes)
+
+def _extract_image(img_bytes):
+    try:
+        pytesseract = optional_import("pytesseract")
+        if pytesseract is None:
+            raise ImportError("pytesseract is not installed")
+        from PIL import Image
+        img = Image.open(io.BytesIO(img_bytes))
+        text = pytesseract.image_to_string(img)
+        return text if text.strip() else "No text found in image"
+    except Exception as e:
+        return f"OCR failed (install pytesseract): {str(e)[:100]}"
+
+# NEW: Translation function
+def translate_text(text: str, target_lang: str, timeout: float = None) -> str:
+    """Translate text to target language"""
+    if target_lang == "English" or not OPENAI_API_KEY or not text:
+        return text
+    
+    def translate():
+        return _chat_complete(
+            f"Translate the following text to {target_lang}. Maintain formatting:\n\n{text}",
+            temperature=0.3,
+            max_tokens=1500,
+            timeout=timeout,
+            step="translation"
+        )
+    
+    try:
+        text_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        return response_cache.get_or_compute("translation", [text_hash, target_lang], translate)
+    except:
+        return text  # Fallback
+
+# Web scraping utility
+_http = threading.local()
+
+def _http_session():
+    """requests.Session per thread, so repeated scrapes reuse connections"""
+    if getattr(_http, "session", None) is None:
+        import requests
+        _http.session = requests.Session()
+        _http.session.headers["User-Agent"] = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+    return _http.session
+
+def scrape_url(url: str, max_length: int = 3000) -> str:
+    try:
+        from bs4 import BeautifulSoup
+        
+        response = _http_session().get(url, timeout=10)
+        
+        if response.status_code == 200:
+            soup = BeautifulSoup(response.content, "lxml" if is_available("lxml") else "html.parser")
+            for element in soup(['script', 'style', 'nav', 'footer', 'header']):
+                element.decompose()
+            
+            text = soup.get_text(separator='\n', strip=True)
+            return text[:max_length]
+        return ""
+    except Exception as e:
+        return f"Scraping error: {str(e)[:100]}"
+
+def concept_key(concept: str) -> str:
+    return " ".join(concept.lower().split())
+
+def profile_key(profile: dict) -> list:
+    profile = profile or {}
+    return [profile.get("role", ""), profile.get("age_group", ""), profile.get("interests", "")]
+
+def _metered(step: str, fn):
+    """Step function whose LLM usage is accounted to `step`"""
+    def run(ctx):
+        with usage_scope(step=step):
+            return fn(ctx)
+    return run
+
+def _is_generated(text) -> bool:
+    """False for the tools' error / missing-key messages, which must not be cached"""
+    return bool(text) and not str(text).startswith(("❌", "⚠️"))
+
+# Main AI Agent class
+class ContextualTutorAgent:
+    """AI Agent with document context support"""
+    
+    def __init__(self):
+        self.llm = get_llm(temperature=0.7, step="synthesis")
+        
+    def explain_concept(self, concept: str, profile: dict = None, use_web: bool = True, 
+                       doc_context: str = None, target_lang: str = "English",
+                       use_cache: bool = False, force_refresh: bool = False, deadline: float = None,
+                       latency_budget: float = None, refresh_before: float = None, on_event=None,
+                       conversation: str = None, session_id: str = None, profiling: bool = False,
+                       request_id: str = None, token_scale: float = 1.0, stream: bool = True):
+        """
+        Main explanation pipeline with optional document context.
+        With use_cache, a near-duplicate past answer (same role/age group/language)
+        is returned instantly; force_refresh skips the lookup but still indexes the new answer.
+        Steps run as a dependency graph (see _build_steps) within `deadline` seconds.
+        With latency_budget (seconds) the pipeline is planned against recent step latencies
+        and degraded to fit; result["degradations"] lists what was cut.
+        Cached step outputs are reused unless force_refresh, or written before `refresh_before` (epoch).
+        on_event receives progress events as steps finish (see core/pipeline.py); in English
+        the explanation also streams as "delta" events from the synthesis step (unless not
+        stream). If on_event raises pipeline.Cancelled the run stops and result["cancelled"]
+        is set. token_scale (< 1) caps answer lengths, e.g. for background prefetches.
+        `conversation` (see core/conversation.py) is earlier-turn context for follow-up
+        questions; such answers are neither served from nor added to the answer cache.
+        LLM usage is accounted to session_id, the profile and each step (core/usage.py);
+        result["usage"] is this run's share. Over the day's soft budget the run uses shorter
+        answers, over the hard budget it is refused.
+        With profiling (or TUTOR_PROFILE=explain, see core/profiling.py) the run is sampled
+        and written as a speedscope file tagged with request_id; result["profiling"] has its
+        path and where the time went.
+        """
+        started = time.perf_counter()
+        with profiled("explain", request_id, enabled=profiling) as prof:
+            result = self._explain_metered(concept, profile, use_web, doc_context, target_lang, use_cache,
+                                           force_refresh, deadline, latency_budget, refresh_before,
+                                           on_event, conversation, session_id, token_scale, stream)
+        outcome = ("cached" if result.get("cached") else "cancelled" if result.get("cancelled")
+                   else "error" if result.get("error") else "success")
+        EXPLAIN_SECONDS.labels(outcome=outcome).observe(time.perf_counter() - started)
+        if prof is not None and prof.path is not None:
+            result["profiling"] = {"id": prof.request_id, "path": str(prof.path),
+                                 "seconds": round(prof.duration, 3), "breakdown": prof.breakdown()}
+        return result
+
+    def _explain_metered(self, concept, profile, use_web, doc_context, target_lang, use_cache,
+                         force_refresh, deadline, latency_budget, refresh_before, on_event,
+                         conversation, session_id, token_scale=1.0, stream=True):
+        with usage_scope(session=session_id, profile=profile_label(profile)) as tally:
+            budget = usage_ledger.status()
+            if budget == "hard":
+                return {"concept": concept, "timestamp": datetime.now().isoformat(),
+                        "language": target_lang, "usage_budget": budget,
+                        "steps": [{"step": "usage_budget", "status": "refused"}],
+                        "explanation": "⚠️ Daily usage budget reached - try again tomorrow.",
+                        "error": "Daily usage budget reached"}
+            result = self._explain(concept, profile, use_web, doc_context, target_lang, use_cache,
+                                   force_refresh, deadline, latency_budget, refresh_before, on_event,
+                                   conversation, cheap=budget == "soft", token_scale=token_scale, stream=stream)
+        if tally.by_step:
+            result["usage"] = tally.summary()
+        if budget != "ok":
+            result["usage_budget"] = budget
+        return result
+    
+    def summarize_document(self, doc_text: str, question: str = "", profile: dict = None,
+                           target_lang: str = "English", deadline: float = None, on_event=None,
+                           session_id: str = None):
+        """
+        Summary of a whole uploaded document (map-reduce, see core/summarize.py), as an
+        explain-shaped result: the summary is result["explanation"], and on_event gets the
+        same "step" events as explain_concept (chunk_summaries, summary_reduce, synthesis, translation).
+        """
+        result = {"concept": question or "Document summary",
+                  "profile": {"role": (profile or {}).get("role", ""), "age_group": (profile or {}).get("age_group", "")},
+                  "timestamp": datetime.now().isoformat(), "steps": [], "language": target_lang}
+        last = time.perf_counter()
+        
+        def progress(stage, info):
+            nonlocal last
+            now = time.perf_counter()
+            step = {"map": "chunk_summaries", "reduce": "summary_reduce", "final": "synthesis"}[stage]
+            rec = {"step": step, "status": "success", "duration_ms": int((now - last) * 1000), **info}
+            last = now
+            STEP_SECONDS.labels(step=step, status="success").observe(rec["duration_ms"] / 1000)
+            result["steps"].append(rec)
+            if on_event and step != "synthesis":  # the summary itself is sent once it is final
+                on_event({"type": "step", **rec, "output": None})
+        
+        with usage_scope(session=session_id, profile=profile_label(profile), step="document_summary") as tally:
+            try:
+                summary = summarize_document(doc_text, focus=summary_focus(question), profile=profile,
+                                             deadline=Deadline(deadline or SUMMARY_DEADLINE), on_progress=progress)
+                result["explanation"] = summary.text
+                if summary.errors:
+                    result["steps"].append({"step": "chunk_summaries", "status": "partial",
+                                            "error": "; ".join(summary.errors[:3])})
+                if target_lang != "English":
+                    result["explanation"] = translate_text(summary.text, target_lang)
+                    result["steps"].append({"step": "translation", "status": "success", "language": target_lang})
+                if on_event:
+                    on_event({"type": "step", "step": "translation" if target_lang != "English" else "synthesis",
+                              "status": "success", "output": result["explanation"]})
+            except Exception as e:
+                result["error"] = str(e)
+                result["explanation"] = f"Summary error: {e}"
+        if tally.by_step:
+            result["usage"] = tally.summary()
+        result["confidence"] = self._calculate_confidence(result)
+        return result
+    
+    def _explain(self, concept: str, profile: dict, use_web: bool, doc_context: str, target_lang: str,
+                 use_cache: bool, force_refresh: bool, deadline: float, latency_budget: float,
+                 refresh_before: float, on_event, conversation: str, cheap: bool = False,
+                 token_scale: float = 1.0, stream: bool = True):
+        result = {
+            "concept": concept,
+            "profile": {"role": (profile or {}).get("role", ""), "age_group": (profile or {}).get("age_group", "")},
+            "timestamp": datetime.now().isoformat(),
+            "steps": [],
+            "language": target_lang
+        }
+        
+        # Step 0: Near-duplicate answer cache (documents change the answer, so skip it then)
+        if use_cache and not force_refresh and not doc_context and not conversation:
+            hit = answer_cache.lookup(concept, profile, target_lang)
+            CACHE_REQUESTS.labels(cache="answer", kind="explain", outcome="hit" if hit else "miss").inc()
+            if hit:
+                result.update({
+                    "cached": True,
+                    "cached_markdown": hit["answer"],
+                    "cached_concept": hit["concept"],
+                    "confidence": hit.get("confidence", 0),
+                })
+                result["steps"].append({"step": "answer_cache", "status": "hit",
+                                        "similarity": hit["similarity"], "matched": hit["concept"][:100]})
+                return result
+        
+        try:
+            plan = plan_for_budget(latency_budget, use_web and not doc_context, target_lang != "English")
+            if cheap:
+                plan.token_scale = min(plan.token_scale, 0.5)
+                plan.degradations.append("usage_soft_budget")
+            plan.token_scale = min(plan.token_scale, token_scale)
+            seconds = EXPLAIN_DEADLINE if deadline is None else deadline
+            if latency_budget:
+                seconds = min(seconds, latency_budget)
+                result["latency_budget"] = latency_budget
+            if force_refresh and refresh_before is None:
+                refresh_before = time.time()
+            steps = self._build_steps(concept, profile, doc_context, target_lang, plan, refresh_before,
+                                      stream=stream and on_event is not None and target_lang == "English",
+                                      conversation=conversation)
+            for step in steps:
+                step.fn = _metered(step.name, step.fn)
+            run = StepScheduler(steps).run(Deadline(seconds), on_event=on_event)
+            outputs = run.results
+            
+            for rec in run.records:
+                if "duration_ms" in rec:
+                    STEP_SECONDS.labels(step=rec["step"], status=rec["status"]).observe(rec["duration_ms"] / 1000)
+                if rec["status"] in ("success", "no_results", "timeout") and "duration_ms" in rec:
+                    step_latency.record(rec["step"], rec["duration_ms"] / 1000, timed_out=rec["status"] == "timeout")
+            if latency_budget or cheap:
+                partial = any(r["status"] in ("timeout", "skipped") for r in run.records)
+                result["degradations"] = plan.degradations + (["partial_result"] if partial else [])
+            
+            if doc_context:
+                result["steps"].append({"step": "document_context", "status": "success"})
+            result["steps"].extend(run.records)
+            
+            if "decomposition" in outputs:
+                result["atoms"] = outputs["decomposition"]
+            
+            analogies_text = outputs.get("analogy_translation", outputs.get("analogies", ""))
+            if analogies_text:
+                result["analogies"] = analogies_text
+            
+            if "synthesis" in outputs:
+                result["explanation"] = outputs.get("translation", outputs["synthesis"])
+            elif latency_budget:
+                result["explanation"] = (f"(The full explanation did not fit the {latency_budget:g}s budget - "
+                                         "see the analogies below or ask again without fast mode.)")
+            else:
+                failure = next((s for s in run.records if s["step"] == "synthesis"), {})
+                result["explanation"] = f"Synthesis error: {failure.get('error') or failure.get('reason', 'not run')}"
+            
+            # Add sources
+            web_results = outputs.get("web_search") or []
+            if web_results:
+                result["sources"] = [{"title": r['title'], "url": r['link']} for r in web_results[:5]]
+            
+            result["confidence"] = self._calculate_confidence(result)
+            
+            # only complete answers are reused: no errors, placeholders, partial or budget-cut results,
+            # nothing that depends on a document or earlier turns. main.py saves the flag with the
+            # session so the cache's warm-up after a restart applies the same rule.
+            complete = "synthesis" in outputs and not result.get("error") and not result.get("degradations")
+            result["cacheable"] = complete and not doc_context and not conversation
+            if result["cacheable"]:
+                answer_cache.add(concept, pack_record(ExplainRecord.from_result(result)), profile, target_lang,
+                                 result["confidence"])
+            
+            return result
+            
+        except Cancelled as e:
+            result["cancelled"] = True
+            result["error"] = f"Cancelled: {e}"
+            return result
+        except Exception as e:
+            result["error"] = str(e)
+            result["traceback"] = traceback.format_exc()
+            return result
+    
+    def _build_steps(self, concept: str, profile: dict, doc_context: str, target_lang: str,
+                     plan: BudgetPlan, refresh_before: float = None, stream: bool = False,
+                     conversation: str = None) -> List[Step]:
+        """
+        Describe the explain pipeline as a dependency graph of steps.
+        Step outputs go through response_cache; entries written before `refresh_before` are recomputed.
+        With stream, a freshly generated explanation is emitted as "delta" events while it is written.
+        """
+        steps = []
+        ckey, pkey = concept_key(concept), profile_key(profile)
+        
+        # Step 1: Web Search (if no document context)
+        if plan.use_web and not doc_context:
+            def search(ctx):
+                web_results = response_cache.get_or_compute(
+                    "web_search", [ckey, plan.num_results],
+                    lambda: web_search_snippets(concept, num_results=plan.num_results, timeout=ctx.timeout()),
+                    not_before=refresh_before, cacheable=bool)
+                if web_results:
+                    ctx.note(count=len(web_results))
+                else:
+                    ctx.note(status="no_results")
+                return web_results
+            steps.append(Step("web_search", search,
+                              timeout=min(STEP_TIMEOUTS["web_search"], plan.web_timeout or STEP_TIMEOUTS["web_search"])))
+        
+        # Step 2: Decompose concept
+        if plan.decompose:
+            def decompose(ctx):
+                # Local keyphrases from the concept + evidence first (milliseconds, no API call);
+                # the LLM is asked only when they look unreliable. Its atoms are cached.
+                texts = [f"{r.get('title', '')}. {r.get('snippet', '')}" for r in ctx.results.get("web_search") or []]
+                if doc_context:
+                    texts.append(doc_context[:DOC_CONTEXT_CHARS * 5])
+                atoms, confidence = local_decompose(concept, texts, max_atoms=5)
+                if atoms and (confidence >= LOCAL_MIN_CONFIDENCE or not OPENAI_API_KEY):
+                    ctx.note(count=len(atoms), method="local", confidence=confidence)
+                    return atoms
+                llm_atoms = response_cache.get_or_compute(
+                    "decomposition", [ckey, 5],
+                    lambda: llm_decompose(concept, max_atoms=5, timeout=ctx.timeout()),
+                    not_before=refresh_before, cacheable=bool) if OPENAI_API_KEY else []
+                if llm_atoms:
+                    ctx.note(count=len(llm_atoms), method="llm", confidence=confidence)
+                    return llm_atoms
+                atoms = atoms or [a.strip() for a in concept.split(",")[:5] if a.strip()]
+                ctx.note(count=len(atoms), method="local" if confidence else "split", confidence=confidence)
+                return atoms
+            steps.append(Step("decomposition", decompose,
+                              deps=tuple(s.name for s in steps if s.name == "web_search"),
+                              timeout=STEP_TIMEOUTS["decomposition"]))
+        atom_deps = ("decomposition",) if plan.decompose else ()
+        
+        # Step 3: Generate analogies (needs atoms); the tool caches each analogy separately
+        def analogies(ctx):
+            atoms = ctx.results.get("decomposition") or []
+            return analogy_generator_tool(concept, atoms, profile, timeout=ctx.timeout(),
+                                          max_tokens=int(600 * plan.token_scale), not_before=refresh_before)
+        steps.append(Step("analogies", analogies, deps=atom_deps, timeout=STEP_TIMEOUTS["analogies"]))
+        
+        # Step 4: Synthesize final explanation (needs evidence + atoms).
+        # Under a latency budget it is optional so the other steps still return partial results.
+        def synthesis(ctx):
+            web_results = ctx.results.get("web_search") or []
+            atoms = ctx.results.get("decomposition") or []
+            on_token = (lambda text: ctx.emit("delta", text=text)) if stream else None
+            compute = lambda: self._synthesize(concept, profile, web_results, doc_context, atoms,
+                                               timeout=ctx.timeout(), token_scale=plan.token_scale,
+                                               on_token=on_token, conversation=conversation)
+            if doc_context:
+                return compute()
+            sources = [r.get("link") for r in web_results[:3]]
+            key = [ckey, pkey, sources, atoms, plan.token_scale]
+            if conversation:
+                key.append(hashlib.sha1(conversation.encode("utf-8")).hexdigest())
+            return response_cache.get_or_compute(
+                "explanation", key, compute,
+                not_before=refresh_before, cacheable=_is_generated)
+        steps.append(Step(
+            "synthesis", synthesis,
+            deps=tuple(s.name for s in steps if s.name in ("web_search", "decomposition")),
+            timeout=STEP_TIMEOUTS["synthesis"], required=plan.budget is None))
+        
+        # Step 5: Translate if needed
+        if target_lang != "English":
+            def translate_explanation(ctx):
+                ctx.note(language=target_lang)
+                return translate_text(ctx.results["synthesis"], target_lang, timeout=ctx.timeout())
+            steps.append(Step("translation", translate_explanation, needs=("synthesis",),
+                              timeout=STEP_TIMEOUTS["translation"]))
+            steps.append(Step(
+                "analogy_translation",
+                lambda ctx: translate_text(ctx.results.get("analogies") or "", target_lang, timeout=ctx.timeout()),
+                needs=("analogies",), timeout=STEP_TIMEOUTS["translation"]))
+        
+        return steps
+    
+    def _synthesize(self, concept: str, profile: dict, web_results: list, doc_context: str,
+                    atoms: list, timeout: float = None, token_scale: float = 1.0, on_token=None,
+                    conversation: str = None) -> str:
+        web_context = ""
+        if web_results:
+            web_context = "\n\n".join([
+                f"[{i+1}] {r['title']}\n{r['snippet']}\nSource: {r['link']}"
+                for i, r in enumerate(web_results[:3])
+            ])
+        if doc_context:
+            web_context = f"Document Context:\n{doc_context[:DOC_CONTEXT_CHARS]}"
+        
+        # follow-up questions are answered in light of the earlier turns
+        follow_up = f"\n\nThis is a follow-up in an ongoing conversation:\n{conversation}" if conversation else ""
+        
+        if web_context:
+            context_texts = [web_context, f"Atomic concepts: {', '.join(atoms)}"]
+            return summarize_with_context(
+                prompt=f"Explain '{concept}' for a {(profile or {}).get('role', 'student')} using analogies{follow_up}",
+                context_texts=context_texts,
+                temperature=0.7,
+                timeout=timeout,
+                max_tokens=int(800 * token_scale),
+                on_token=on_token,
+                step="synthesis"
+            )
+        
+        prompt = f"""Explain the concept: {concept}
+
+Atomic concepts: {', '.join(atoms)}
+
+User profile: {json.dumps(profile) if profile else 'General audience'}{follow_up}
+
+Provide:
+1. Clear summary (2-3 sentences)
+2. Key insights (3-4 points)
+3. Practical applications
+4. Learning roadmap (4 steps)
+5. Confidence score (0-100)
+
+Keep it educational and engaging."""
+        
+        return self.llm(prompt, timeout=timeout, max_tokens=int(700 * token_scale), on_token=on_token)
+    
+    def _calculate_confidence(self, result: dict) -> int:
+        total_steps = len(result.get("steps", []))
+        successful = len([s for s in result.get("steps", []) if s.get("status") == "success"])
+        
+        if total_steps == 0:
+            return 30
+        
+        base_score = (successful / total_steps) * 70
+        
+        if result.get("sources"):
+            base_score += 15
+        
+        if result.get("analogies"):
+            base_score += 15
+        
+        return min(100, int(base_score))
+
+def format_result_markdown(result: dict) -> str:
+    """Render an explain_concept result as chat markdown"""
+    if result.get("cached_markdown"):
+        return result["cached_markdown"]
+    return ExplainRecord.from_result(result).markdown()
+
+# Image generation
+def generate_diagram(concept: str, size: str = "1024x1024", style: str = "infographic"):
+    """Blocking diagram generation through the on-disk image cache: (local PNG path, status)."""
+    if not OPENAI_API_KEY:
+        return None, "No API key"
+    return diagram_jobs.generate(concept, size, style)
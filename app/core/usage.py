@@ -0,0 +1,283 @@
+# app/core/usage.py
+"""
+Token usage and cost accounting, with per-session and per-profile budgets.
+
+Every completion (and diagram) reports its usage to usage_ledger.record(). The
+call is attributed to the labels of the enclosing usage_scope(): session,
+profile and pipeline step. Those labels are contextvars, so they follow the work
+into the pipeline's step threads and hedged requests. Totals are kept per UTC day
+for each step, session, profile and model. Each process adds its totals to a
+shared SQLite file (storage/usage.db) every few seconds from a background thread,
+in one transaction, so Streamlit workers, the API server and batch jobs count
+against the same budgets.
+
+Usage:
+    with usage_scope(session=session_id, profile=profile_label(profile)) as tally:
+        with usage_scope(step="synthesis"):
+            _chat_complete(...)          # recorded under all three labels
+    tally.summary()                      # what this run cost, per step
+
+Budgets are in USD per UTC day (0 = off). Over a soft budget the tutor runs in a
+cheaper mode (shorter answers, USAGE_SOFT_MODEL if set). Over a hard budget LLM
+calls raise BudgetExceeded.
+
+Config (env):
+    USAGE_SESSION_SOFT_USD / USAGE_SESSION_HARD_USD   per chat / API session (default 0.05 / 0.20)
+    USAGE_PROFILE_SOFT_USD / USAGE_PROFILE_HARD_USD   per learner profile (default 0 / 0, off)
+    USAGE_SOFT_MODEL       model used over a soft budget (default: unchanged)
+    USAGE_PRICES           JSON {"model": [usd per 1K prompt tokens, per 1K completion tokens]}
+    USAGE_KEEP_DAYS        days of totals kept on disk (default 30)
+"""
+
+import atexit
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from core.metrics import STORAGE_WRITE_SECONDS
+from core.storage import STORAGE_DIR
+
+USAGE_DB = STORAGE_DIR / "usage.db"
+FLUSH_INTERVAL = 5.0
+KEEP_DAYS = int(os.environ.get("USAGE_KEEP_DAYS", "30"))
+DIMENSIONS = ("step", "session", "profile", "model")
+
+BUDGETS = {
+    "session": (float(os.environ.get("USAGE_SESSION_SOFT_USD", "0.05")),
+                float(os.environ.get("USAGE_SESSION_HARD_USD", "0.20"))),
+    "profile": (float(os.environ.get("USAGE_PROFILE_SOFT_USD", "0")),
+                float(os.environ.get("USAGE_PROFILE_HARD_USD", "0"))),
+}
+SOFT_MODEL = os.environ.get("USAGE_SOFT_MODEL") or None
+
+# USD per 1K tokens (prompt, completion); longest matching prefix wins
+PRICES = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4": (0.03, 0.06),
+}
+PRICES.update({k: tuple(v) for k, v in json.loads(os.environ.get("USAGE_PRICES", "{}")).items()})
+IMAGE_PRICES = {"dall-e-3": 0.04, "dall-e-2": 0.02}  # per standard image
+
+_labels: contextvars.ContextVar[Dict] = contextvars.ContextVar("usage_labels", default={})
+
+
+class BudgetExceeded(RuntimeError):
+    pass
+
+
+def price(model: str, prompt_tokens: int, completion_tokens: int, images: int = 0) -> float:
+    if images:
+        return images * IMAGE_PRICES.get(model, 0.04)
+    match = max((m for m in PRICES if model.startswith(m)), key=len, default=None)
+    if match is None:
+        return 0.0
+    per_prompt, per_completion = PRICES[match]
+    return (prompt_tokens * per_prompt + completion_tokens * per_completion) / 1000
+
+def profile_label(profile: Optional[dict]) -> str:
+    profile = profile or {}
+    return f"{profile.get('role') or 'anyone'}/{profile.get('age_group') or 'any age'}"
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+def _add(totals: Dict, prompt_tokens: int, completion_tokens: int, cost: float, calls: int = 1):
+    totals["calls"] = totals.get("calls", 0) + calls
+    totals["prompt_tokens"] = totals.get("prompt_tokens", 0) + prompt_tokens
+    totals["completion_tokens"] = totals.get("completion_tokens", 0) + completion_tokens
+    totals["cost_usd"] = round(totals.get("cost_usd", 0.0) + cost, 6)
+
+def _merge(days: Dict[str, Dict], more: Dict[str, Dict]):
+    """Add {day: {dim: {label: totals}}} into days."""
+    for day, dims in more.items():
+        for dim, labels in dims.items():
+            target = days.setdefault(day, {}).setdefault(dim, {})
+            for name, t in labels.items():
+                _add(target.setdefault(name, {}), t["prompt_tokens"], t["completion_tokens"],
+                     t["cost_usd"], t["calls"])
+
+
+class RunTally:
+    """Usage of one scope (e.g. one explain_concept run), per step."""
+
+    def __init__(self):
+        self.by_step: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def add(self, step: str, prompt_tokens: int, completion_tokens: int, cost: float):
+        with self._lock:
+            _add(self.by_step.setdefault(step, {}), prompt_tokens, completion_tokens, cost)
+
+    def summary(self) -> Dict:
+        with self._lock:
+            total: Dict = {}
+            for t in self.by_step.values():
+                _add(total, t["prompt_tokens"], t["completion_tokens"], t["cost_usd"], t["calls"])
+            return dict(total, by_step={k: dict(v) for k, v in self.by_step.items()})
+
+
+@contextmanager
+def usage_scope(**labels) -> Iterator[RunTally]:
+    """Attribute LLM calls made inside the block to these labels (session / profile / step)."""
+    parent = _labels.get()
+    tally = parent.get("tally") if parent.get("tally") and "session" not in labels else RunTally()
+    token = _labels.set({**parent, **{k: v for k, v in labels.items() if v}, "tally": tally})
+    try:
+        yield tally
+    finally:
+        _labels.reset(token)
+
+def current_labels() -> Dict:
+    return {k: v for k, v in _labels.get().items() if k != "tally"}
+
+
+class UsageLedger:
+    """Daily usage totals per dimension; this process's writes are added to the database on flush."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._pending: Dict[str, Dict] = {}   # recorded here, not yet flushed
+        self._flushing: Dict[str, Dict] = {}  # being written by flush() right now
+        self._flusher: Optional[threading.Thread] = None
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()   # one flush at a time
+        self._local = threading.local()
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS usage (
+                day TEXT, dim TEXT, label TEXT, calls INTEGER, prompt_tokens INTEGER,
+                completion_tokens INTEGER, cost_usd REAL, PRIMARY KEY (day, dim, label))""")
+            self._local.conn = conn
+        return conn
+
+    def record(self, model: str, prompt_tokens: int = 0, completion_tokens: int = 0, images: int = 0):
+        """Add one call's usage under the current scope's labels."""
+        labels = _labels.get()
+        cost = price(model, prompt_tokens, completion_tokens, images)
+        values = dict(labels, model=model)
+        values.setdefault("step", "other")
+        with self._lock:
+            day = self._pending.setdefault(_today(), {})
+            for dim in DIMENSIONS:
+                if values.get(dim):
+                    _add(day.setdefault(dim, {}).setdefault(str(values[dim]), {}),
+                         prompt_tokens, completion_tokens, cost)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="usage-flush", daemon=True)
+                self._flusher.start()
+        if labels.get("tally") is not None:
+            labels["tally"].add(values["step"], prompt_tokens, completion_tokens, cost)
+
+    def _flush_loop(self):
+        # flushed off the calling thread: a busy or broken usage.db must not fail or delay a
+        # completion that already succeeded (and was paid for)
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception as e:
+                print("Usage ledger flush error:", e)
+
+    def totals(self, dim: str, label: Optional[str] = None, day: Optional[str] = None) -> Dict:
+        """{label: totals} for a dimension on a day (today by default), or one label's totals."""
+        day = day or _today()
+        query = "SELECT label, calls, prompt_tokens, completion_tokens, cost_usd FROM usage WHERE day = ? AND dim = ?"
+        params = (day, dim) if label is None else (day, dim, label)
+        if label is not None:
+            query += " AND label = ?"
+        with self._lock:
+            merged: Dict[str, Dict] = {}
+            for name, calls, prompt_tokens, completion_tokens, cost in self._db().execute(query, params):
+                _add(merged.setdefault(name, {}), prompt_tokens, completion_tokens, cost, calls)
+            for source in (self._flushing, self._pending):
+                for name, t in source.get(day, {}).get(dim, {}).items():
+                    if label is None or name == label:
+                        _add(merged.setdefault(name, {}), t["prompt_tokens"], t["completion_tokens"],
+                             t["cost_usd"], t["calls"])
+        if label is not None:
+            return merged.get(label, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0})
+        return merged
+
+    def status(self, session: Optional[str] = None, profile: Optional[str] = None) -> str:
+        """"ok", "soft" or "hard" - the worst budget state of the session and profile today."""
+        labels = _labels.get()
+        state = "ok"
+        for dim, label in (("session", session or labels.get("session")),
+                           ("profile", profile or labels.get("profile"))):
+            soft, hard = BUDGETS[dim]
+            if not label or not (soft or hard):
+                continue
+            spent = self.totals(dim, label)["cost_usd"]
+            if hard and spent >= hard:
+                return "hard"
+            if soft and spent >= soft:
+                state = "soft"
+        return state
+
+    def admit(self, model: str) -> str:
+        """Model to use for a call in the current scope; raises BudgetExceeded over a hard budget."""
+        state = self.status()
+        if state == "hard":
+            raise BudgetExceeded("Daily usage budget reached - try again tomorrow.")
+        return SOFT_MODEL if state == "soft" and SOFT_MODEL else model
+
+    def flush(self):
+        """Add the pending totals to the database in one transaction; pending again if it fails."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                flushing, self._pending = self._pending, {}
+                self._flushing = flushing
+            rows = [(day, dim, name, t["calls"], t["prompt_tokens"], t["completion_tokens"], t["cost_usd"])
+                    for day, dims in flushing.items()
+                    for dim, labels in dims.items()
+                    for name, t in labels.items()]
+            conn = self._db()
+            committed = False
+            try:
+                with STORAGE_WRITE_SECONDS.labels(store="usage").time():
+                    conn.execute("BEGIN IMMEDIATE")  # other processes' additions are never overwritten
+                    try:
+                        conn.executemany(
+                            """INSERT INTO usage VALUES (?, ?, ?, ?, ?, ?, ?)
+                               ON CONFLICT (day, dim, label) DO UPDATE SET
+                                   calls = calls + excluded.calls,
+                                   prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                                   completion_tokens = completion_tokens + excluded.completion_tokens,
+                                   cost_usd = cost_usd + excluded.cost_usd""", rows)
+                        conn.execute("DELETE FROM usage WHERE day NOT IN "
+                                     "(SELECT DISTINCT day FROM usage ORDER BY day DESC LIMIT ?)", (KEEP_DAYS,))
+                        with self._lock:  # totals() sees the rows either in the database or in _flushing
+                            conn.execute("COMMIT")
+                            committed = True
+                            self._flushing = {}
+                    except BaseException:
+                        if not committed:
+                            conn.execute("ROLLBACK")
+                        raise
+            finally:
+                if not committed:
+                    with self._lock:
+                        _merge(self._pending, flushing)
+                        self._flushing = {}
+
+
+# singleton instance
+usage_ledger = UsageLedger(USAGE_DB)
+atexit.register(usage_ledger.flush)
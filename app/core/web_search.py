@@ -2,18 +2,26 @@
 """
 Small web search helper. Returns a list of short snippets (text + source).
 Uses SerpAPI if SERPAPI_API_KEY present, else uses duckduckgo-search package.
+Both go through the shared cross-process rate limiter (core/ratelimit.py).
 """
 
 import os
-from typing import List, Dict
+import time
+from typing import List, Dict, Optional
+
+from core.lazy import optional_import
+from core.metrics import SEARCH_SECONDS
+from core.ratelimit import api_limiter
 
 SERP_KEY = os.environ.get("SERPAPI_API_KEY")
 
-def serpapi_search(query: str, num_results: int = 5) -> List[Dict]:
+def serpapi_search(query: str, num_results: int = 5, timeout: Optional[float] = None) -> List[Dict]:
     from serpapi import GoogleSearch
     params = {"q": query, "api_key": SERP_KEY, "engine": "google", "num": num_results}
     search = GoogleSearch(params)
-    res = search.get_dict()
+    if timeout:
+        search.timeout = timeout
+    res = api_limiter.call("serpapi", lambda slot: search.get_dict(), timeout=timeout)
     snippets = []
     # parse organic results
     for r in res.get("organic_results", [])[:num_results]:
@@ -23,25 +31,41 @@ def serpapi_search(query: str, num_results: int = 5) -> List[Dict]:
         snippets.append({"title": title, "snippet": snippet, "link": link})
     return snippets
 
-def duckduckgo_search(query: str, num_results: int = 5) -> List[Dict]:
-    from duckduckgo_search import ddg
-    results = ddg(query, max_results=num_results)
+def duckduckgo_search(query: str, num_results: int = 5, timeout: Optional[float] = None) -> List[Dict]:
+    ddgs = optional_import("duckduckgo_search")
+    if ddgs is None:
+        raise ImportError("duckduckgo-search is not installed")
+    def search(slot):
+        if hasattr(ddgs, "DDGS"):
+            return ddgs.DDGS(timeout=int(slot.timeout or timeout or 10)).text(query, max_results=num_results)
+        # duckduckgo-search < 3 only ships the ddg() helper
+        return ddgs.ddg(query, max_results=num_results)
+    results = api_limiter.call("duckduckgo", search, timeout=timeout)
     snippets = []
     if results:
         for r in results:
             snippets.append({"title": r.get("title"), "snippet": r.get("body") or r.get("snippet"), "link": r.get("href")})
     return snippets
 
-def web_search_snippets(query: str, num_results: int = 5):
+def _timed(provider: str, search, query: str, num_results: int, timeout: Optional[float]) -> List[Dict]:
+    started, outcome = time.perf_counter(), "error"
+    try:
+        results = search(query, num_results=num_results, timeout=timeout)
+        outcome = "success" if results else "no_results"
+        return results
+    finally:
+        SEARCH_SECONDS.labels(provider=provider, outcome=outcome).observe(time.perf_counter() - started)
+
+def web_search_snippets(query: str, num_results: int = 5, timeout: Optional[float] = None):
     if SERP_KEY:
         try:
-            return serpapi_search(query, num_results=num_results)
+            return _timed("serpapi", serpapi_search, query, num_results, timeout)
         except Exception as e:
             # fallback to duckduckgo if serpapi call fails
             print("SerpAPI error:", e)
     # fallback
     try:
-        return duckduckgo_search(query, num_results=num_results)
+        return _timed("duckduckgo", duckduckgo_search, query, num_results, timeout)
     except Exception as e:
         print("DuckDuckGo error:", e)
         return []
@@ -0,0 +1,508 @@
+# app/loadtest.py - Concurrent-user load test for the tutor
+"""
+Simulate N concurrent learners and measure how throughput and latency change as N
+grows, so we know how many users one worker process can serve.
+
+Usage:
+    python app/loadtest.py --users 1,2,4,8,16 --duration 30             # agent, simulated backends
+    python app/loadtest.py --target app --users 1,4,8 --duration 60     # whole Streamlit script (AppTest)
+    python app/loadtest.py --processes 2 --users 8,16 --out load.json   # users split over 2 workers
+    python app/loadtest.py --real --users 1,2 --duration 60             # real OpenAI / search (spends tokens)
+
+Each user repeats realistic flows (weights: --mix) with a think time between them:
+    chat       a question, then a follow-up about it
+    document   questions about an uploaded document
+    quick      Quick Actions: Explain, Decompose, Analogies
+    language   a question answered in another language
+
+Targets:
+    agent   ContextualTutorAgent and the tools, called the way a UI session calls them
+    app     app/main.py through streamlit.testing AppTest, one app session per user, each
+            in its own worker process (AppTest sessions can't share one; --processes is
+            ignored). The document flow sets the extracted text the way the uploader does.
+
+Simulated backends (the default) stand in for the OpenAI client and web search with a
+configurable latency (--llm-latency, --search-latency, lognormal --jitter) and failure
+rate (--error-rate, --throttle-rate), so everything above them - pipeline, caches,
+model routing, rate limiter, usage ledger - runs for real. Every level starts from an
+empty storage directory under a temporary dir (TUTOR_STORAGE_DIR) in fresh processes.
+
+Per concurrency level the report has throughput (actions/s), latency p50 / p95 / p99
+(overall and per action), error rate and the RSS of every worker process; --out writes
+it as JSON, or CSV when the file name ends in .csv.
+"""
+import argparse
+import csv
+import json
+import math
+import multiprocessing as mp
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except:
+    pass
+
+APP_DIR = Path(__file__).parent
+
+FLOWS = ("chat", "document", "quick", "language")
+DEFAULT_MIX = "chat=5,document=1,quick=2,language=2"
+CONCEPTS = [
+    "Ohm's law", "MOSFET", "Photosynthesis", "Newton's third law", "Bernoulli's principle",
+    "Entropy", "Binary search", "Recursion", "Supply and demand", "Compound interest",
+    "DNA replication", "Plate tectonics", "Electromagnetic induction", "Fourier transform",
+    "Public key cryptography", "Natural selection", "Doppler effect", "Machine learning",
+    "Blockchain", "Quantum entanglement", "Osmosis", "Inflation", "TCP handshake", "Hash table",
+]
+FOLLOW_UPS = ["Why is that important?", "Can you give another example of it?", "How is it measured?"]
+LANGUAGES = ["Hindi", "Spanish", "French", "Tamil"]
+PROFILES = [{"role": "Student", "age_group": "16-22"}, {"role": "Engineer", "age_group": "23-30"},
+            {"role": "Teacher", "age_group": "30+"}, {"role": "Student", "age_group": "10-15"}]
+DOCUMENT = (
+    "Lecture 4: Semiconductors. A semiconductor's conductivity lies between that of a conductor and an "
+    "insulator. Doping silicon with phosphorus adds free electrons (n-type); doping with boron adds holes "
+    "(p-type). A p-n junction forms a depletion region that lets current flow in one direction only, which "
+    "is how a diode works. Transistors combine junctions so a small gate or base signal controls a larger "
+    "current, the basis of amplifiers and digital logic. ") * 6
+DOC_QUESTIONS = ["What is a depletion region?", "How does doping work?", "Why does a diode conduct one way?"]
+
+# 1x1 PNG for simulated diagrams
+_PNG_B64 = ("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg==")
+
+
+# ---------- simulated backends ----------
+
+class SimulatedBackends:
+    """OpenAI-client and web-search stand-ins with lognormal latency and injected failures."""
+
+    def __init__(self, llm_latency: float, search_latency: float, jitter: float,
+                 error_rate: float, throttle_rate: float, seed: int = 0):
+        self.llm_latency, self.search_latency, self.jitter = llm_latency, search_latency, jitter
+        self.error_rate, self.throttle_rate = error_rate, throttle_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self.images = SimpleNamespace(generate=self.generate_image)
+
+    def _sample(self, mean: float) -> float:
+        if mean <= 0:
+            return 0.0
+        with self._lock:
+            # lognormal with the requested mean
+            return self._rng.lognormvariate(math.log(mean) - self.jitter ** 2 / 2, self.jitter)
+
+    def _maybe_fail(self):
+        with self._lock:
+            roll = self._rng.random()
+        if roll < self.throttle_rate:
+            raise RuntimeError("Error code: 429 - Rate limit reached (simulated). Please try again in 500ms.")
+        if roll < self.throttle_rate + self.error_rate:
+            raise RuntimeError("Error code: 500 - Internal server error (simulated)")
+
+    @staticmethod
+    def _answer(prompt: str, max_tokens: int) -> str:
+        if "JSON array" in prompt:
+            return json.dumps(["first building block", "how the parts interact", "a worked example",
+                               "common misconception", "where it is used"])
+        words = max(20, min(max_tokens, 600) * 3 // 4)
+        return " ".join(f"simulated{i % 50}" for i in range(words))
+
+    def create(self, model: str, messages: List[Dict], max_tokens: int = 700, timeout: Optional[float] = None,
+               stream: bool = False, **_):
+        prompt = messages[-1]["content"]
+        text = self._answer(prompt, max_tokens)
+        # generation time grows with answer length; a 700-token answer takes ~llm_latency
+        delay = self._sample(self.llm_latency) * (0.3 + 0.7 * min(max_tokens, 1500) / 700)
+        usage = SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=len(text) // 4)
+        if timeout and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("Request timed out (simulated).")
+        self._maybe_fail()
+        if not stream:
+            time.sleep(delay)
+            message = SimpleNamespace(content=text)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+        def chunks():
+            pieces = text.split(" ")
+            step = max(1, len(pieces) // 20)
+            for i in range(0, len(pieces), step):
+                time.sleep(delay / 20)
+                delta = SimpleNamespace(content=" ".join(pieces[i:i + step]) + " ")
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+            yield SimpleNamespace(choices=[], usage=usage)
+        return chunks()
+
+    def generate_image(self, **_):
+        time.sleep(self._sample(self.llm_latency * 4))
+        self._maybe_fail()
+        return SimpleNamespace(data=[SimpleNamespace(b64_json=_PNG_B64)])
+
+    def search(self, query: str, num_results: int = 5, timeout: Optional[float] = None) -> List[Dict]:
+        time.sleep(min(self._sample(self.search_latency), timeout or 60))
+        return [{"title": f"{query} - overview {i}",
+                 "snippet": f"{query} explained: the key idea of {query} and how {query} is applied in practice.",
+                 "link": f"https://example.org/{abs(hash(query)) % 10000}/{i}"}
+                for i in range(num_results)]
+
+    def install(self):
+        """Route the app's OpenAI and search calls to the simulation (this process only)."""
+        import core.llm_client as llm
+        import core.web_search as web
+        llm.get_client = lambda max_retries=2, base_url=None: self
+        llm.HEDGE_ENABLED = False  # hedged attempts build their own real client
+        web.SERP_KEY = None
+        web.duckduckgo_search = self.search
+
+
+# ---------- simulated users ----------
+
+def _timed(samples: List[Tuple[str, float, bool]], action: str, fn) -> object:
+    started = time.monotonic()
+    try:
+        result = fn()
+        ok = not (isinstance(result, dict) and result.get("error"))
+    except Exception:
+        result, ok = None, False
+    samples.append((action, time.monotonic() - started, ok))
+    return result
+
+
+class AgentUser:
+    """One learner using the engine directly, as a UI session would."""
+
+    def __init__(self, uid: int, rng: random.Random):
+        from core.conversation import ConversationMemory
+        from core.tutor import ContextualTutorAgent
+        self.agent = _shared_agent(ContextualTutorAgent)
+        self.rng = rng
+        self.profile = rng.choice(PROFILES)
+        self.memory = ConversationMemory(session_id=f"load-{os.getpid()}-{uid}")
+
+    def _explain(self, concept: str, **kwargs) -> Dict:
+        kwargs.setdefault("latency_budget", 8.0)
+        return self.agent.explain_concept(concept, self.profile, use_cache=True, on_event=lambda e: None,
+                                          session_id=self.memory.session_id, **kwargs)
+
+    def run(self, flow: str) -> List[Tuple[str, float, bool]]:
+        from core.conversation import is_follow_up
+        from core.tools.analogy_tool import analogy_generator_tool
+        from core.tools.decomposer_tool import decompose_concept_tool
+        samples: List[Tuple[str, float, bool]] = []
+        concept = self.rng.choice(CONCEPTS)
+        if flow == "chat":
+            for question in (concept, self.rng.choice(FOLLOW_UPS)):
+                context = self.memory.context() if is_follow_up(question) and self.memory.messages else None
+                result = _timed(samples, "chat", lambda: self._explain(question, conversation=context)) or {}
+                self.memory.add("user", question)
+                self.memory.add("assistant", result.get("explanation", ""), gist=result.get("explanation"))
+        elif flow == "document":
+            for question in self.rng.sample(DOC_QUESTIONS, 2):
+                _timed(samples, "document", lambda: self._explain(question, use_web=False, doc_context=DOCUMENT))
+        elif flow == "quick":
+            _timed(samples, "quick_explain", lambda: self._explain(concept, latency_budget=20.0))
+            atoms = _timed(samples, "quick_decompose", lambda: decompose_concept_tool(concept, 5)) or []
+            _timed(samples, "quick_analogies", lambda: analogy_generator_tool(concept, atoms, self.profile))
+        elif flow == "language":
+            _timed(samples, "language", lambda: self._explain(concept, target_lang=self.rng.choice(LANGUAGES)))
+        return samples
+
+
+class AppUser:
+    """One learner driving app/main.py through AppTest (its own Streamlit session and process)."""
+
+    def __init__(self, uid: int, rng: random.Random, timeout: float = 120):
+        from streamlit.testing.v1 import AppTest
+        self.rng = rng
+        self.timeout = timeout
+        self.at = AppTest.from_file(str(APP_DIR / "main.py"), default_timeout=timeout).run()
+
+    def _ok(self) -> Dict:
+        return {"error": "exception"} if self.at.exception else {}
+
+    def _ask(self, question: str) -> Dict:
+        self.at.chat_input[0].set_value(question).run()
+        return self._ok()
+
+    def _click(self, label: str) -> Dict:
+        next(b for b in self.at.button if b.label == label).click().run()
+        return self._ok()
+
+    def run(self, flow: str) -> List[Tuple[str, float, bool]]:
+        samples: List[Tuple[str, float, bool]] = []
+        concept = self.rng.choice(CONCEPTS)
+        state = self.at.session_state
+        if flow == "chat":
+            _timed(samples, "chat", lambda: self._ask(concept))
+            _timed(samples, "chat", lambda: self._ask(self.rng.choice(FOLLOW_UPS)))
+        elif flow == "document":
+            state["uploaded_doc_text"], state["uploaded_filename"] = DOCUMENT, "lecture4.pdf"
+            for question in self.rng.sample(DOC_QUESTIONS, 2):
+                _timed(samples, "document", lambda: self._ask(question))
+            state["uploaded_doc_text"], state["uploaded_filename"] = None, None
+        elif flow == "quick":
+            self.at.text_area[0].input(concept).run()
+            _timed(samples, "quick_explain", lambda: self._click("⚡ Explain"))
+            _timed(samples, "quick_decompose", lambda: self._click("🧠 Decompose"))
+            _timed(samples, "quick_analogies", lambda: self._click("💡 Analogies"))
+        elif flow == "language":
+            selector = self.at.selectbox(key="language_selector")
+            _timed(samples, "language_switch", lambda: (selector.set_value(self.rng.choice(LANGUAGES)).run(),
+                                                       self._ok())[1])
+            _timed(samples, "language", lambda: self._ask(concept))
+            self.at.selectbox(key="language_selector").set_value("English").run()
+        return samples
+
+
+_agent_lock = threading.Lock()
+_agent = None
+
+def _shared_agent(factory):
+    """One agent per process, like main.py's st.cache_resource."""
+    global _agent
+    with _agent_lock:
+        if _agent is None:
+            _agent = factory()
+        return _agent
+
+
+# ---------- running a level ----------
+
+def rss_mb() -> float:
+    """Current resident set size of this process (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _setup(config: Dict, storage: Path):
+    """Per-process environment; must run before the app's modules are imported."""
+    os.environ["TUTOR_STORAGE_DIR"] = str(storage)
+    storage.mkdir(parents=True, exist_ok=True)
+    if not config["real"]:
+        os.environ["OPENAI_API_KEY"] = "sk-simulated"
+        # simulated spend must not trip the daily usage budgets mid-run
+        for var in ("USAGE_SESSION_SOFT_USD", "USAGE_SESSION_HARD_USD", "USAGE_PROFILE_SOFT_USD", "USAGE_PROFILE_HARD_USD"):
+            os.environ[var] = "0"
+    sys.path.insert(0, str(APP_DIR))
+    if not config["real"]:
+        SimulatedBackends(config["llm_latency"], config["search_latency"], config["jitter"],
+                          config["error_rate"], config["throttle_rate"], seed=config["seed"]).install()
+
+
+def _worker(config: Dict, users: int, first_uid: int, storage: str, out: "mp.Queue"):
+    _setup(config, Path(storage))
+    make_user = AppUser if config["target"] == "app" else AgentUser
+    flows, weights = zip(*config["mix"].items())
+    stop = time.monotonic() + config["duration"]
+    samples: List[Tuple[str, float, bool]] = []
+    lock = threading.Lock()
+    peak = [rss_mb()]
+
+    def user_loop(uid: int):
+        rng = random.Random(config["seed"] * 100003 + uid)
+        try:
+            user = make_user(uid, rng)
+        except Exception as e:
+            with lock:
+                samples.append(("session_start", 0.0, False))
+            print(f"user {uid} could not start: {e}", file=sys.stderr)
+            return
+        while time.monotonic() < stop:
+            done = user.run(rng.choices(flows, weights)[0])
+            with lock:
+                samples.extend(done)
+            if config["think"]:
+                time.sleep(rng.expovariate(1 / config["think"]))
+
+    def sample_rss():
+        while any(t.is_alive() for t in threads):
+            peak[0] = max(peak[0], rss_mb())
+            time.sleep(0.5)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=user_loop, args=(first_uid + i,), daemon=True) for i in range(users)]
+    for t in threads:
+        t.start()
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+    for t in threads:
+        t.join()
+    out.put({"pid": os.getpid(), "users": users, "elapsed_s": time.monotonic() - started,
+             "samples": samples, "rss_mb": round(rss_mb(), 1), "rss_peak_mb": round(max(peak[0], rss_mb()), 1)})
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _latency(values: List[float]) -> Dict[str, float]:
+    return {"n": len(values), "p50": round(_percentile(values, 50), 3),
+            "p95": round(_percentile(values, 95), 3), "p99": round(_percentile(values, 99), 3)}
+
+
+def run_level(config: Dict, users: int, processes: int, storage_root: Path) -> Dict:
+    """Run `users` concurrent users spread over `processes` fresh worker processes."""
+    ctx = mp.get_context("spawn")
+    out = ctx.Queue()
+    if config["target"] == "app":
+        processes = users  # AppTest runs the script in-process and isn't safe to run from threads
+    processes = max(1, min(processes, users))
+    shares = [users // processes + (1 if i < users % processes else 0) for i in range(processes)]
+    storage = storage_root / f"users-{users}"
+    workers, first = [], 0
+    for share in shares:
+        p = ctx.Process(target=_worker, args=(config, share, first, str(storage), out))
+        p.start()
+        workers.append(p)
+        first += share
+    reports = [out.get() for _ in workers]
+    for p in workers:
+        p.join()
+
+    samples = [s for r in reports for s in r["samples"]]
+    elapsed = max(r["elapsed_s"] for r in reports)
+    ok = [seconds for _, seconds, good in samples if good]
+    by_action: Dict[str, List[float]] = {}
+    for action, seconds, good in samples:
+        if good:
+            by_action.setdefault(action, []).append(seconds)
+    return {
+        "users": users,
+        "processes": len(workers),
+        "actions": len(samples),
+        "throughput_per_s": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        "error_rate": round(1 - len(ok) / len(samples), 4) if samples else 0.0,
+        "latency_s": _latency(ok),
+        "by_action": {a: _latency(v) for a, v in sorted(by_action.items())},
+        "rss_mb": [r["rss_mb"] for r in reports],
+        "rss_peak_mb": [r["rss_peak_mb"] for r in reports],
+    }
+
+
+# ---------- reporting ----------
+
+def print_level(level: Dict, verbose: bool):
+    lat = level["latency_s"]
+    print(f"{level['users']:>5} {level['processes']:>5} {level['throughput_per_s']:>10.2f} "
+          f"{lat['p50']:>7.2f}s {lat['p95']:>7.2f}s {lat['p99']:>7.2f}s {level['error_rate']:>7.1%}  "
+          f"{', '.join(f'{m:.0f}' for m in level['rss_peak_mb'])}", flush=True)
+    if verbose:
+        for action, a in level["by_action"].items():
+            print(f"{'':>11}{action:<18} n={a['n']:<5} p50 {a['p50']:.2f}s  p95 {a['p95']:.2f}s  p99 {a['p99']:.2f}s")
+
+
+def print_curves(levels: List[Dict]):
+    top = max(l["throughput_per_s"] for l in levels) or 1.0
+    slowest = max(l["latency_s"]["p95"] for l in levels) or 1.0
+    print("\nthroughput (actions/s)                   p95 latency")
+    for l in levels:
+        t, p95 = l["throughput_per_s"], l["latency_s"]["p95"]
+        print(f"{l['users']:>5} users  {'#' * int(round(24 * t / top)):<24} {t:>6.2f}   "
+              f"{'#' * int(round(24 * p95 / slowest)):<24} {p95:>6.2f}s")
+    # the knee: the last level that still added >10% throughput
+    knee = levels[0]
+    for prev, cur in zip(levels, levels[1:]):
+        if cur["throughput_per_s"] < prev["throughput_per_s"] * 1.1:
+            break
+        knee = cur
+    per_process = (f"~{knee['users'] / knee['processes']:.0f} per worker process, "
+                   if knee["processes"] < knee["users"] else "")
+    if knee is levels[-1]:
+        print(f"\nThroughput still scaling at {knee['users']} users (p95 {knee['latency_s']['p95']:.2f}s); "
+              "try higher levels to find the knee.")
+        return
+    print(f"\nThroughput stops scaling after ~{knee['users']} users "
+          f"({per_process}p95 {knee['latency_s']['p95']:.2f}s).")
+
+
+def write_report(path: Path, config: Dict, levels: List[Dict]):
+    if path.suffix.lower() == ".csv":
+        with open(path, "w", newline="", encoding="utf-8") as fh:
+            w = csv.writer(fh)
+            w.writerow(["users", "processes", "throughput_per_s", "p50_s", "p95_s", "p99_s",
+                        "error_rate", "rss_peak_mb_max"])
+            for l in levels:
+                lat = l["latency_s"]
+                w.writerow([l["users"], l["processes"], l["throughput_per_s"], lat["p50"], lat["p95"],
+                            lat["p99"], l["error_rate"], max(l["rss_peak_mb"])])
+    else:
+        path.write_text(json.dumps({"config": config, "levels": levels}, indent=2), encoding="utf-8")
+
+
+def _parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in FLOWS:
+            raise argparse.ArgumentTypeError(f"unknown flow {name!r} (choose from {', '.join(FLOWS)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Concurrent-user load test for the tutor")
+    parser.add_argument("--target", choices=["agent", "app"], default="agent")
+    parser.add_argument("--users", default="1,2,4,8,16", help="comma-separated concurrency levels")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes the users are split over (app target: one per user)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per level")
+    parser.add_argument("--think", type=float, default=1.0, help="mean think time between flows (s)")
+    parser.add_argument("--mix", type=_parse_mix, default=_parse_mix(DEFAULT_MIX), help=f"flow weights ({DEFAULT_MIX})")
+    parser.add_argument("--real", action="store_true", help="use the real OpenAI / search backends")
+    parser.add_argument("--llm-latency", type=float, default=1.5, help="simulated mean for a 700-token answer (s)")
+    parser.add_argument("--search-latency", type=float, default=0.8, help="simulated mean search latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.5, help="lognormal sigma of simulated latencies")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of simulated LLM calls that fail")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of simulated LLM calls that get 429")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--storage", type=Path, help="storage root (default: a temporary directory)")
+    parser.add_argument("--out", type=Path, help="write the report as JSON (or CSV)")
+    parser.add_argument("--verbose", action="store_true", help="per-action latencies")
+    args = parser.parse_args(argv)
+
+    if args.real and not os.environ.get("OPENAI_API_KEY"):
+        print("--real needs OPENAI_API_KEY", file=sys.stderr)
+        return 2
+    config = {k: getattr(args, k) for k in ("target", "duration", "think", "mix", "real", "llm_latency",
+                                            "search_latency", "jitter", "error_rate", "throttle_rate", "seed")}
+    levels_wanted = [int(u) for u in args.users.split(",") if u.strip()]
+
+    print(f"{args.target} target, {'real' if args.real else 'simulated'} backends, "
+          f"{args.duration:g}s per level, mix {args.mix}")
+    print(f"{'users':>5} {'procs':>5} {'actions/s':>10} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7}  peak RSS MB")
+    levels = []
+    with tempfile.TemporaryDirectory(prefix="tutor-load-") as tmp:
+        root = args.storage or Path(tmp)
+        for users in levels_wanted:
+            level = run_level(config, users, args.processes, root)
+            levels.append(level)
+            print_level(level, args.verbose)
+    if levels:
+        print_curves(levels)
+    if args.out:
+        write_report(args.out, config, levels)
+        print(f"Report written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
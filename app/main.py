@@ -7,7 +7,6 @@ import base64
 import traceback
 from pathlib import Path
 from datetime import datetime
-from PIL import Image
 import streamlit as st
 
 try:
@@ -21,12 +20,31 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 SERPAPI_KEY = os.getenv("SERPAPI_API_KEY")
 
 # Import your existing modules
-from core.llm_client import get_llm, summarize_with_context
 from core.web_search import web_search_snippets
+from core.llm_client import warm_up
 from core.storage import memory_store
+from core.records import ExplainRecord, pack_record
+from core.semantic_cache import answer_cache
+from core.diagrams import DIAGRAM_STYLES, diagram_jobs
+from core.tools.image_tool import placeholder_png
+from core.prefetch import prefetcher
+from core.usage import profile_label, usage_ledger, usage_scope
+from core.profiling import parse_kinds, profiled, requested
+from core.metrics import metrics, summary as metrics_summary
+from core.conversation import ConversationMemory, is_follow_up, prune_archives
+from core.summarize import is_summary_request
 from core.tools.decomposer_tool import decompose_concept_tool
-from core.tools.analogy_tool import analogy_generator_tool
-from core.tools.image_tool import generate_image_bytes
+from core.tools.analogy_tool import ANALOGY_KINDS, format_analogy, generate_analogy_set, regenerate_analogy
+from core.tutor import (
+    PROFILE_AGE_GROUPS,
+    PROFILE_ROLES,
+    ContextualTutorAgent,
+    extract_text_from_image,
+    extract_text_from_pdf,
+    format_result_markdown,
+    scrape_url,
+    translate_text,
+)
 
 # Storage paths
 APP_DIR = Path(__file__).parent
@@ -36,244 +54,247 @@ PROFILES_DIR = APP_DIR / "core" / "data"
 PROFILES_DIR.mkdir(parents=True, exist_ok=True)
 PROFILES_FILE = PROFILES_DIR / "sample_profiles.json"
 
-# NEW: PDF/Image extraction
-def extract_text_from_pdf(pdf_bytes):
-    """Extract text from PDF bytes"""
-    try:
-        import fitz  # PyMuPDF
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        text_chunks = []
-        for page_num in range(min(5, doc.page_count)):  # First 5 pages
-            page = doc.load_page(page_num)
-            text_chunks.append(page.get_text())
-        return "\n\n".join(text_chunks)
-    except Exception as e:
-        return f"PDF extraction failed: {str(e)[:100]}"
+# Latency budget (seconds) for the Quick Actions Explain button
+EXPLAIN_BUTTON_BUDGET = 20.0
 
-def extract_text_from_image(img_bytes):
-    """Extract text from image using OCR"""
-    try:
-        import pytesseract
-        from PIL import Image
-        img = Image.open(io.BytesIO(img_bytes))
-        text = pytesseract.image_to_string(img)
-        return text if text.strip() else "No text found in image"
-    except Exception as e:
-        return f"OCR failed (install pytesseract): {str(e)[:100]}"
+# Sidebar fragments rerun on their own (st.fragment); older Streamlit reruns the whole page
+HAS_FRAGMENTS = hasattr(st, "fragment")
+fragment = st.fragment if HAS_FRAGMENTS else (lambda fn: fn)
 
-# NEW: Translation function
-def translate_text(text: str, target_lang: str) -> str:
-    """Translate text to target language"""
-    if target_lang == "English" or not OPENAI_API_KEY:
-        return text
-    
+def rerun_panel():
+    """Rerun just the calling fragment (the whole script on older Streamlit or in a full run)"""
+    if HAS_FRAGMENTS:
+        try:
+            st.rerun(scope="fragment")
+        except st.errors.StreamlitAPIException:
+            pass  # the fragment ran as part of a full rerun
+    st.rerun()
+
+def _file_version(path: Path):
     try:
-        from openai import OpenAI
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{
-                "role": "user",
-                "content": f"Translate the following text to {target_lang}. Maintain formatting:\n\n{text}"
-            }],
-            temperature=0.3,
-            max_tokens=1500
-        )
-        return response.choices[0].message.content
-    except:
-        return text  # Fallback
+        info = path.stat()
+        return (info.st_mtime_ns, info.st_size)
+    except FileNotFoundError:
+        return None
 
-# Profile management
-def load_profiles():
-    if PROFILES_FILE.exists():
+# Profile management: parsed once per version of the file, so reruns cost a stat
+@st.cache_data(max_entries=4, show_spinner=False)
+def _profiles_at(version):
+    if version is not None:
         try:
             return json.loads(PROFILES_FILE.read_text())
         except:
             return []
     return []
 
+def load_profiles():
+    return _profiles_at(_file_version(PROFILES_FILE))
+
 def save_profile(profile):
     profiles = load_profiles()
     existing = [p for p in profiles if p.get('name') != profile.get('name')]
     existing.append(profile)
     PROFILES_FILE.write_text(json.dumps(existing, indent=2))
 
-# Web scraping utility
-def scrape_url(url: str, max_length: int = 3000) -> str:
-    try:
-        import requests
-        from bs4 import BeautifulSoup
-        
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-        response = requests.get(url, headers=headers, timeout=10)
-        
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.content, 'html.parser')
-            for element in soup(['script', 'style', 'nav', 'footer', 'header']):
-                element.decompose()
-            
-            text = soup.get_text(separator='\n', strip=True)
-            return text[:max_length]
-        return ""
-    except Exception as e:
-        return f"Scraping error: {str(e)[:100]}"
+# Progressive rendering of explain_concept events
+STEP_LABELS = {
+    "web_search": "🌐 Sources found",
+    "decomposition": "🧠 Atomic ideas ready",
+    "analogies": "💡 Analogies ready",
+    "synthesis": "📝 Explanation written",
+    "translation": "🌍 Explanation translated",
+    "analogy_translation": "🌍 Analogies translated",
+    "chunk_summaries": "📑 Document sections summarized",
+    "summary_reduce": "🧩 Section summaries merged",
+}
 
-# Main AI Agent class
-class ContextualTutorAgent:
-    """AI Agent with document context support"""
+class ProgressiveAnswer:
+    """Fills the assistant message section by section as pipeline events arrive"""
     
-    def __init__(self):
-        self.llm = get_llm(temperature=0.7)
-        
-    def explain_concept(self, concept: str, profile: dict = None, use_web: bool = True, 
-                       doc_context: str = None, target_lang: str = "English"):
-        """
-        Main explanation pipeline with optional document context
-        """
-        result = {
-            "concept": concept,
-            "profile": profile,
-            "timestamp": datetime.now().isoformat(),
-            "steps": [],
-            "language": target_lang
-        }
-        
-        try:
-            # Step 1: Web Search (if no document context)
-            web_results = []
-            web_context = ""
-            
-            if use_web and not doc_context:
-                try:
-                    web_results = web_search_snippets(concept, num_results=5)
-                    if web_results:
-                        web_context = "\n\n".join([
-                            f"[{i+1}] {r['title']}\n{r['snippet']}\nSource: {r['link']}"
-                            for i, r in enumerate(web_results[:3])
-                        ])
-                        result["steps"].append({"step": "web_search", "status": "success", "count": len(web_results)})
-                    else:
-                        result["steps"].append({"step": "web_search", "status": "no_results"})
-                except Exception as e:
-                    result["steps"].append({"step": "web_search", "status": "error", "error": str(e)[:100]})
-            
-            # Step 2: Use document context if provided
-            if doc_context:
-                web_context = f"Document Context:\n{doc_context[:3000]}"
-                result["steps"].append({"step": "document_context", "status": "success"})
-            
-            # Step 3: Decompose concept
-            atoms = []
-            try:
-                atoms = decompose_concept_tool(concept, max_atoms=5)
-                result["atoms"] = atoms
-                result["steps"].append({"step": "decomposition", "status": "success", "count": len(atoms)})
-            except Exception as e:
-                result["steps"].append({"step": "decomposition", "status": "error", "error": str(e)[:100]})
-            
-            # Step 4: Generate analogies
-            analogies_text = ""
-            try:
-                analogies_text = analogy_generator_tool(concept, atoms, profile)
-                result["analogies"] = analogies_text
-                result["steps"].append({"step": "analogies", "status": "success"})
-            except Exception as e:
-                result["steps"].append({"step": "analogies", "status": "error", "error": str(e)[:100]})
-            
-            # Step 5: Synthesize final explanation
-            try:
-                if web_context or doc_context:
-                    context_texts = [web_context, f"Atomic concepts: {', '.join(atoms)}"]
-                    final_explanation = summarize_with_context(
-                        prompt=f"Explain '{concept}' for a {profile.get('role', 'student')} using analogies",
-                        context_texts=context_texts,
-                        temperature=0.7
-                    )
-                else:
-                    prompt = f"""Explain the concept: {concept}
+    def __init__(self, target_lang: str):
+        self.translate = target_lang != "English"
+        self.status = st.status("🔍 Processing...", expanded=False)
+        self.body = st.empty()
+        with self.body.container():
+            self.summary = st.empty()
+            self.atoms = st.empty()
+            self.analogies = st.empty()
+            self.sources = st.empty()
+        self.streamed = ""
+    
+    def __call__(self, event: dict):
+        if event["type"] == "delta":
+            self.streamed += event["text"]
+            self.summary.markdown(f"**Summary:**\n{self.streamed}▌")
+            return
+        step, output = event["step"], event.get("output")
+        if event["status"] in ("success", "no_results"):
+            self.status.write(STEP_LABELS.get(step, step))
+            self.status.update(label=f"{STEP_LABELS.get(step, step)}...")
+        else:
+            self.status.write(f"⚠️ {step}: {event['status']}")
+        if not output:
+            return
+        if step == "web_search":
+            links = "\n".join(f"• [{r['title']}]({r['link']})" for r in output[:5])
+            self.sources.markdown(f"**Sources:**\n{links}")
+        elif step == "decomposition":
+            self.atoms.markdown("**Atomic Concepts:**\n" + "\n".join(f"• {a}" for a in output))
+        elif step == ("analogy_translation" if self.translate else "analogies"):
+            self.analogies.markdown(f"**Analogies:**\n{output}")
+        elif step == "synthesis" and self.translate:
+            self.summary.markdown("**Summary:**\n_Translating..._")
+        elif step == ("translation" if self.translate else "synthesis"):
+            self.summary.markdown(f"**Summary:**\n{output}")
+    
+    def finish(self, response_md: str, ok: bool = True):
+        self.status.update(label="✅ Done" if ok else "⚠️ Finished with errors", state="complete" if ok else "error")
+        self.body.markdown(response_md)
 
-Atomic concepts: {', '.join(atoms)}
+# Recent-session previews, re-read only after the session file was written
+@st.cache_data(max_entries=4, show_spinner=False)
+def _recent_sessions_at(version, limit: int):
+    return [{"concept_preview": s.get("concept_preview", "Session"), "ts": s.get("ts", "N/A")}
+            for s in memory_store.list_sessions()[:limit]]
 
-User profile: {json.dumps(profile) if profile else 'General audience'}
+def recent_sessions(limit: int = 5):
+    return _recent_sessions_at(memory_store.version(), limit)
 
-Provide:
-1. Clear summary (2-3 sentences)
-2. Key insights (3-4 points)
-3. Practical applications
-4. Learning roadmap (4 steps)
-5. Confidence score (0-100)
+# Tool availability only depends on the environment: render the badges once per process
+@st.cache_resource(show_spinner=False)
+def tool_badges_html() -> str:
+    tools_status = {
+        "🌐 Web Search": bool(web_search_snippets),
+        "🤖 OpenAI GPT": bool(OPENAI_API_KEY),
+        "🎨 DALL-E": bool(OPENAI_API_KEY),
+        "🧠 Decomposer": True,
+        "💡 Analogy Gen": True,
+        "📄 PDF/Image": True,
+        "🌍 Multilingual": bool(OPENAI_API_KEY),
+    }
+    badges = []
+    for tool, available in tools_status.items():
+        status_class = "status-success" if available else "status-error"
+        icon = "✅" if available else "❌"
+        badges.append(f"<div class='tool-badge'>{tool} <span class='{status_class}'>{icon}</span></div>")
+    return "\n".join(badges)
 
-Keep it educational and engaging."""
-                    
-                    final_explanation = self.llm(prompt)
-                
-                # NEW: Translate if needed
-                if target_lang != "English":
-                    final_explanation = translate_text(final_explanation, target_lang)
-                    analogies_text = translate_text(analogies_text, target_lang)
-                    result["steps"].append({"step": "translation", "status": "success", "language": target_lang})
-                
-                result["explanation"] = final_explanation
-                result["analogies"] = analogies_text
-                result["steps"].append({"step": "synthesis", "status": "success"})
-                
-            except Exception as e:
-                result["explanation"] = f"Synthesis error: {str(e)[:200]}"
-                result["steps"].append({"step": "synthesis", "status": "error", "error": str(e)[:100]})
-            
-            # Add sources
-            if web_results:
-                result["sources"] = [{"title": r['title'], "url": r['link']} for r in web_results[:5]]
-            
-            result["confidence"] = self._calculate_confidence(result)
-            
-            return result
+@fragment
+def tools_panel():
+    st.markdown("### 🛠️ Agent Tools Status")
+    st.markdown(tool_badges_html(), unsafe_allow_html=True)
+    live = metrics_summary()
+    if live["explains"]:
+        hit_rate = "n/a" if live["cache_hit_rate"] is None else f"{live['cache_hit_rate']:.0%}"
+        st.caption(f"📈 {live['explains']} explanations · p50 {live['explain_p50']:.1f}s · "
+                   f"p95 {live['explain_p95']:.1f}s · cache hits {hit_rate}")
+
+@fragment
+def profile_panel():
+    st.markdown("### 👤 User Profile")
+    with st.expander("📝 Manage Profile", expanded=False):
+        profiles = load_profiles()
+        
+        if profiles:
+            profile_names = ["Create New"] + [p.get('name', 'Unnamed') for p in profiles]
+            selected_profile_name = st.selectbox("Select Profile", profile_names, key="profile_selector")
             
-        except Exception as e:
-            result["error"] = str(e)
-            result["traceback"] = traceback.format_exc()
-            return result
+            if selected_profile_name != "Create New":
+                idx = profile_names.index(selected_profile_name) - 1
+                st.session_state.current_profile = profiles[idx]
+                st.success(f"✅ Loaded: {selected_profile_name}")
+        
+        name = st.text_input("Name", value=st.session_state.current_profile.get('name', ''))
+        age_group = st.selectbox("Age Group", PROFILE_AGE_GROUPS)
+        role = st.selectbox("Role", PROFILE_ROLES)
+        interests = st.text_input("Interests", value=st.session_state.current_profile.get('interests', 'technology'))
+        
+        if st.button("💾 Save Profile", use_container_width=True):
+            new_profile = {
+                "name": name,
+                "age_group": age_group,
+                "role": role,
+                "interests": interests,
+                "created_at": datetime.now().isoformat()
+            }
+            save_profile(new_profile)
+            st.session_state.current_profile = new_profile
+            st.success("✅ Profile saved!")
+            rerun_panel()
+
+@fragment
+def sessions_panel():
+    st.markdown("### 📚 Recent Sessions")
+    sessions = recent_sessions(5)
     
-    def _calculate_confidence(self, result: dict) -> int:
-        total_steps = len(result.get("steps", []))
-        successful = len([s for s in result.get("steps", []) if s.get("status") == "success"])
-        
-        if total_steps == 0:
-            return 30
-        
-        base_score = (successful / total_steps) * 70
-        
-        if result.get("sources"):
-            base_score += 15
-        
-        if result.get("analogies"):
-            base_score += 15
-        
-        return min(100, int(base_score))
+    if sessions:
+        for i, session in enumerate(sessions):
+            with st.expander(f"📝 {session['concept_preview'][:35]}..."):
+                st.caption(f"🕐 {session['ts']}")
+                if st.button(f"Load", key=f"load_session_{i}"):
+                    st.session_state.last_result = memory_store.get_session(i)
+                    st.rerun()  # the Last Result panel is outside this fragment
+    else:
+        st.info("No sessions yet")
+    
+    if st.button("🗑️ Clear All History", use_container_width=True):
+        memory_store.clear_sessions()
+        answer_cache.clear()
+        st.session_state.conversation.clear()
+        st.success("✅ History cleared!")
+        st.rerun()
 
-# Image generation
-def generate_diagram(concept: str, size: str = "1024x1024"):
-    try:
-        if not OPENAI_API_KEY:
-            return None, "No API key"
-        
-        from openai import OpenAI
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        
-        prompt = f"Educational infographic explaining '{concept}'. Modern, clean design with diagrams, labels, and icons. Professional style."
-        
-        response = client.images.generate(
-            model="dall-e-3",
-            prompt=prompt,
-            size=size,
-            quality="standard",
-            n=1
-        )
-        
-        return response.data[0].url, "success"
-        
-    except Exception as e:
-        return None, str(e)[:200]
+# One agent per process, shared by every browser session
+@st.cache_resource
+def get_agent():
+    warm_up()  # load the OpenAI SDK off the request path
+    prune_archives()  # chat archives of sessions idle for a week
+    metrics.start_exporters()  # METRICS_PORT / METRICS_FILE, see core/metrics.py
+    return ContextualTutorAgent()
+
+# Diagram jobs: poll while generating, then render from the local image cache
+def _poll_diagram_job(job_id: str):
+    job = diagram_jobs.status(job_id)
+    if job and job["status"] in ("queued", "running"):
+        st.info(f"🎨 Generating diagram for **{job['concept']}**... ({time.time() - job['submitted']:.0f}s)")
+    else:
+        st.rerun()  # finished: redraw the page with the image
+
+# re-run only this panel every 2s; older Streamlit falls back to a manual refresh
+if hasattr(st, "fragment"):
+    poll_diagram_job = st.fragment(run_every=2)(_poll_diagram_job)
+else:
+    def poll_diagram_job(job_id: str):
+        _poll_diagram_job(job_id)
+        st.button("🔄 Check diagram", key="poll_diagram")
+
+def analogy_markdown(number: int, kind: str, part, target_lang: str) -> str:
+    text = format_analogy(number, kind, part)
+    return translate_text(text, target_lang) if target_lang != "English" and isinstance(part, dict) else text
+
+def show_analogies(quick: dict, target_lang: str):
+    """Quick Actions analogies, each with its own regenerate button"""
+    for i, kind in enumerate(ANALOGY_KINDS, 1):
+        st.markdown(quick["parts"][kind])
+        if st.button(f"🔄 New {kind.lower()} analogy", key=f"regenerate_{kind}"):
+            try:
+                with usage_scope(session=st.session_state.conversation.session_id,
+                                 profile=profile_label(st.session_state.current_profile)):
+                    part = regenerate_analogy(kind, quick["concept"], None, st.session_state.current_profile)
+            except Exception as e:
+                st.warning(f"Could not regenerate: {str(e)[:100]}")
+            else:
+                quick["parts"][kind] = analogy_markdown(i, kind, part, target_lang)
+                st.rerun()
+
+def show_diagram(job: dict):
+    if job["status"] == "done":
+        st.image(job["path"], caption=f"Diagram: {job['concept']}" + (" (cached)" if job.get("cached") else ""))
+        st.download_button("📥 Download", Path(job["path"]).read_bytes(),
+                           file_name=f"{job['concept'][:40]}.png", mime="image/png")
+    else:
+        st.image(placeholder_png(job["concept"], job["size"]), caption=f"Diagram: {job['concept']} (placeholder)")
+        st.error(f"Failed: {job.get('error', 'unknown error')}")
 
 # Enhanced CSS (same as before)
 ENHANCED_CSS = """
@@ -339,9 +360,9 @@ def main():
     
     # Initialize session state
     if "agent" not in st.session_state:
-        st.session_state.agent = ContextualTutorAgent()
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
+        st.session_state.agent = get_agent()
+    if "conversation" not in st.session_state:
+        st.session_state.conversation = ConversationMemory()
     if "current_profile" not in st.session_state:
         st.session_state.current_profile = {}
     if "last_result" not in st.session_state:
@@ -363,22 +384,7 @@ def main():
     
     # Sidebar
     with st.sidebar:
-        st.markdown("### 🛠️ Agent Tools Status")
-        
-        tools_status = {
-            "🌐 Web Search": bool(web_search_snippets),
-            "🤖 OpenAI GPT": bool(OPENAI_API_KEY),
-            "🎨 DALL-E": bool(OPENAI_API_KEY),
-            "🧠 Decomposer": True,
-            "💡 Analogy Gen": True,
-            "📄 PDF/Image": True,
-            "🌍 Multilingual": bool(OPENAI_API_KEY),
-        }
-        
-        for tool, available in tools_status.items():
-            status_class = "status-success" if available else "status-error"
-            icon = "✅" if available else "❌"
-            st.markdown(f"<div class='tool-badge'>{tool} <span class='{status_class}'>{icon}</span></div>", unsafe_allow_html=True)
+        tools_panel()
         
         st.markdown("---")
         
@@ -389,6 +395,35 @@ def main():
         
         st.markdown("---")
         
+        # Answer cache
+        st.markdown("### ⚡ Answer Cache")
+        use_answer_cache = st.toggle("Instant answers from history", value=True, key="use_answer_cache")
+        cache_stats = answer_cache.stats()
+        if cache_stats["enabled"]:
+            st.caption(f"{cache_stats['hits']} hits / {cache_stats['lookups']} lookups "
+                       f"({cache_stats['hit_rate'] * 100:.0f}%) • {cache_stats['entries']} answers indexed")
+        else:
+            st.caption("Install numpy to enable the answer cache")
+        
+        # Latency budget for chat answers (the Explain button always gets EXPLAIN_BUTTON_BUDGET)
+        speed_modes = {"⚡ Fast (3 s)": 3.0, "⚖️ Balanced (12 s)": 12.0, "🔬 Thorough (no limit)": None}
+        speed = st.selectbox("Chat response speed", list(speed_modes), index=1, key="speed_mode")
+        chat_budget = speed_modes[speed]
+        
+        # Prepare answers for the atoms of each reply in the background (spends API tokens)
+        use_prefetch = st.toggle("🔮 Prefetch drill-downs", value=False, key="use_prefetch")
+        if use_prefetch:
+            pf = prefetcher.stats()
+            st.caption(f"{pf['completed']} prefetched • {pf['budget_used']:,}/{pf['budget']:,} est. tokens this hour")
+        
+        # What this chat session has spent today (soft/hard budgets: USAGE_SESSION_*_USD)
+        spent = usage_ledger.totals("session", st.session_state.conversation.session_id)
+        if spent["calls"]:
+            tokens = spent["prompt_tokens"] + spent["completion_tokens"]
+            st.caption(f"🪙 Session usage: {tokens:,} tokens • ${spent['cost_usd']:.4f}")
+        
+        st.markdown("---")
+        
         # NEW: Document Upload
         st.markdown("### 📄 Upload Document")
         uploaded_file = st.file_uploader("PDF or Image", type=["pdf", "png", "jpg", "jpeg"], key="doc_uploader")
@@ -397,7 +432,7 @@ def main():
             file_bytes = uploaded_file.read()
             file_type = uploaded_file.type
             
-            with st.spinner("Extracting text..."):
+            with st.spinner("Extracting text..."), profiled("upload"):
                 if "pdf" in file_type:
                     extracted_text = extract_text_from_pdf(file_bytes)
                 else:
@@ -420,58 +455,12 @@ def main():
         st.markdown("---")
         
         # Profile Management
-        st.markdown("### 👤 User Profile")
-        with st.expander("📝 Manage Profile", expanded=False):
-            profiles = load_profiles()
-            
-            if profiles:
-                profile_names = ["Create New"] + [p.get('name', 'Unnamed') for p in profiles]
-                selected_profile_name = st.selectbox("Select Profile", profile_names, key="profile_selector")
-                
-                if selected_profile_name != "Create New":
-                    idx = profile_names.index(selected_profile_name) - 1
-                    st.session_state.current_profile = profiles[idx]
-                    st.success(f"✅ Loaded: {selected_profile_name}")
-            
-            name = st.text_input("Name", value=st.session_state.current_profile.get('name', ''))
-            age_group = st.selectbox("Age Group", ["10-15", "16-22", "23-30", "30+"])
-            role = st.selectbox("Role", ["Student", "Engineer", "Teacher", "Researcher", "Professional"])
-            interests = st.text_input("Interests", value=st.session_state.current_profile.get('interests', 'technology'))
-            
-            if st.button("💾 Save Profile", use_container_width=True):
-                new_profile = {
-                    "name": name,
-                    "age_group": age_group,
-                    "role": role,
-                    "interests": interests,
-                    "created_at": datetime.now().isoformat()
-                }
-                save_profile(new_profile)
-                st.session_state.current_profile = new_profile
-                st.success("✅ Profile saved!")
-                st.rerun()
+        profile_panel()
         
         st.markdown("---")
         
         # Session History
-        st.markdown("### 📚 Recent Sessions")
-        sessions = memory_store.list_sessions()[:5]
-        
-        if sessions:
-            for i, session in enumerate(sessions):
-                with st.expander(f"📝 {session.get('concept_preview', 'Session')[:35]}..."):
-                    st.caption(f"🕐 {session.get('ts', 'N/A')}")
-                    if st.button(f"Load", key=f"load_session_{i}"):
-                        st.session_state.last_result = session
-                        st.rerun()
-        else:
-            st.info("No sessions yet")
-        
-        if st.button("🗑️ Clear All History", use_container_width=True):
-            memory_store.clear_sessions()
-            st.session_state.chat_history = []
-            st.success("✅ History cleared!")
-            st.rerun()
+        sessions_panel()
     
     # Main Content
     col_main, col_actions = st.columns([2, 1])
@@ -483,72 +472,132 @@ def main():
         # Show document context notice
         if st.session_state.uploaded_doc_text:
             st.info(f"📄 Chatting with document: **{st.session_state.uploaded_filename}**")
-        
-        # Display chat history
-        for msg in st.session_state.chat_history:
+            if st.button("📝 Summarize whole document", key="summarize_doc"):
+                st.session_state.summary_request = "Summarize the whole document"
+        
+        # Display chat history: recent turns verbatim, older ones summarized and loaded on demand
+        memory = st.session_state.conversation
+        if memory.archived:
+            with st.expander(f"🕘 Earlier in this conversation ({memory.archived} messages)"):
+                st.markdown(memory.summary or "_Summarizing..._")
+                if st.toggle("Show full messages", key="show_archive"):
+                    for msg in memory.load_archive():
+                        with st.chat_message(msg["role"]):
+                            st.markdown(msg["content"])
+        for msg in memory.visible():
             with st.chat_message(msg["role"]):
                 st.markdown(msg["content"])
         
+        # Offer a fresh answer when the last reply came from the answer cache
+        last = st.session_state.last_result or {}
+        if last.get("cached") and st.button("🔄 Get a fresh answer", key="fresh_answer"):
+            st.session_state.fresh_request = last.get("concept")
+        
+        # Drill down into one of the atoms of the last answer
+        atoms = (last.get("atoms") or [])[:4]
+        if atoms:
+            for col, atom in zip(st.columns(len(atoms)), atoms):
+                if col.button(f"🔎 {atom[:30]}", key=f"drill_{atom}", use_container_width=True):
+                    st.session_state.drill_request = atom
+        
         # Chat input
-        if user_input := st.chat_input("Ask me anything..."):
+        fresh_request = st.session_state.pop("fresh_request", None)
+        drill_request = st.session_state.pop("drill_request", None)
+        summary_request = st.session_state.pop("summary_request", None)
+        if user_input := (st.chat_input("Ask me anything...") or fresh_request or drill_request or summary_request):
             if not OPENAI_API_KEY:
                 st.error("⚠️ Set OPENAI_API_KEY in .env")
                 st.stop()
             
+            # The user moved on: stop prefetching anything but what they asked for
+            prefetcher.cancel(memory.session_id, keep=user_input)
+            
+            # Follow-ups ("why does it...?") get the conversation so far as context
+            conversation = memory.context() if is_follow_up(user_input) and memory.messages else None
+            
             # Add user message
-            st.session_state.chat_history.append({"role": "user", "content": user_input})
+            memory.add("user", user_input)
             
             with st.chat_message("user"):
                 st.markdown(user_input)
             
             # Process with agent
             with st.chat_message("assistant"):
-                with st.spinner("🔍 Processing..."):
-                    try:
+                progress = ProgressiveAnswer(selected_lang)
+                try:
+                    if st.session_state.uploaded_doc_text and is_summary_request(user_input):
+                        # the whole document, map-reduced (see core/summarize.py)
+                        result = st.session_state.agent.summarize_document(
+                            st.session_state.uploaded_doc_text,
+                            question=user_input,
+                            profile=st.session_state.current_profile,
+                            target_lang=selected_lang,
+                            on_event=progress,
+                            session_id=memory.session_id
+                        )
+                    else:
                         result = st.session_state.agent.explain_concept(
                             concept=user_input,
                             profile=st.session_state.current_profile,
                             use_web=not st.session_state.uploaded_doc_text,
                             doc_context=st.session_state.uploaded_doc_text,
-                            target_lang=selected_lang
+                            target_lang=selected_lang,
+                            use_cache=use_answer_cache,
+                            force_refresh=fresh_request is not None,
+                            latency_budget=chat_budget,
+                            on_event=progress,
+                            conversation=conversation,
+                            session_id=memory.session_id
                         )
-                        
-                        # Format response
-                        response_md = f"""
-**Concept:** {result.get('concept', 'N/A')}
-**Language:** {result.get('language', 'English')}
-
-**Summary:**
-{result.get('explanation', 'No explanation')}
-
-**Atomic Concepts:**
-{chr(10).join(['• ' + atom for atom in result.get('atoms', [])])}
-
-**Analogies:**
-{result.get('analogies', 'No analogies')}
-
-**Sources:**
-{chr(10).join([f"• [{s['title']}]({s['url']})" for s in result.get('sources', [])])}
-
-**Confidence:** {result.get('confidence', 0)}%
-"""
-                        
-                        st.markdown(response_md)
-                        
-                        st.session_state.chat_history.append({"role": "assistant", "content": response_md})
-                        st.session_state.last_result = result
-                        
+                    
+                    # Format response
+                    response_md = format_result_markdown(result)
+                    if result.get("cached"):
+                        hit = result["steps"][0]
+                        st.caption(f"⚡ Served from history ({hit['similarity']:.0%} match: \"{hit['matched']}\")")
+                    elif result.get("degradations"):
+                        cuts = ", ".join(d.replace("_", " ") for d in result["degradations"])
+                        if result.get("latency_budget"):
+                            st.caption(f"⏱️ Fit to {result['latency_budget']:g}s budget: {cuts}")
+                        else:
+                            st.caption(f"🪙 Near today's usage budget: {cuts}")
+                    if result.get("profiling"):
+                        prof = result["profiling"]
+                        spent = " • ".join(f"{k} {v:.2f}s" for k, v in list(prof["breakdown"].items())[:3])
+                        st.caption(f"🔬 Profiled {prof['seconds']:.2f}s ({spent}) → {Path(prof['path']).name}")
+                    
+                    progress.finish(response_md, ok=not result.get("error"))
+                    
+                    memory.add("assistant", response_md, gist=result.get("explanation"))
+                    st.session_state.last_result = result
+                    
+                    if use_prefetch and result.get("atoms") and not st.session_state.uploaded_doc_text:
+                        prefetcher.schedule(memory.session_id, st.session_state.agent, result["atoms"],
+                                            profile=st.session_state.current_profile,
+                                            target_lang=selected_lang,
+                                            latency_budget=chat_budget,
+                                            session_id=memory.session_id)
+                    
+                    if not result.get("cached"):
+                        profile = st.session_state.current_profile or {}
                         memory_store.add_session({
                             "ts": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                             "concept_preview": user_input[:100],
-                            "result": response_md,
-                            "confidence": result.get('confidence', 0)
+                            "concept": user_input,
+                            "role": profile.get("role", ""),
+                            "age_group": profile.get("age_group", ""),
+                            "language": selected_lang,
+                            "record": pack_record(ExplainRecord.from_result(result)),
+                            "confidence": result.get('confidence', 0),
+                            "usage": result.get("usage"),
+                            "cacheable": bool(result.get("cacheable")),
                         })
-                        
-                    except Exception as e:
-                        error_msg = f"❌ Error: {str(e)}\n\n{traceback.format_exc()}"
-                        st.error(error_msg)
-                        st.session_state.chat_history.append({"role": "assistant", "content": error_msg})
+                    
+                except Exception as e:
+                    error_msg = f"❌ Error: {str(e)}\n\n{traceback.format_exc()}"
+                    progress.status.update(label="❌ Failed", state="error")
+                    st.error(error_msg)
+                    memory.add("assistant", error_msg)
         
         st.markdown("</div>", unsafe_allow_html=True)
     
@@ -568,7 +617,9 @@ def main():
                             quick_concept, 
                             st.session_state.current_profile,
                             doc_context=st.session_state.uploaded_doc_text,
-                            target_lang=selected_lang
+                            target_lang=selected_lang,
+                            latency_budget=EXPLAIN_BUTTON_BUDGET,
+                            session_id=st.session_state.conversation.session_id
                         )
                         st.session_state.last_result = result
                         st.rerun()
@@ -592,19 +643,32 @@ def main():
         
         if st.button("💡 Analogies", use_container_width=True):
             if quick_concept.strip():
-                analogies = analogy_generator_tool(quick_concept, None, st.session_state.current_profile)
-                translated = translate_text(analogies, selected_lang) if selected_lang != "English" else analogies
-                st.markdown(translated)
+                with usage_scope(session=st.session_state.conversation.session_id,
+                                 profile=profile_label(st.session_state.current_profile)):
+                    parts = generate_analogy_set(quick_concept, None, st.session_state.current_profile)
+                st.session_state.quick_analogies = {
+                    "concept": quick_concept,
+                    "parts": {kind: analogy_markdown(i, kind, parts[kind], selected_lang)
+                              for i, kind in enumerate(ANALOGY_KINDS, 1)},
+                }
         
+        if st.session_state.get("quick_analogies"):
+            show_analogies(st.session_state.quick_analogies, selected_lang)
+        
+        diagram_style = st.selectbox("Diagram style", list(DIAGRAM_STYLES), key="diagram_style")
         if st.button("🎨 Generate Diagram", use_container_width=True):
-            if quick_concept.strip() and OPENAI_API_KEY:
-                with st.spinner("Creating..."):
-                    img_url, status = generate_diagram(quick_concept)
-                    if img_url:
-                        st.image(img_url, caption=f"Diagram: {quick_concept}")
-                        st.markdown(f"[📥 Download]({img_url})")
-                    else:
-                        st.error(f"Failed: {status}")
+            if quick_concept.strip():
+                # runs in the background; the panel below polls it
+                with usage_scope(session=st.session_state.conversation.session_id,
+                                 profile=profile_label(st.session_state.current_profile)):
+                    st.session_state.diagram_job = diagram_jobs.submit(quick_concept.strip(), style=diagram_style)
+        
+        if st.session_state.get("diagram_job"):
+            job = diagram_jobs.status(st.session_state.diagram_job)
+            if job and job["status"] in ("queued", "running"):
+                poll_diagram_job(job["id"])
+            elif job:
+                show_diagram(job)
         
         st.markdown("</div>", unsafe_allow_html=True)
         
@@ -636,4 +700,6 @@ def main():
             st.markdown("</div>", unsafe_allow_html=True)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # ?profile=1 samples this session's reruns, ?profile=explain only its explanations (core/profiling.py)
+    with requested(parse_kinds(st.query_params.get("profile"))), profiled("rerun"):
+        main()
\ No newline at end of file
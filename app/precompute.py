@@ -0,0 +1,135 @@
+# app/precompute.py - Warm the response caches for a curriculum
+"""
+Generate decompositions, analogies, explanations and translations for every
+curriculum topic x profile archetype x language ahead of class, so the first
+request for a topic during class is already a cache hit.
+
+Usage:
+    python app/precompute.py --curriculum syllabus.csv --languages English,Hindi \\
+        --roles Student,Teacher --age-groups 16-22,23-30 --refresh-days 7 --concurrency 4
+
+Archetypes default to every role x age group offered in the sidebar (interests
+"technology", the sidebar default); pass --profiles to use explicit profiles instead.
+
+Runs are incremental: a (topic, archetype, language) answer younger than
+--refresh-days is skipped, a stale one is regenerated with fresh step outputs,
+and shared steps (search, decomposition) are computed once per topic.
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except:
+    pass
+
+from batch import RateLimiter, load_concepts, load_profiles
+from core.response_cache import DAY, response_cache
+from core.records import ExplainRecord
+from core.tutor import PROFILE_AGE_GROUPS, PROFILE_ROLES, ContextualTutorAgent, concept_key
+
+
+def archetype_profiles(roles: List[str], age_groups: List[str], interests: str) -> List[Dict]:
+    return [{"name": f"{role} {age}", "role": role, "age_group": age, "interests": interests}
+            for role in roles for age in age_groups]
+
+def answer_key(concept: str, profile: Dict, language: str) -> list:
+    return [concept_key(concept), profile.get("role", ""), profile.get("age_group", ""),
+            profile.get("interests", ""), language]
+
+def _split(value: str) -> List[str]:
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def warm_one(agent: ContextualTutorAgent, job: Dict, use_web: bool, run_started: float) -> Dict:
+    # stale jobs recompute every step output older than this run; outputs already
+    # regenerated by another job of the same topic during this run are reused
+    result = agent.explain_concept(job["concept"], profile=job["profile"], use_web=use_web,
+                                   target_lang=job["language"],
+                                   refresh_before=run_started if job["stale"] else None)
+    synthesis = next((s for s in result.get("steps", []) if s["step"] == "synthesis"), {})
+    if result.get("error") or synthesis.get("status") != "success" or not result.get("cacheable"):
+        return {"ok": False, "error": result.get("error") or synthesis.get("error", "synthesis failed")}
+    profile = job["profile"]
+    # session-shaped, so the semantic answer cache can index it like stored sessions
+    response_cache.set("answer", job["key"], {
+        "ts": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "concept": job["concept"],
+        "role": profile.get("role", ""),
+        "age_group": profile.get("age_group", ""),
+        "language": job["language"],
+        "record": ExplainRecord.from_result(result).pack(),  # markdown is rebuilt on a cache hit
+        "confidence": result.get("confidence", 0),
+        "cacheable": True,
+    })
+    return {"ok": True}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Precompute explanations for a curriculum")
+    parser.add_argument("--curriculum", required=True, type=Path, help="CSV/JSONL/TXT file of topics")
+    parser.add_argument("--profiles", type=Path, help="explicit profiles (JSON/JSONL/CSV) instead of archetypes")
+    parser.add_argument("--roles", default=",".join(PROFILE_ROLES))
+    parser.add_argument("--age-groups", default=",".join(PROFILE_AGE_GROUPS))
+    parser.add_argument("--interests", default="technology")
+    parser.add_argument("--languages", default="English", help="comma-separated target languages")
+    parser.add_argument("--refresh-days", type=float, default=7, help="regenerate answers older than this")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=0, help="max jobs started per minute (0 = unlimited)")
+    parser.add_argument("--no-web", action="store_true", help="skip web search")
+    args = parser.parse_args(argv)
+
+    topics = load_concepts(args.curriculum, "English")
+    profiles = (load_profiles(args.profiles) if args.profiles
+                else archetype_profiles(_split(args.roles), _split(args.age_groups), args.interests))
+    languages = _split(args.languages) or ["English"]
+
+    jobs, fresh = [], 0
+    for topic in topics:
+        for lang in languages:
+            for profile in profiles:
+                key = answer_key(topic["concept"], profile, lang)
+                age = response_cache.age("answer", key)
+                if age is not None and age < args.refresh_days * DAY:
+                    fresh += 1
+                    continue
+                jobs.append({"concept": topic["concept"], "profile": profile, "language": lang,
+                             "key": key, "stale": age is not None})
+    stale = sum(1 for j in jobs if j["stale"])
+    print(f"{len(topics)} topics x {len(profiles)} profiles x {len(languages)} languages: "
+          f"{fresh} fresh, {stale} stale, {len(jobs) - stale} new")
+    if not jobs:
+        return 0
+
+    agent = ContextualTutorAgent()
+    limiter = RateLimiter(args.rate)
+    started, run_started = time.monotonic(), time.time()
+    ok = failed = 0
+
+    def run(job):
+        limiter.acquire()
+        return job, warm_one(agent, job, use_web=not args.no_web, run_started=run_started)
+
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency), thread_name_prefix="precompute") as pool:
+        for fut in as_completed([pool.submit(run, j) for j in jobs]):
+            job, outcome = fut.result()
+            ok += outcome["ok"]
+            failed += not outcome["ok"]
+            status = "ok " if outcome["ok"] else "ERR"
+            print(f"[{ok + failed}/{len(jobs)}] {status} {job['language']:<10} {job['profile'].get('name', '')[:20]:<20} "
+                  f"{job['concept'][:50]}" + ("" if outcome["ok"] else f"  ({outcome['error'][:80]})"), flush=True)
+    response_cache.flush()
+
+    elapsed = time.monotonic() - started
+    print(f"\nWarmed {ok}, failed {failed}, skipped {fresh} fresh in {elapsed:.1f}s")
+    return 0 if not failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
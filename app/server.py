@@ -0,0 +1,473 @@
+# app/server.py - Headless HTTP API for the tutor engine
+"""
+Standalone asyncio HTTP service in front of core.tutor, so the pipeline can sit
+behind a load balancer and be shared by several front ends (Streamlit included).
+
+Usage:
+    python app/server.py --host 0.0.0.0 --port 8600
+
+Endpoints (JSON in / JSON out):
+    GET  /health       queue depth, workers, in-flight jobs, per-model latency / errors,
+                       shared upstream rate-limit state
+                       (and hedging stats when LLM_HEDGE=1)
+    GET  /usage        today's LLM tokens / cost per step, session, profile and model
+    GET  /metrics      Prometheus text: step / LLM / search latency histograms, cache hit
+                       counters, queue depths (see core/metrics.py)
+    POST /explain      {"concept", "profile"?, "language"?, "use_web"?, "doc_id"?, "use_cache"?, "deadline"?,
+                        "session_id"?}   (usage is budgeted per session_id, see core/usage.py)
+                       add ?stream=1 for NDJSON progress events (chunked): "step" per finished
+                       step, "delta" chunks of the explanation (English), then "result"
+    POST /decompose    {"concept", "max_atoms"?}
+    POST /analogies    {"concept", "atoms"?, "profile"?, "language"?, "regenerate"?}
+                       regenerate ("Story" / "Visual" / "Practical") returns only a fresh
+                       analogy of that kind: {"kind", "analogy", "mapping"}
+    POST /search       {"query", "num_results"?}
+    POST /documents    raw PDF / image bytes (Content-Type application/pdf or image/*)
+                       -> {"doc_id", "chars", "preview"}; pass doc_id to /explain
+
+Any POST with ?profile=1 (or every one with TUTOR_PROFILE=api) is run under the
+sampling profiler and written to storage/profiles/ tagged with the X-Request-Id
+header, which is echoed back (see core/profiling.py).
+
+Work goes through a bounded queue served by a thread pool. When the queue is
+full the server answers 429 with Retry-After instead of piling up requests.
+
+Config (env, overridden by flags):
+    TUTOR_API_WORKERS     worker threads (default: 4 x CPU count, max 32)
+    TUTOR_API_QUEUE_SIZE  queued jobs before 429 (default: 4 x workers)
+"""
+import argparse
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import sys
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except:
+    pass
+
+from core.llm_client import HEDGE_ENABLED, hedger
+from core.metrics import CONTENT_TYPE, IN_FLIGHT, QUEUE_DEPTH, metrics
+from core.profiling import enabled_for, profiled
+from core.ratelimit import api_limiter
+from core.routing import model_router
+from core.tools.analogy_tool import ANALOGY_KINDS, analogy_generator_tool, regenerate_analogy
+from core.tools.decomposer_tool import decompose_concept_tool
+from core.usage import DIMENSIONS, usage_ledger
+from core.tutor import ContextualTutorAgent, extract_text_from_image, extract_text_from_pdf, translate_text
+from core.web_search import web_search_snippets
+
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) * 4)  # work is I/O-bound (LLM / search calls)
+MAX_BODY_BYTES = 20 * 1024 * 1024
+MAX_DOCUMENTS = 256
+
+# (kind, request id) of the request being handled when it is to be profiled
+_profile_as: contextvars.ContextVar[Optional[Tuple[str, str]]] = contextvars.ContextVar("profile_as", default=None)
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 429: "Too Many Requests", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    def __init__(self, method: str, path: str, query: Dict[str, list], headers: Dict[str, str], body: bytes):
+        self.method, self.path, self.query, self.headers, self.body = method, path, query, headers, body
+
+    def json(self) -> Dict[str, Any]:
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body.decode("utf-8"))
+        except ValueError:
+            raise HTTPError(400, "Body must be JSON")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "Body must be a JSON object")
+        return data
+
+    def flag(self, name: str) -> bool:
+        return self.query.get(name, ["0"])[0].lower() in ("1", "true", "yes")
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    while True:
+        h = await reader.readline()
+        if h in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = h.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", "0") or 0)
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length < 0:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, f"Body larger than {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+    url = urlsplit(target)
+    return Request(method.upper(), url.path.rstrip("/") or "/", parse_qs(url.query), headers, body)
+
+
+def _head(status: int, content_type: str, extra: Optional[Dict[str, str]] = None) -> bytes:
+    lines = [f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}", f"Content-Type: {content_type}",
+             "Connection: close"]
+    lines += [f"{k}: {v}" for k, v in (extra or {}).items()]
+    if _profile_as.get() is not None:
+        lines.append(f"X-Request-Id: {_profile_as.get()[1]}")
+    return ("\r\n".join(lines) + "\r\n").encode("latin-1")
+
+async def send_json(writer: asyncio.StreamWriter, status: int, payload: Any,
+                    extra: Optional[Dict[str, str]] = None):
+    body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+    writer.write(_head(status, "application/json; charset=utf-8", extra)
+                 + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+
+async def send_text(writer: asyncio.StreamWriter, status: int, text: str, content_type: str):
+    body = text.encode("utf-8")
+    writer.write(_head(status, content_type) + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+
+
+class ChunkedStream:
+    """NDJSON over chunked transfer encoding."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+
+    async def start(self):
+        self.writer.write(_head(200, "application/x-ndjson; charset=utf-8") + b"Transfer-Encoding: chunked\r\n\r\n")
+        await self.writer.drain()
+
+    async def send(self, event: Dict[str, Any]):
+        data = (json.dumps(event, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        self.writer.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        await self.writer.drain()
+
+    async def close(self):
+        self.writer.write(b"0\r\n\r\n")
+        await self.writer.drain()
+
+
+class WorkQueue:
+    """Bounded job queue drained by asyncio workers that hand jobs to a thread pool."""
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.queue: "asyncio.Queue[Tuple[Callable[[], Any], asyncio.Future]]" = asyncio.Queue(maxsize=queue_size)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tutor-api")
+        self.in_flight = 0
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            fn, fut = await self.queue.get()
+            if fut.cancelled():  # client went away while queued
+                self.queue.task_done()
+                continue
+            self.in_flight += 1
+            try:
+                result = await loop.run_in_executor(self.pool, fn)
+                if not fut.done():
+                    fut.set_result(result)
+            except Exception as e:
+                if not fut.done():
+                    fut.set_exception(e)
+            finally:
+                self.in_flight -= 1
+                self.queue.task_done()
+
+    def submit(self, fn: Callable[[], Any]) -> asyncio.Future:
+        """Queue a blocking call; raises HTTPError(429) when saturated."""
+        fut = asyncio.get_running_loop().create_future()
+        profile_as = _profile_as.get()
+        if profile_as is not None:
+            fn = _run_profiled(fn, *profile_as)
+        try:
+            self.queue.put_nowait((fn, fut))
+        except asyncio.QueueFull:
+            raise HTTPError(429, "Server busy, retry later")
+        return fut
+
+    def stats(self) -> Dict[str, int]:
+        return {"workers": self.workers, "queue_depth": self.queue.qsize(),
+                "queue_capacity": self.queue.maxsize, "in_flight": self.in_flight}
+
+    async def close(self):
+        for t in self._tasks:
+            t.cancel()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class TutorAPI:
+    def __init__(self, workers: int, queue_size: int):
+        self.work = WorkQueue(workers, queue_size)
+        QUEUE_DEPTH.set_function(self.work.queue.qsize, queue="api")
+        IN_FLIGHT.set_function(lambda: self.work.in_flight, queue="api")
+        self.agent = ContextualTutorAgent()
+        self.documents: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+        self.routes: Dict[Tuple[str, str], Callable] = {
+            ("GET", "/health"): self.health,
+            ("GET", "/usage"): self.usage,
+            ("GET", "/metrics"): self.metrics,
+            ("POST", "/explain"): self.explain,
+            ("POST", "/decompose"): self.decompose,
+            ("POST", "/analogies"): self.analogies,
+            ("POST", "/search"): self.search,
+            ("POST", "/documents"): self.upload_document,
+        }
+
+    # ----- handlers -----
+
+    async def health(self, req: Request, writer):
+        body = {"status": "ok", **self.work.stats(), "documents": len(self.documents)}
+        if HEDGE_ENABLED:
+            body["llm_hedging"] = hedger.stats()
+        body["model_routes"] = model_router.stats()
+        body["upstream_limits"] = api_limiter.stats()
+        await send_json(writer, 200, body)
+
+    async def usage(self, req: Request, writer):
+        await send_json(writer, 200, {dim: usage_ledger.totals(dim) for dim in DIMENSIONS})
+
+    async def metrics(self, req: Request, writer):
+        await send_text(writer, 200, metrics.render(), CONTENT_TYPE)
+
+    async def explain(self, req: Request, writer):
+        data = req.json()
+        concept = _required(data, "concept")
+        deadline = _number(data, "deadline", None, 1, 600, float)
+        profile = _typed(data, "profile", {}, dict, "an object")
+        language = _typed(data, "language", "English", str, "a string")
+        session_id = _typed(data, "session_id", None, str, "a string")
+        doc_text = None
+        if _typed(data, "doc_id", None, str, "a string"):
+            doc = self.documents.get(data["doc_id"])
+            if doc is None:
+                raise HTTPError(404, "Unknown doc_id (documents are kept in memory; upload again)")
+            doc_text = doc["text"]
+        def job(on_event=None):
+            return self.agent.explain_concept(
+                concept,
+                profile=profile,
+                use_web=bool(data.get("use_web", True)) and not doc_text,
+                doc_context=doc_text,
+                target_lang=language,
+                use_cache=bool(data.get("use_cache", False)),
+                force_refresh=bool(data.get("force_refresh", False)),
+                deadline=deadline,
+                on_event=on_event,
+                session_id=session_id,
+            )
+        if not req.flag("stream"):
+            await send_json(writer, 200, await self.work.submit(job))
+            return
+        # pipeline events (step results, explanation deltas) are relayed as they happen
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        relay = lambda ev: loop.call_soon_threadsafe(events.put_nowait, ev)
+        fut = self.work.submit(lambda: job(relay))  # 429 is raised before the stream starts
+        stream = ChunkedStream(writer)
+        await stream.start()
+        await stream.send({"event": "queued", "queue_depth": self.work.queue.qsize()})
+        try:
+            while not fut.done():
+                getter = asyncio.ensure_future(events.get())
+                await asyncio.wait([fut, getter], return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    ev = getter.result()
+                    await stream.send({"event": ev.pop("type"), **ev})
+                else:
+                    getter.cancel()
+            while not events.empty():
+                ev = events.get_nowait()
+                await stream.send({"event": ev.pop("type"), **ev})
+            await stream.send({"event": "result", "result": fut.result()})
+        except Exception as e:
+            await stream.send({"event": "error", "error": str(e)[:200]})
+        await stream.close()
+
+    async def decompose(self, req: Request, writer):
+        data = req.json()
+        concept = _required(data, "concept")
+        max_atoms = _number(data, "max_atoms", 5, 1, 10)
+        atoms = await self.work.submit(lambda: decompose_concept_tool(concept, max_atoms))
+        await send_json(writer, 200, {"concept": concept, "atoms": atoms})
+
+    async def analogies(self, req: Request, writer):
+        data = req.json()
+        concept = _required(data, "concept")
+        language = _typed(data, "language", "English", str, "a string")
+        profile = _typed(data, "profile", {}, dict, "an object")
+        atoms = _typed(data, "atoms", None, list, "a list of strings")
+        if atoms is not None and not all(isinstance(a, str) for a in atoms):
+            raise HTTPError(400, "'atoms' must be a list of strings")
+        kind = data.get("regenerate")
+        if kind:
+            if kind not in ANALOGY_KINDS:
+                raise HTTPError(400, f"'regenerate' must be one of {', '.join(ANALOGY_KINDS)}")
+
+            def regenerate():
+                part = regenerate_analogy(kind, concept, atoms, profile)
+                return {k: translate_text(v, language) if v else v for k, v in part.items()}
+            await send_json(writer, 200, {"concept": concept, "language": language, "kind": kind,
+                                          **await self.work.submit(regenerate)})
+            return
+
+        def job():
+            text = analogy_generator_tool(concept, atoms, profile)
+            return translate_text(text, language)
+        await send_json(writer, 200, {"concept": concept, "language": language,
+                                      "analogies": await self.work.submit(job)})
+
+    async def search(self, req: Request, writer):
+        data = req.json()
+        query = _required(data, "query")
+        num_results = _number(data, "num_results", 5, 1, 20)
+        results = await self.work.submit(lambda: web_search_snippets(query, num_results))
+        await send_json(writer, 200, {"query": query, "results": results})
+
+    async def upload_document(self, req: Request, writer):
+        if not req.body:
+            raise HTTPError(400, "Empty document body")
+        ctype = req.headers.get("content-type", "")
+        if "pdf" in ctype:
+            extract = extract_text_from_pdf
+        elif ctype.startswith("image/"):
+            extract = extract_text_from_image
+        else:
+            raise HTTPError(400, "Content-Type must be application/pdf or image/*")
+        body = req.body
+        doc_id = hashlib.sha256(body).hexdigest()[:24]
+        if doc_id not in self.documents:
+            text = await self.work.submit(lambda: extract(body))
+            self.documents[doc_id] = {"text": text, "filename": req.query.get("filename", [""])[0]}
+            while len(self.documents) > MAX_DOCUMENTS:
+                self.documents.popitem(last=False)
+        self.documents.move_to_end(doc_id)
+        text = self.documents[doc_id]["text"]
+        await send_json(writer, 200, {"doc_id": doc_id, "chars": len(text), "preview": text[:500]})
+
+    # ----- connection handling -----
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            req = await read_request(reader)
+            if req is None:
+                return
+            if req.method == "POST" and (req.flag("profile") or enabled_for("api")):
+                request_id = req.headers.get("x-request-id") or uuid.uuid4().hex[:12]
+                _profile_as.set((f"api{req.path.replace('/', '-')}", request_id))
+            handler = self.routes.get((req.method, req.path))
+            if handler is None:
+                known = any(path == req.path for _, path in self.routes)
+                raise HTTPError(405 if known else 404, f"No route for {req.method} {req.path}")
+            await handler(req, writer)
+        except HTTPError as e:
+            extra = {"Retry-After": "2"} if e.status == 429 else None
+            await send_json(writer, e.status, {"error": str(e)}, extra)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            await send_json(writer, 500, {"error": str(e)[:200]})
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+
+def _run_profiled(fn: Callable[[], Any], kind: str, request_id: str) -> Callable[[], Any]:
+    def run():
+        with profiled(kind, request_id, enabled=True):
+            return fn()
+    return run
+
+def _required(data: Dict[str, Any], key: str) -> str:
+    value = str(data.get(key) or "").strip()
+    if not value:
+        raise HTTPError(400, f"'{key}' is required")
+    return value
+
+def _number(data: Dict[str, Any], key: str, default, low, high, kind=int):
+    """data[key] as an int (or float) within [low, high]; 400 otherwise."""
+    value = data.get(key)
+    if value is None:
+        return default
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        number = kind(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"'{key}' must be a number")
+    if not low <= number <= high or (kind is int and number != float(value)):
+        raise HTTPError(400, f"'{key}' must be {'an integer ' if kind is int else ''}between {low} and {high}")
+    return number
+
+
+def _typed(data: Dict[str, Any], key: str, default, kind: type, what: str):
+    """data[key] if it is a `kind` (default when absent or null); 400 otherwise."""
+    value = data.get(key)
+    if value is None:
+        return default
+    if not isinstance(value, kind):
+        raise HTTPError(400, f"'{key}' must be {what}")
+    return value
+
+
+async def serve(host: str, port: int, workers: int, queue_size: int):
+    api = TutorAPI(workers, queue_size)
+    api.work.start()
+    server = await asyncio.start_server(api.handle, host, port)
+    print(f"Tutor API on http://{host}:{port} (workers={workers}, queue={queue_size})", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await api.work.close()
+
+
+def main(argv=None) -> int:
+    workers = int(os.getenv("TUTOR_API_WORKERS", DEFAULT_WORKERS))
+    parser = argparse.ArgumentParser(description="Headless HTTP API for Contextual Tutor X")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--workers", type=int, default=workers)
+    parser.add_argument("--queue-size", type=int, default=int(os.getenv("TUTOR_API_QUEUE_SIZE", workers * 4)))
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, max(1, args.workers), max(1, args.queue_size)))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
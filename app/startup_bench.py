@@ -0,0 +1,106 @@
+# app/startup_bench.py - Import-time benchmark for cold starts
+"""
+Measure how long a fresh worker takes to import the app's entry points and which
+modules that time goes to, so new workers (autoscaling, Streamlit restarts) stay fast.
+
+Usage:
+    python app/startup_bench.py                      # main, core.tutor, server, batch
+    python app/startup_bench.py main --repeat 5 --top 15 --budget-ms 1500
+
+Each target is imported in a fresh interpreter with `python -X importtime`; the
+median of --repeat runs is reported. Optional heavy dependencies that the app
+loads lazily (core/lazy.py) are timed separately as "deferred until first use".
+Exits with status 1 when a target exceeds --budget-ms (env IMPORT_BUDGET_MS),
+so the check can run in CI.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+APP_DIR = Path(__file__).parent
+DEFAULT_TARGETS = ["main", "core.tutor", "server", "batch"]
+DEFERRED_MODULES = ["openai", "numpy", "fitz", "pytesseract", "bs4", "PIL.Image", "duckduckgo_search"]
+DEFAULT_BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", "1500"))
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def importtime(module: str) -> List[Tuple[str, int, int, int]]:
+    """(name, depth, self_us, cumulative_us) for every module imported by `import module`."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=APP_DIR, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            rows.append((m.group(4), (len(m.group(3)) - 1) // 2, int(m.group(1)), int(m.group(2))))
+    return rows
+
+
+def _own_tree(rows: List[Tuple[str, int, int, int]], module: str) -> List[Tuple[str, int, int, int]]:
+    """Rows imported by `module` itself (children are logged before their parent)."""
+    end = next(i for i, r in enumerate(rows) if r[0] == module and r[1] == 0)
+    start = end
+    while start > 0 and rows[start - 1][1] > 0:
+        start -= 1
+    return rows[start:end + 1]
+
+
+def measure(module: str, repeat: int) -> Dict:
+    runs = [_own_tree(importtime(module), module) for _ in range(max(1, repeat))]
+    totals = [rows[-1][3] for rows in runs]
+    # per-module cumulative time from the median run
+    median_run = runs[totals.index(sorted(totals)[len(totals) // 2])]
+    return {"module": module, "total_ms": statistics.median(totals) / 1000, "rows": median_run}
+
+
+def report(result: Dict, top: int, budget_ms: float) -> bool:
+    ok = result["total_ms"] <= budget_ms
+    print(f"\n{result['module']}: {result['total_ms']:.0f} ms "
+          f"({'within' if ok else 'OVER'} {budget_ms:.0f} ms budget)")
+    direct = [r for r in result["rows"] if r[1] == 1]
+    app = [r for r in result["rows"] if r[0].startswith("core.") or r[1] == 0]
+    print(f"  {'direct import':<40} {'cumulative':>10}")
+    for name, _, _, cum in sorted(direct, key=lambda r: -r[3])[:top]:
+        print(f"  {name:<40} {cum / 1000:>8.1f} ms")
+    print(f"  {'app module (self time)':<40} {'self':>10}")
+    for name, _, self_us, _ in sorted(app, key=lambda r: -r[2])[:top]:
+        print(f"  {name:<40} {self_us / 1000:>8.1f} ms")
+    return ok
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Import-time benchmark for app entry points")
+    parser.add_argument("targets", nargs="*", default=DEFAULT_TARGETS)
+    parser.add_argument("--repeat", type=int, default=3, help="fresh-interpreter runs per target (median)")
+    parser.add_argument("--top", type=int, default=10, help="modules to list per target")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    args = parser.parse_args(argv)
+
+    within = True
+    for target in args.targets:
+        try:
+            within &= report(measure(target, args.repeat), args.top, args.budget_ms)
+        except RuntimeError as e:
+            print(f"\n{target}: could not import ({e})")
+            within = False
+
+    print("\nDeferred until first use:")
+    for module in DEFERRED_MODULES:
+        try:
+            ms = measure(module, 1)["total_ms"]
+            print(f"  {module:<40} {ms:>8.1f} ms")
+        except (RuntimeError, StopIteration):  # not installed, or already imported by site
+            print(f"  {module:<40} {'not installed':>11}")
+    return 0 if within else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,9 @@
+# tests/conftest.py
+"""Make the app's `core` package importable and keep test state out of app/storage."""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+os.environ.setdefault("TUTOR_STORAGE_DIR", tempfile.mkdtemp(prefix="tutor-tests-"))
@@ -0,0 +1,62 @@
+# tests/test_latency.py
+from core.latency import HEADROOM, LatencyTracker, plan_for_budget
+
+
+def _plan(budget, use_web=True, translate=False, tracker=None, explore=False):
+    return plan_for_budget(budget, use_web, translate, tracker=tracker or LatencyTracker(),
+                           explore=lambda: explore)
+
+
+def test_no_budget_means_no_degradations():
+    plan = _plan(None)
+    assert plan.degradations == []
+    assert plan.use_web and plan.decompose and plan.token_scale == 1.0
+    assert plan.estimate > 0
+
+
+def test_generous_budget_keeps_the_full_pipeline():
+    plan = _plan(60)
+    assert plan.degradations == []
+    assert plan.estimate <= 60 * HEADROOM
+
+
+def test_shrinking_budget_walks_down_the_ladder():
+    # priors: web 2.5 + decomposition 0.5 + synthesis 6.0 = 9.0 s
+    assert _plan(20).degradations == []
+    assert _plan(10).degradations == ["skipped_web_search"]
+    assert _plan(7.2).degradations == ["skipped_web_search", "skipped_decomposition"]
+    tight = _plan(5)
+    assert tight.degradations == ["skipped_web_search", "skipped_decomposition", "reduced_max_tokens"]
+    assert not tight.use_web and not tight.decompose and tight.token_scale == 0.5
+    assert tight.estimate <= 5 * HEADROOM
+
+
+def test_budget_too_small_for_anything_applies_every_step():
+    plan = _plan(0.5)
+    assert plan.degradations == ["skipped_web_search", "skipped_decomposition", "reduced_max_tokens"]
+    assert plan.estimate > 0.5 * HEADROOM
+
+
+def test_slow_search_is_shortened_before_it_is_skipped():
+    tracker = LatencyTracker()
+    for _ in range(5):
+        tracker.record("web_search", 8.0)
+    plan = _plan(16, tracker=tracker)
+    assert plan.degradations == ["shortened_web_search"]
+    assert plan.use_web and plan.num_results == 3 and plan.web_timeout == 4.0
+
+
+def test_without_web_search_the_ladder_starts_at_decomposition():
+    plan = _plan(5, use_web=False)
+    assert plan.degradations == ["skipped_decomposition", "reduced_max_tokens"]
+
+
+def test_translation_lengthens_the_estimate():
+    assert _plan(None, translate=True).estimate > _plan(None).estimate
+    assert "reduced_max_tokens" in _plan(10, translate=True).degradations
+
+
+def test_exploring_keeps_skippable_steps():
+    plan = _plan(10, explore=True)
+    assert plan.degradations == ["shortened_web_search", "reduced_max_tokens"]
+    assert plan.use_web and plan.decompose
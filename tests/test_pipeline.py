@@ -0,0 +1,134 @@
+# tests/test_pipeline.py
+import threading
+import time
+
+import pytest
+
+from core.pipeline import Deadline, Step, StepScheduler
+
+
+def _by_step(run):
+    return {r["step"]: r for r in run.records}
+
+
+def test_steps_run_after_their_dependencies():
+    order = []
+    lock = threading.Lock()
+
+    def step(name, value):
+        def fn(ctx):
+            with lock:
+                order.append(name)
+            return value
+        return fn
+
+    steps = [
+        Step("answer", lambda ctx: ctx.results["search"] + ctx.results["atoms"], deps=("search", "atoms")),
+        Step("search", step("search", 1)),
+        Step("atoms", step("atoms", 2)),
+    ]
+    run = StepScheduler(steps).run()
+
+    assert set(order) == {"search", "atoms"}
+    assert run.results["answer"] == 3
+    assert [r["step"] for r in run.records][-1] == "answer"
+    assert run.failed is None
+
+
+def test_unknown_and_duplicate_steps_are_rejected():
+    with pytest.raises(ValueError):
+        StepScheduler([Step("a", lambda ctx: 1, deps=("missing",))])
+    with pytest.raises(ValueError):
+        StepScheduler([Step("a", lambda ctx: 1), Step("a", lambda ctx: 2)])
+
+
+def test_step_timeout_is_recorded_and_dependents_still_run():
+    release = threading.Event()
+    steps = [
+        Step("slow", lambda ctx: release.wait(5), timeout=0.1),
+        Step("after", lambda ctx: ctx.results.get("slow", "fallback"), deps=("slow",)),
+    ]
+    started = time.monotonic()
+    run = StepScheduler(steps).run()
+    release.set()
+
+    assert time.monotonic() - started < 2
+    records = _by_step(run)
+    assert records["slow"]["status"] == "timeout"
+    assert records["after"]["status"] == "success"
+    assert run.results["after"] == "fallback"
+
+
+def test_required_step_failure_skips_the_rest():
+    def boom(ctx):
+        raise RuntimeError("boom")
+
+    steps = [
+        Step("search", boom, required=True),
+        Step("answer", lambda ctx: "x", deps=("search",)),
+    ]
+    run = StepScheduler(steps).run()
+
+    records = _by_step(run)
+    assert run.failed == "search"
+    assert records["search"]["status"] == "error"
+    assert records["answer"] == {"step": "answer", "status": "skipped",
+                                 "reason": "required step 'search' failed"}
+
+
+def test_zero_deadline_is_already_expired():
+    assert Deadline(0).expired
+    assert Deadline(0).remaining() == 0.0
+    assert not Deadline().expired
+    assert Deadline().remaining() is None
+
+
+def test_context_timeout_is_capped_by_the_deadline():
+    seen = {}
+
+    def fn(ctx):
+        seen["timeout"] = ctx.timeout(floor=0.0)
+
+    StepScheduler([Step("a", fn, timeout=30)]).run(Deadline(0.5))
+    assert 0 < seen["timeout"] <= 0.5
+
+    StepScheduler([Step("a", fn, timeout=0.5)]).run(Deadline(30))
+    assert 0 < seen["timeout"] <= 0.5
+
+    StepScheduler([Step("a", fn)]).run()
+    assert seen["timeout"] is None
+
+
+def test_deadline_cuts_running_steps_and_skips_pending_ones():
+    release = threading.Event()
+    steps = [
+        Step("slow", lambda ctx: release.wait(5)),
+        Step("after", lambda ctx: "x", deps=("slow",)),
+    ]
+    started = time.monotonic()
+    run = StepScheduler(steps).run(Deadline(0.2))
+    release.set()
+
+    assert time.monotonic() - started < 2
+    records = _by_step(run)
+    assert records["slow"]["status"] == "timeout"
+    assert records["after"] == {"step": "after", "status": "skipped", "reason": "deadline"}
+
+
+def test_step_needing_a_failed_input_is_skipped_down_the_chain():
+    def boom(ctx):
+        raise RuntimeError("boom")
+
+    steps = [
+        Step("a", boom),
+        Step("b", lambda ctx: ctx.results["a"], needs=("a",)),
+        Step("c", lambda ctx: ctx.results["b"], needs=("b",), required=True),
+        Step("d", lambda ctx: "ran", deps=("a",)),
+    ]
+    run = StepScheduler(steps).run()
+
+    records = _by_step(run)
+    assert records["b"]["reason"] == "dependency 'a' failed"
+    assert records["c"]["reason"] == "dependency 'b' failed"
+    assert records["d"]["status"] == "success"
+    assert run.failed == "c"
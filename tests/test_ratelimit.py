@@ -0,0 +1,113 @@
+# tests/test_ratelimit.py
+import pytest
+
+from core.ratelimit import (MIN_CONCURRENCY, START_CONCURRENCY, ApiLimiter, RateLimited,
+                            is_throttle, retry_after)
+
+LIMITS = {
+    "default": {"rpm": 6000, "tpm": 0, "max_concurrency": 8, "latency_target": 30.0},
+    "tokens": {"rpm": 6000, "tpm": 1000, "max_concurrency": 8, "latency_target": 30.0},
+}
+
+
+class Throttled(Exception):
+    status_code = 429
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    return ApiLimiter(path=tmp_path / "ratelimit.db", limits=LIMITS, enabled=True)
+
+
+def test_acquire_waits_for_a_free_slot(limiter):
+    slots = [limiter.acquire("api") for _ in range(int(START_CONCURRENCY))]
+    assert limiter.stats()["api"]["inflight"] == START_CONCURRENCY
+    with pytest.raises(RateLimited):
+        limiter.acquire("api", timeout=0.3)
+
+    limiter.release(slots.pop(), latency=0.1)
+    slots.append(limiter.acquire("api", timeout=0.3))
+    for slot in slots:
+        limiter.release(slot, latency=0.1)
+    assert limiter.stats()["api"]["inflight"] == 0
+
+
+def test_success_grows_concurrency_additively(limiter):
+    for _ in range(4):
+        limiter.release(limiter.acquire("api"), latency=0.1)
+    stats = limiter.stats()["api"]
+    assert START_CONCURRENCY < stats["concurrency"] < START_CONCURRENCY + 1
+    assert stats["calls"] == 4
+
+
+def test_concurrency_never_exceeds_the_provider_maximum(limiter):
+    for _ in range(200):
+        limiter.release(limiter.acquire("api"), latency=0.1)
+    assert limiter.stats()["api"]["concurrency"] == LIMITS["default"]["max_concurrency"]
+
+
+def test_slow_call_shrinks_concurrency(limiter):
+    limiter.release(limiter.acquire("api"), latency=60.0)
+    assert limiter.stats()["api"]["concurrency"] == pytest.approx(START_CONCURRENCY * 0.9)
+
+
+def test_throttle_halves_concurrency_and_pauses(limiter):
+    limiter.release(limiter.acquire("api"), latency=0.1, error=Throttled("slow down, retry after 5s"))
+    stats = limiter.stats()["api"]
+    assert stats["concurrency"] == START_CONCURRENCY / 2
+    assert stats["throttles"] == 1
+    assert 4 <= stats["paused_s"] <= 5
+    with pytest.raises(RateLimited):
+        limiter.acquire("api", timeout=0.3)
+
+
+def test_repeated_throttles_stop_at_the_minimum(limiter):
+    for _ in range(5):
+        limiter.release(limiter.acquire("api"), latency=0.1, error=Throttled("retry after 1ms"))
+    assert limiter.stats()["api"]["concurrency"] == MIN_CONCURRENCY
+
+
+def test_call_retries_a_throttled_request(limiter):
+    attempts = []
+
+    def fn(slot):
+        attempts.append(slot)
+        if len(attempts) == 1:
+            raise Throttled("429 Too Many Requests, retry after 10ms")
+        return "ok"
+
+    assert limiter.call("api", fn) == "ok"
+    assert len(attempts) == 2
+    stats = limiter.stats()["api"]
+    assert stats["calls"] == 2 and stats["throttles"] == 1 and stats["inflight"] == 0
+
+
+def test_call_does_not_retry_other_errors(limiter):
+    def fn(slot):
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        limiter.call("api", fn)
+    assert limiter.stats()["api"]["calls"] == 1
+
+
+def test_token_estimate_is_settled_on_release(limiter):
+    slot = limiter.acquire("tokens", tokens=600)
+    slot.tokens = 100
+    limiter.release(slot, latency=0.1)
+    assert limiter.stats()["tokens"]["tokens_left"] >= 900
+
+
+def test_disabled_limiter_admits_everything(tmp_path):
+    limiter = ApiLimiter(path=tmp_path / "ratelimit.db", limits=LIMITS, enabled=False)
+    slots = [limiter.acquire("api") for _ in range(50)]
+    assert all(slot.lease is None for slot in slots)
+    assert limiter.stats() == {}
+
+
+def test_throttle_detection_and_retry_after():
+    assert is_throttle(Throttled("x"))
+    assert is_throttle(RuntimeError("Rate limit reached for requests"))
+    assert not is_throttle(RuntimeError("connection reset"))
+    assert retry_after(RuntimeError("Please try again in 250ms")) == 0.25
+    assert retry_after(RuntimeError("retry after 3s")) == 3.0
@@ -0,0 +1,73 @@
+# tests/test_records.py
+import pytest
+
+from core import records
+from core.lazy import optional_import
+from core.records import ExplainRecord, dumps, loads, pack_record, unpack_record
+
+RESULT = {
+    "concept": "Photosynthesis", "language": "हिन्दी", "timestamp": "2026-01-01T10:00:00",
+    "profile": {"role": "Student", "age_group": "13-17", "interests": ["music"]},
+    "explanation": "Plants turn light into sugar.", "atoms": ["light", "chlorophyll"],
+    "analogies": "Like a solar-powered kitchen.",
+    "sources": [{"title": "Wiki", "url": "https://example.org/p"}],
+    "steps": [{"step": "web_search", "status": "success", "duration_ms": 812, "count": 3},
+              {"step": "decomposition", "status": "skipped", "reason": "budget"}],
+    "confidence": 85, "degradations": ["skipped_decomposition"],
+}
+VALUE = {"text": "naïve ✓", "n": 3, "x": 0.5, "none": None, "flag": True,
+         "blob": b"\x00\xffraw", "nested": [[1, "a"], {"k": [b"b"]}]}
+
+
+@pytest.fixture(params=["msgpack", "ormsgpack", "json"])
+def codec(request, monkeypatch):
+    """Force records to use one codec, as if only it were installed."""
+    if request.param != "json":
+        pytest.importorskip(request.param)
+    monkeypatch.setattr(records, "optional_import",
+                        lambda name: optional_import(name) if name == request.param else None)
+    return request.param
+
+
+def test_value_round_trip(codec):
+    data = dumps(VALUE)
+    assert data[:1] == (b"J" if codec == "json" else b"M")
+    assert loads(data) == VALUE
+
+
+def test_record_round_trip(codec):
+    record = ExplainRecord.from_result(RESULT)
+    restored = unpack_record(pack_record(record))
+    assert restored == record
+    assert restored.to_dict()["steps"] == RESULT["steps"]
+    assert restored.markdown() == record.markdown()
+
+
+def test_packed_list_is_accepted_as_is():
+    record = ExplainRecord.from_result(RESULT)
+    assert unpack_record(record.pack()) == record
+
+
+def test_json_data_stays_readable_with_msgpack_installed(monkeypatch):
+    monkeypatch.setattr(records, "optional_import", lambda name: None)
+    data = dumps(VALUE)
+    monkeypatch.undo()
+    assert loads(data) == VALUE
+
+
+def test_msgpack_data_without_a_codec_is_an_error(monkeypatch):
+    if records._msgpack() is None:
+        pytest.skip("no msgpack implementation installed")
+    data = dumps(VALUE)
+    monkeypatch.setattr(records, "optional_import", lambda name: None)
+    with pytest.raises(RuntimeError):
+        loads(data)
+
+
+def test_unknown_tag_and_version_are_rejected():
+    with pytest.raises(ValueError):
+        loads(b"X{}")
+    packed = ExplainRecord.from_result(RESULT).pack()
+    packed[0] = 99
+    with pytest.raises(ValueError):
+        unpack_record(packed)